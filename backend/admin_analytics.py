@@ -0,0 +1,178 @@
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Hashable, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+from supabase import Client
+from async_utils import bounded_gather
+
+# Maximum number of per-tenant queries in flight at once
+FANOUT_CONCURRENCY = int(os.getenv("ADMIN_ANALYTICS_CONCURRENCY", "8"))
+
+# Seconds an admin analytics result is reused before it is recomputed
+CACHE_TTL_SECONDS = float(os.getenv("ADMIN_ANALYTICS_CACHE_TTL", "60"))
+
+# Cached results kept at most; the least recently written are dropped first
+CACHE_MAX_ENTRIES = int(os.getenv("ADMIN_ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+
+class ResultCache:
+    """
+    Small TTL cache that also coalesces concurrent requests for the same key
+
+    Entries are kept in write order, and every entry lives for the same TTL,
+    so expired entries are always at the front and are dropped on each write;
+    beyond max_entries the oldest are dropped as well.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it at most once per TTL window"""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        # Another request is already computing this key - wait for its result
+        pending = self._in_flight.get(key)
+        if pending:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The request computing it was cancelled, not this one - compute it here instead
+                if not pending.cancelled():
+                    raise
+                return await self.get_or_compute(key, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting on it
+            future.exception()
+            raise
+        finally:
+            # Cancelled (client disconnect, shutdown): release the requests waiting on it
+            if not future.done():
+                future.cancel()
+            del self._in_flight[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_key]
+
+    def clear(self) -> None:
+        """Drop all cached results"""
+        self._entries.clear()
+
+# Shared across requests so repeated dashboard refreshes hit the cache
+admin_analytics_cache = ResultCache(CACHE_TTL_SECONDS)
+
+class AdminAnalyticsService:
+    """Platform-wide (cross-tenant) analytics computed with set-based SQL functions"""
+
+    def __init__(self, supabase_client: Client, cache: ResultCache = admin_analytics_cache):
+        self.supabase = supabase_client
+        self.cache = cache
+
+    @staticmethod
+    def _since(hours: int) -> str:
+        """Start of the reporting window, truncated to the minute so cache keys are stable"""
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return since.replace(second=0, microsecond=0).isoformat()
+
+    async def _rpc(self, function_name: str, params: Dict[str, Any]) -> Any:
+        """Call a SQL function off the event loop, caching the result"""
+        key = (function_name, tuple(sorted(params.items())))
+
+        async def compute() -> Any:
+            response = await asyncio.to_thread(
+                lambda: self.supabase.rpc(function_name, params).execute()
+            )
+            return response.data
+
+        return await self.cache.get_or_compute(key, compute)
+
+    async def get_submissions_per_hour(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Submissions across all users, bucketed by hour"""
+        return await self._rpc('admin_submissions_per_hour', {"p_since": self._since(hours)}) or []
+
+    async def get_top_tenants(self, hours: int = 24, limit: int = 10) -> List[Dict[str, Any]]:
+        """Users with the most submissions in the window"""
+        return await self._rpc('admin_top_tenants', {"p_since": self._since(hours), "p_limit": limit}) or []
+
+    async def get_notification_failure_rate(self, hours: int = 24) -> Dict[str, Any]:
+        """Share of notifications that failed, overall and per notification type"""
+        return await self._rpc('admin_notification_failure_rate', {"p_since": self._since(hours)}) or {}
+
+    async def get_overview(self, hours: int = 24, limit: int = 10) -> Dict[str, Any]:
+        """Submissions per hour, top tenants and notification failure rate"""
+        try:
+            submissions_per_hour, top_tenants, notification_failures = await asyncio.gather(
+                self.get_submissions_per_hour(hours),
+                self.get_top_tenants(hours, limit),
+                self.get_notification_failure_rate(hours)
+            )
+
+            return {
+                "success": True,
+                "overview": {
+                    "windowHours": hours,
+                    "totalSubmissions": sum(row.get('submissions', 0) for row in submissions_per_hour),
+                    "submissionsPerHour": submissions_per_hour,
+                    "topTenants": top_tenants,
+                    "notificationFailures": notification_failures
+                }
+            }
+
+        except Exception as e:
+            print(f"Error getting admin analytics overview: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def get_tenant_breakdown(self, hours: int = 24, limit: int = 10) -> Dict[str, Any]:
+        """
+        Top tenants with their rating/category distribution.
+
+        The distribution is inherently per tenant, so it is fanned out with
+        bounded concurrency instead of being queried one tenant at a time.
+        """
+        try:
+            top_tenants = await self.get_top_tenants(hours, limit)
+            since = self._since(hours)
+
+            async def distribution_for(tenant: Dict[str, Any]) -> Any:
+                return await self._rpc('testimonial_distribution', {
+                    "p_user_id": tenant['user_id'],
+                    "p_start": since,
+                    "p_end": None
+                })
+
+            distributions = await bounded_gather(top_tenants, distribution_for, FANOUT_CONCURRENCY)
+
+            tenants = []
+            for tenant, distribution in zip(top_tenants, distributions):
+                if isinstance(distribution, Exception):
+                    print(f"Error getting distribution for tenant {tenant.get('user_id')}: {str(distribution)}")
+                    distribution = None
+                tenants.append({**tenant, "distribution": distribution})
+
+            return {"success": True, "windowHours": hours, "tenants": tenants}
+
+        except Exception as e:
+            print(f"Error getting admin tenant breakdown: {str(e)}")
+            return {"success": False, "error": str(e)}
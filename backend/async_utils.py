@@ -0,0 +1,17 @@
+from typing import Any, Awaitable, Callable, List
+import asyncio
+
+async def bounded_gather(items: List[Any], worker: Callable[[Any], Awaitable[Any]], concurrency: int) -> List[Any]:
+    """
+    Run worker over items concurrently with at most `concurrency` in flight.
+
+    Results are returned in input order; a failing item yields its exception
+    instead of cancelling the rest of the fan-out.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item: Any) -> Any:
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
@@ -0,0 +1,258 @@
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime
+import os
+import time
+import uuid
+from supabase import Client
+from rule_compiler import CompiledRule, compile_condition, compile_conditions
+from rule_index import RuleIndex, dispatch_stats
+from safe_regex import RegexTimeout
+from error_handler import ErrorCodes, error_monitor
+
+# Seconds a user's enabled rules are reused before being reloaded from the database
+RULE_CACHE_TTL_SECONDS = float(os.getenv("AUTOMATION_RULE_CACHE_TTL", "60"))
+
+# Maximum number of samples a rule can be tested against in one request
+MAX_RULE_TEST_SAMPLES = int(os.getenv("AUTOMATION_RULE_TEST_MAX_SAMPLES", "5000"))
+
+def evaluate_rule_conditions(conditions: list, testimonial_data: dict) -> bool:
+    """
+    Evaluate rule conditions against testimonial data
+
+    Args:
+        conditions: List of rule conditions
+        testimonial_data: Testimonial data to evaluate against
+
+    Returns:
+        True if all conditions are met, False otherwise
+    """
+    return compile_conditions(conditions)(testimonial_data)
+
+def evaluate_single_condition(condition: dict, testimonial_data: dict) -> bool:
+    """
+    Evaluate a single condition against testimonial data
+
+    Args:
+        condition: Single rule condition
+        testimonial_data: Testimonial data to evaluate against
+
+    Returns:
+        True if condition is met, False otherwise
+    """
+    return compile_condition(condition)(testimonial_data)
+
+def apply_rule_actions(actions: list, updates: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Fold a matched rule's actions into the pending testimonial updates
+
+    Rules are applied in priority order, so the first rule to decide
+    approval or category wins; flags accumulate across rules.
+
+    Args:
+        actions: List of rule actions
+        updates: Column updates collected so far (modified in place)
+
+    Returns:
+        The actions that changed the testimonial
+    """
+    executed = []
+
+    for action in actions or []:
+        action_type = action.get('type')
+        value = action.get('value') or ''
+
+        if action_type in ('approve', 'reject'):
+            if 'approved' in updates:
+                continue
+            updates['approved'] = action_type == 'approve'
+        elif action_type == 'categorize':
+            if not value or 'category' in updates:
+                continue
+            updates['category'] = value
+        elif action_type == 'flag':
+            flags = updates.setdefault('flags', [])
+            flag = value or 'flagged'
+            if flag in flags:
+                continue
+            flags.append(flag)
+        elif action_type != 'notify':
+            # Unknown action types are ignored; notify is covered by the regular new testimonial notification
+            continue
+
+        executed.append(action)
+
+    return executed
+
+def test_rule_on_samples(compiled: CompiledRule, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Evaluate one compiled rule against many sample testimonials
+
+    A regex timeout on one sample is reported on that sample and does not
+    stop the rest of the batch.
+
+    Args:
+        compiled: Compiled rule (saved or draft)
+        samples: Sample testimonial data
+
+    Returns:
+        Match counts, the updates a match would apply, and per-sample results
+    """
+    results = []
+    matched = 0
+    errors = 0
+    started = time.perf_counter()
+
+    for index, sample in enumerate(samples):
+        result = {"index": index, "testimonial_id": sample.get('id'), "matched": False, "error": None}
+        try:
+            result["matched"] = compiled.matches(sample)
+        except Exception as e:
+            result["error"] = str(e)
+
+        if result["matched"]:
+            matched += 1
+        if result["error"]:
+            errors += 1
+        results.append(result)
+
+    updates: Dict[str, Any] = {}
+    actions_to_execute = apply_rule_actions(compiled.rule.get('actions'), updates)
+
+    return {
+        "total": len(samples),
+        "matched": matched,
+        "not_matched": len(samples) - matched - errors,
+        "errors": errors,
+        "execution_time_ms": round((time.perf_counter() - started) * 1000, 2),
+        "actions_to_execute": actions_to_execute,
+        "updates": updates,
+        "results": results
+    }
+
+class RuleCache:
+    """Per-user cache of enabled automation rules (ordered by priority) and their index"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, RuleIndex]] = {}
+
+    def get(self, user_id: str) -> Optional[RuleIndex]:
+        """Return the cached rule index for a user, or None if missing or expired"""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def set(self, user_id: str, rules: List[Dict[str, Any]]) -> RuleIndex:
+        """Index and cache the rules for a user"""
+        rule_index = RuleIndex(rules)
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, rule_index)
+        return rule_index
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop the cached rules for one user, or for everyone if user_id is None"""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+# Shared across requests; rule endpoints invalidate it on every change
+rule_cache = RuleCache(RULE_CACHE_TTL_SECONDS)
+
+class AutomationEngine:
+    """Applies a user's automation rules to newly submitted testimonials"""
+
+    def __init__(self, supabase_client: Client, cache: RuleCache = rule_cache):
+        self.supabase = supabase_client
+        self.cache = cache
+
+    def get_rule_index(self, user_id: str) -> RuleIndex:
+        """Get the user's enabled rules (highest priority first), indexed for dispatch"""
+        rule_index = self.cache.get(user_id)
+        if rule_index is None:
+            response = self.supabase.table('automation_rules').select('*').eq('user_id', user_id).eq('enabled', True).order('priority', desc=True).execute()
+            rule_index = self.cache.set(user_id, response.data or [])
+        return rule_index
+
+    def get_enabled_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get the user's enabled rules, highest priority first"""
+        return self.get_rule_index(user_id).rules
+
+    def process_testimonial(self, user_id: str, testimonial_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Evaluate the user's rules against a testimonial
+
+        Args:
+            user_id: The UUID of the testimonial owner
+            testimonial_data: Testimonial row about to be inserted
+
+        Returns:
+            Column updates to merge into the testimonial and automation_logs rows to write
+        """
+        updates: Dict[str, Any] = {}
+        logs: List[Dict[str, Any]] = []
+
+        # Only rules whose indexed equality condition holds (plus non-indexable ones) are evaluated
+        rule_index = self.get_rule_index(user_id)
+        candidates = rule_index.candidates(testimonial_data)
+        match_data = rule_index.with_keyword_hits(testimonial_data)
+
+        for compiled in candidates:
+            rule = compiled.rule
+            started = time.perf_counter()
+            error_message = None
+            try:
+                conditions_met = compiled.matches(match_data)
+                executed_actions = apply_rule_actions(rule.get('actions'), updates) if conditions_met else []
+            except RegexTimeout as e:
+                conditions_met = False
+                executed_actions = []
+                error_message = str(e)
+                error_monitor.record_error(ErrorCodes.REGEX_TIMEOUT, {
+                    "user_id": user_id,
+                    "rule_id": rule.get('id'),
+                    "pattern": e.pattern,
+                    "elapsed_ms": e.elapsed_ms
+                })
+            except Exception as e:
+                conditions_met = False
+                executed_actions = []
+                error_message = str(e)
+            execution_time_ms = round((time.perf_counter() - started) * 1000)
+
+            # Only matched (or failed) rules are logged; automation stats count log rows as executions
+            if not conditions_met and not error_message:
+                continue
+
+            logs.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "rule_id": rule.get('id'),
+                "testimonial_id": testimonial_data.get('id'),
+                "rule_name": rule.get('name', ''),
+                "rule_type": rule.get('type', ''),
+                "conditions_evaluated": rule.get('conditions') or [],
+                "conditions_met": conditions_met,
+                "actions_executed": executed_actions,
+                "execution_time_ms": execution_time_ms,
+                "error_message": error_message,
+                "created_at": datetime.utcnow().isoformat()
+            })
+
+        dispatch_stats.record(
+            user_id,
+            total=len(rule_index.rules),
+            evaluated=len(candidates),
+            matched=sum(1 for log in logs if log['conditions_met'])
+        )
+
+        return {"updates": updates, "logs": logs}
+
+    def write_logs(self, logs: List[Dict[str, Any]]) -> None:
+        """Insert automation log rows in a single batch"""
+        if not logs:
+            return
+        try:
+            self.supabase.table('automation_logs').insert(logs).execute()
+        except Exception as e:
+            print(f"Error writing automation logs: {str(e)}")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Remove stored media that no testimonial references
+
+Runs a dry run by default and lists what would be removed; pass --delete
+to remove the orphans. Objects younger than MEDIA_GC_MIN_AGE seconds
+(default one day) are always kept.
+
+    python collect_orphan_media.py
+    python collect_orphan_media.py --delete
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+from media_gc import OrphanMediaCollector
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_collection():
+    """Find and optionally remove orphaned media"""
+    dry_run = '--delete' not in sys.argv[1:]
+    print(f"🚀 Collecting orphaned media{' (dry run)' if dry_run else ''}...")
+
+    result = OrphanMediaCollector(create_supabase_client()).collect(dry_run=dry_run)
+    if not result['success']:
+        print(f"❌ Collection failed: {result['error']}")
+        sys.exit(1)
+
+    gc = result['gc']
+    for path in gc['sample']:
+        print(f"  🗑️  {path}")
+    if gc['orphans'] > len(gc['sample']):
+        print(f"  ... and {gc['orphans'] - len(gc['sample'])} more")
+
+    print("\n📋 Summary:")
+    print(f"  ✅ Referenced objects: {gc['referenced']}")
+    print(f"  ✅ Objects scanned: {gc['scanned']}")
+    print(f"  ✅ Orphans: {gc['orphans']} ({gc['orphanBytes'] / 1048576:.1f} MB)")
+    if dry_run:
+        print("\nℹ️  Dry run: nothing was removed. Run with --delete to remove the orphans")
+    else:
+        print(f"  ✅ Removed: {gc['removed']}")
+
+if __name__ == "__main__":
+    run_collection()
@@ -0,0 +1,173 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import os
+import uuid
+from supabase import Client
+from async_utils import bounded_gather
+
+# Queue emails in the email_outbox table instead of sending them in the caller
+EMAIL_OUTBOX_ENABLED = os.getenv("EMAIL_OUTBOX_ENABLED", "true").lower() == "true"
+
+# Emails claimed per poll, and sent at once per API instance
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+EMAIL_OUTBOX_CONCURRENCY = int(os.getenv("EMAIL_OUTBOX_CONCURRENCY", "4"))
+
+# Seconds between polls when the outbox is empty
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+
+# Attempts per email, with exponential backoff between them (base doubled per attempt, capped)
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_RETRY_BASE_SECONDS", "30"))
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# A claimed email not finished after this many seconds is claimed again (its worker died mid-send)
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", "300"))
+
+def retry_delay(attempts: int) -> int:
+    """Seconds to wait before the next attempt after `attempts` failed ones"""
+    return min(EMAIL_OUTBOX_RETRY_MAX_SECONDS, EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+class EmailOutbox:
+    """
+    Persistent email queue drained by a pool of send workers
+
+    Emails are inserted into email_outbox and sent in the background, so a
+    caller never waits for SMTP and an outage only delays mail. Each poll
+    claims a batch with claim_email_outbox (FOR UPDATE SKIP LOCKED), so
+    several API instances can drain the same table without sending an email
+    twice. Claimed emails are sent with bounded concurrency; failures are
+    retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS, and the
+    final status is recorded on the row (and in notification_logs for
+    notification emails).
+    """
+
+    def __init__(self):
+        self._client_factory: Optional[Callable[[], Client]] = None
+        self._send: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, client_factory: Callable[[], Client], send: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Start polling on the running event loop; send(email) raises when an email cannot be sent"""
+        if not EMAIL_OUTBOX_ENABLED or self._task is not None:
+            return
+        self._client_factory = client_factory
+        self._send = send
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        """Stop polling; emails claimed but not finished are claimed again after the lease"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def wake(self) -> None:
+        """Poll now instead of waiting for the interval"""
+        self._wake.set()
+
+    def enqueue(self, recipient: str, subject: str, body: str, email_type: str,
+                data: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None) -> str:
+        """
+        Store an email for the workers to send
+
+        Args:
+            user_id: Owner of a notification email; its final status is logged to notification_logs
+
+        Returns:
+            The outbox id, used as the delivery id
+        """
+        email_id = str(uuid.uuid4())
+        self._client_factory().table('email_outbox').insert({
+            "id": email_id,
+            "user_id": user_id,
+            "email_type": email_type,
+            "recipient": recipient,
+            "subject": subject,
+            "body": body,
+            "data": data or {},
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow().isoformat(),
+            "created_at": datetime.utcnow().isoformat()
+        }).execute()
+        return email_id
+
+    def _claim(self, supabase: Client) -> List[Dict[str, Any]]:
+        return supabase.rpc('claim_email_outbox', {
+            'p_limit': EMAIL_OUTBOX_BATCH_SIZE,
+            'p_lease_seconds': EMAIL_OUTBOX_LEASE_SECONDS
+        }).execute().data or []
+
+    def _finish(self, supabase: Client, email: Dict[str, Any], error: Optional[str]) -> str:
+        """Record the outcome of one attempt; returns the email's new status"""
+        now = datetime.utcnow()
+        if error is None:
+            update = {"status": "sent", "sent_at": now.isoformat(), "last_error": None}
+        elif email['attempts'] >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "failed", "last_error": error}
+        else:
+            update = {
+                "status": "pending",
+                "last_error": error,
+                "next_attempt_at": (now + timedelta(seconds=retry_delay(email['attempts']))).isoformat()
+            }
+        supabase.table('email_outbox').update(update).eq('id', email['id']).eq('status', 'sending').execute()
+
+        if update['status'] != 'pending' and email.get('user_id'):
+            supabase.table('notification_logs').insert({
+                "id": str(uuid.uuid4()),
+                "user_id": email['user_id'],
+                "notification_type": email['email_type'],
+                "status": update['status'],
+                "data": email.get('data') or {},
+                "created_at": now.isoformat()
+            }).execute()
+        return update['status']
+
+    async def _deliver(self, supabase: Client, email: Dict[str, Any]) -> str:
+        try:
+            await self._send(email)
+            error = None
+        except Exception as e:
+            error = str(e)
+            print(f"Email {email['id']} to {email['recipient']} failed (attempt {email['attempts']}): {error}")
+        return await asyncio.to_thread(self._finish, supabase, email, error)
+
+    async def drain_once(self) -> int:
+        """Claim one batch and send it; returns the number of emails claimed"""
+        supabase = self._client_factory()
+        emails = await asyncio.to_thread(self._claim, supabase)
+        if emails:
+            results = await bounded_gather(emails, lambda email: self._deliver(supabase, email), EMAIL_OUTBOX_CONCURRENCY)
+            for email, result in zip(emails, results):
+                if isinstance(result, Exception):
+                    print(f"Error recording email {email['id']}: {str(result)}")
+        return len(emails)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            # Cleared before claiming, so an email queued during this batch triggers the next poll
+            self._wake.clear()
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                print(f"Email outbox error: {str(e)}")
+                claimed = 0
+            # A full batch means more may be waiting
+            if claimed >= EMAIL_OUTBOX_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), EMAIL_OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+# Global email outbox
+email_outbox = EmailOutbox()
@@ -1,10 +1,12 @@
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr
 from typing import List, Optional, Dict, Any
+import asyncio
 import os
 from datetime import datetime
 import uuid
 import logging
+from email_outbox import email_outbox
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,7 +34,8 @@ class EmailService:
     async def send_new_testimonial_notification(
         self, 
         user_email: str, 
-        testimonial_data: Dict[str, Any]
+        testimonial_data: Dict[str, Any],
+        user_id: Optional[str] = None
     ):
         """Send notification when a new testimonial is submitted"""
         subject = "New Testimonial Received - TestimonialFlow"
@@ -46,28 +49,13 @@ class EmailService:
             subtype="html"
         )
         
-        try:
-            await self.fastmail.send_message(message)
-            
-            # Track delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "new_testimonial", "sent", testimonial_data)
-            
-            logger.info(f"New testimonial notification sent to {user_email}")
-            return {"success": True, "message": "Email sent successfully", "delivery_id": delivery_id}
-        except Exception as e:
-            logger.error(f"Failed to send new testimonial email to {user_email}: {str(e)}")
-            
-            # Track failed delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "new_testimonial", "failed", {"error": str(e)})
-            
-            return {"success": False, "error": str(e), "delivery_id": delivery_id}
+        return await self._deliver(message, user_email, "new_testimonial", testimonial_data, "Email sent successfully", user_id)
     
     async def send_weekly_summary(
         self, 
         user_email: str, 
-        summary_data: Dict[str, Any]
+        summary_data: Dict[str, Any],
+        user_id: Optional[str] = None
     ):
         """Send weekly summary email"""
         subject = "Weekly Testimonial Summary - TestimonialFlow"
@@ -81,28 +69,13 @@ class EmailService:
             subtype="html"
         )
         
-        try:
-            await self.fastmail.send_message(message)
-            
-            # Track delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "weekly_summary", "sent", summary_data)
-            
-            logger.info(f"Weekly summary sent to {user_email}")
-            return {"success": True, "message": "Weekly summary sent successfully", "delivery_id": delivery_id}
-        except Exception as e:
-            logger.error(f"Failed to send weekly summary to {user_email}: {str(e)}")
-            
-            # Track failed delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "weekly_summary", "failed", {"error": str(e)})
-            
-            return {"success": False, "error": str(e), "delivery_id": delivery_id}
+        return await self._deliver(message, user_email, "weekly_summary", summary_data, "Weekly summary sent successfully", user_id)
     
     async def send_pending_reminder(
         self, 
         user_email: str, 
-        pending_count: int
+        pending_count: int,
+        user_id: Optional[str] = None
     ):
         """Send reminder for pending testimonials"""
         subject = f"You have {pending_count} pending testimonials - TestimonialFlow"
@@ -116,23 +89,7 @@ class EmailService:
             subtype="html"
         )
         
-        try:
-            await self.fastmail.send_message(message)
-            
-            # Track delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "pending_reminder", "sent", {"pending_count": pending_count})
-            
-            logger.info(f"Pending reminder sent to {user_email}")
-            return {"success": True, "message": "Reminder sent successfully", "delivery_id": delivery_id}
-        except Exception as e:
-            logger.error(f"Failed to send pending reminder to {user_email}: {str(e)}")
-            
-            # Track failed delivery
-            delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "pending_reminder", "failed", {"error": str(e)})
-            
-            return {"success": False, "error": str(e), "delivery_id": delivery_id}
+        return await self._deliver(message, user_email, "pending_reminder", {"pending_count": pending_count}, "Reminder sent successfully", user_id)
     
     async def send_welcome_email(self, user_email: str, user_name: str = None):
         """Send welcome email to new users"""
@@ -147,24 +104,69 @@ class EmailService:
             subtype="html"
         )
         
+        return await self._deliver(message, user_email, "welcome", {"user_name": user_name}, "Welcome email sent successfully")
+    
+    async def _deliver(
+        self,
+        message: MessageSchema,
+        user_email: str,
+        email_type: str,
+        data: Dict[str, Any],
+        success_message: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue an email in the outbox, or send it now when the outbox is not running
+
+        Queued emails are sent by the outbox workers with retries; the result
+        then only says the email was accepted ("queued": True).
+        """
+        if email_outbox.running:
+            try:
+                delivery_id = await asyncio.to_thread(
+                    email_outbox.enqueue, user_email, message.subject, message.body, email_type, data, user_id
+                )
+                email_outbox.wake()
+                self._track_delivery(delivery_id, user_email, email_type, "queued", data)
+                logger.info(f"{email_type} email to {user_email} queued")
+                return {"success": True, "message": "Email queued for delivery", "delivery_id": delivery_id, "queued": True}
+            except Exception as e:
+                logger.error(f"Failed to queue {email_type} email to {user_email}, sending directly: {str(e)}")
+        
         try:
             await self.fastmail.send_message(message)
             
             # Track delivery
             delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "welcome", "sent", {"user_name": user_name})
+            self._track_delivery(delivery_id, user_email, email_type, "sent", data)
             
-            logger.info(f"Welcome email sent to {user_email}")
-            return {"success": True, "message": "Welcome email sent successfully", "delivery_id": delivery_id}
+            logger.info(f"{email_type} email sent to {user_email}")
+            return {"success": True, "message": success_message, "delivery_id": delivery_id}
         except Exception as e:
-            logger.error(f"Failed to send welcome email to {user_email}: {str(e)}")
+            logger.error(f"Failed to send {email_type} email to {user_email}: {str(e)}")
             
             # Track failed delivery
             delivery_id = str(uuid.uuid4())
-            self._track_delivery(delivery_id, user_email, "welcome", "failed", {"error": str(e)})
+            self._track_delivery(delivery_id, user_email, email_type, "failed", {"error": str(e)})
             
             return {"success": False, "error": str(e), "delivery_id": delivery_id}
     
+    async def send_outbox_email(self, email: Dict[str, Any]) -> None:
+        """Send one email claimed from the outbox; raises if it could not be sent"""
+        message = MessageSchema(
+            subject=email['subject'],
+            recipients=[email['recipient']],
+            body=email['body'],
+            subtype="html"
+        )
+        try:
+            await self.fastmail.send_message(message)
+        except Exception as e:
+            self._track_delivery(email['id'], email['recipient'], email['email_type'], "failed", {"error": str(e)})
+            raise
+        self._track_delivery(email['id'], email['recipient'], email['email_type'], "sent", email.get('data') or {})
+        logger.info(f"{email['email_type']} email sent to {email['recipient']}")
+    
     def _track_delivery(self, delivery_id: str, email: str, email_type: str, status: str, data: Dict[str, Any]):
         """Track email delivery status"""
         self.delivery_logs[delivery_id] = {
@@ -2,6 +2,7 @@ from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
 from typing import Dict, Any, Optional
 import logging
+import math
 import traceback
 from datetime import datetime
 
@@ -53,6 +54,7 @@ class ErrorCodes:
     VALIDATION_ERROR = "VALIDATION_ERROR"
     INVALID_INPUT = "INVALID_INPUT"
     MISSING_REQUIRED_FIELD = "MISSING_REQUIRED_FIELD"
+    PAYLOAD_TOO_LARGE = "PAYLOAD_TOO_LARGE"
     
     # Resource errors
     NOT_FOUND = "NOT_FOUND"
@@ -74,6 +76,9 @@ class ErrorCodes:
     RATE_LIMIT_EXCEEDED = "RATE_LIMIT_EXCEEDED"
     TOO_MANY_REQUESTS = "TOO_MANY_REQUESTS"
     
+    # Automation errors
+    REGEX_TIMEOUT = "REGEX_TIMEOUT"
+    
     # Server errors
     INTERNAL_SERVER_ERROR = "INTERNAL_SERVER_ERROR"
     SERVICE_UNAVAILABLE = "SERVICE_UNAVAILABLE"
@@ -91,6 +96,7 @@ class ErrorMessages:
         ErrorCodes.VALIDATION_ERROR: "The provided data is invalid. Please check your input.",
         ErrorCodes.INVALID_INPUT: "Invalid input provided. Please check your data.",
         ErrorCodes.MISSING_REQUIRED_FIELD: "Required field is missing. Please provide all required information.",
+        ErrorCodes.PAYLOAD_TOO_LARGE: "The upload is too large. Videos can be up to 50MB and photos up to 5MB.",
         ErrorCodes.NOT_FOUND: "The requested resource was not found.",
         ErrorCodes.RESOURCE_NOT_FOUND: "The requested resource does not exist.",
         ErrorCodes.USER_NOT_FOUND: "User not found. Please check the user ID.",
@@ -103,6 +109,7 @@ class ErrorMessages:
         ErrorCodes.INVALID_EMAIL: "Invalid email address provided.",
         ErrorCodes.RATE_LIMIT_EXCEEDED: "Too many requests. Please wait a moment and try again.",
         ErrorCodes.TOO_MANY_REQUESTS: "Rate limit exceeded. Please slow down your requests.",
+        ErrorCodes.REGEX_TIMEOUT: "A regex condition took too long to evaluate. Please simplify the pattern.",
         ErrorCodes.INTERNAL_SERVER_ERROR: "An unexpected error occurred. Please try again later.",
         ErrorCodes.SERVICE_UNAVAILABLE: "Service temporarily unavailable. Please try again later.",
         ErrorCodes.CONFIGURATION_ERROR: "Service configuration error. Please contact support."
@@ -121,14 +128,15 @@ class CustomHTTPException(HTTPException):
         error_code: str,
         message: Optional[str] = None,
         details: Optional[Dict[str, Any]] = None,
-        status_code: int = 500
+        status_code: int = 500,
+        headers: Optional[Dict[str, str]] = None
     ):
         self.error_code = error_code
         self.message = message or ErrorMessages.get_message(error_code)
         self.details = details or {}
         self.status_code = status_code
         
-        super().__init__(status_code=status_code, detail=self.message)
+        super().__init__(status_code=status_code, detail=self.message, headers=headers)
 
 def create_error_response(
     error_code: str,
@@ -245,11 +253,12 @@ def handle_forbidden_error() -> ErrorResponse:
         status_code=403
     )
 
-def handle_rate_limit_error() -> ErrorResponse:
+def handle_rate_limit_error(retry_after: Optional[float] = None) -> ErrorResponse:
     """Handle rate limit errors"""
     return create_error_response(
         error_code=ErrorCodes.RATE_LIMIT_EXCEEDED,
         message="Too many requests. Please wait a moment and try again.",
+        details={"retry_after": max(1, math.ceil(retry_after))} if retry_after is not None else None,
         status_code=429
     )
 
@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Any
+import hashlib
+import os
+import re
+from supabase import Client
+
+# Bits in a SimHash fingerprint and the number of equal-width bands it is split into
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+# Characters per shingle; character shingles keep small typos from changing many features
+SHINGLE_SIZE = 4
+
+# Maximum Hamming distance between fingerprints for two texts to count as near-duplicates.
+# Band lookups find every pair within SIMHASH_BANDS - 1 bits (pigeonhole), so values
+# above 7 only catch pairs that happen to share a band.
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "6"))
+
+# Normalized texts shorter than this are fingerprinted but never treated as duplicates
+# ("Great service!" from two customers is not spam)
+DUPLICATE_MIN_LENGTH = int(os.getenv("DUPLICATE_MIN_LENGTH", "30"))
+
+# What happens to a near-duplicate submission: "flag" or "reject"
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "flag")
+
+DUPLICATE_FLAG = 'duplicate'
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(_NON_WORD.sub(' ', (text or '').lower()).split())
+
+def _shingles(normalized: str) -> List[str]:
+    if len(normalized) <= SHINGLE_SIZE:
+        return [normalized] if normalized else []
+    return [normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)]
+
+def simhash(normalized: str) -> int:
+    """
+    64-bit SimHash of normalized text (unsigned)
+
+    Each shingle is hashed; a fingerprint bit is set when most shingle
+    hashes have it set, so similar texts differ in only a few bits.
+    """
+    shingles = _shingles(normalized)
+    if not shingles:
+        return 0
+
+    bit_strings = [
+        format(int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=SIMHASH_BITS // 8).digest(), 'big'), f'0{SIMHASH_BITS}b')
+        for shingle in shingles
+    ]
+    majority = len(bit_strings) / 2
+    # zip(*...) yields one column of bits per position, most significant first
+    bits = ''.join('1' if column.count('1') > majority else '0' for column in zip(*bit_strings))
+    return int(bits, 2)
+
+def simhash_bands(value: int) -> List[int]:
+    """
+    Split an unsigned fingerprint into band keys for the GIN-indexed array column
+
+    Each key encodes the band position and its bits, so two fingerprints
+    share a key exactly when the same band is identical in both.
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [
+        (i << BAND_BITS) | ((value >> (BAND_BITS * (SIMHASH_BANDS - 1 - i))) & mask)
+        for i in range(SIMHASH_BANDS)
+    ]
+
+def to_signed(value: int) -> int:
+    """Store an unsigned 64-bit fingerprint in a BIGINT column"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def fingerprint_columns(text: str) -> Dict[str, Any]:
+    """Testimonial columns holding the fingerprint of a text and its band keys"""
+    value = simhash(normalize_text(text))
+    return {"simhash": to_signed(value), "simhash_bands": simhash_bands(value)}
+
+def apply_duplicate_action(updates: Dict[str, Any], duplicate: Dict[str, Any]) -> None:
+    """Mark a testimonial as a near-duplicate (modifies updates in place)"""
+    updates['duplicate_of'] = duplicate['id']
+    flags = updates.setdefault('flags', [])
+    if DUPLICATE_FLAG not in flags:
+        flags.append(DUPLICATE_FLAG)
+    if DUPLICATE_ACTION == 'reject':
+        updates['approved'] = False
+
+class FingerprintService:
+    """Near-duplicate detection for testimonial text using banded SimHash fingerprints"""
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+
+    def find_near_duplicate(self, user_id: str, columns: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Find the closest earlier testimonial of the user within DUPLICATE_MAX_DISTANCE
+
+        Only rows sharing at least one band key are compared (a GIN index
+        lookup), so the cost does not grow with the number of testimonials.
+
+        Returns:
+            {"id", "distance"} of the closest near-duplicate, or None
+        """
+        response = self.supabase.rpc('find_near_duplicate_testimonial', {
+            'p_user_id': user_id,
+            'p_simhash': columns['simhash'],
+            'p_bands': columns['simhash_bands'],
+            'p_max_distance': DUPLICATE_MAX_DISTANCE
+        }).execute()
+
+        if not response.data:
+            return None
+        match = response.data[0]
+        return {"id": match['id'], "distance": match['distance']}
+
+    def check(self, user_id: str, text: str) -> Dict[str, Any]:
+        """
+        Fingerprint a submission and look up near-duplicates from the same user
+
+        Returns:
+            Fingerprint columns to store with the testimonial, and the
+            near-duplicate found ({"id", "distance"}) or None
+        """
+        columns = fingerprint_columns(text)
+        duplicate = None
+        if len(normalize_text(text)) >= DUPLICATE_MIN_LENGTH:
+            duplicate = self.find_near_duplicate(user_id, columns)
+        return {"columns": columns, "duplicate": duplicate}
+
+    def backfill(self, page_size: int = 500) -> int:
+        """
+        Fingerprint existing testimonials that have none yet
+
+        Each page is fingerprinted in memory and written with one
+        set_testimonial_fingerprints call. Returns rows updated.
+        """
+        updated = 0
+        last_id = None
+        while True:
+            query = self.supabase.table('testimonials').select('id, text').is_('simhash', 'null')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(page_size).execute().data or []
+            if not page:
+                break
+            last_id = page[-1]['id']
+
+            rows = [
+                {"id": testimonial['id'], **fingerprint_columns(testimonial.get('text') or '')}
+                for testimonial in page
+            ]
+            response = self.supabase.rpc('set_testimonial_fingerprints', {'p_rows': rows}).execute()
+            updated += response.data or 0
+
+            if len(page) < page_size:
+                break
+        return updated
@@ -0,0 +1,114 @@
+from typing import Dict, List, Optional, Any, Iterable, Set
+from collections import deque
+import os
+
+# Optional C implementation (pip install pyahocorasick)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Key under which precomputed keyword hits are passed to compiled predicates
+KEYWORD_HITS_KEY = '__keyword_hits__'
+
+# Fewest distinct keywords on a field before an automaton beats one substring scan per
+# keyword; the pure-Python automaton only pays off for large keyword sets
+MIN_AUTOMATON_KEYWORDS = int(os.getenv(
+    "AUTOMATION_KEYWORD_AUTOMATON_MIN",
+    "8" if ahocorasick is not None else "100"
+))
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of keywords
+
+    One linear pass over a text finds every keyword it contains, however
+    many keywords there are. Uses pyahocorasick when installed, otherwise
+    a pure-Python automaton.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Set[str] = {keyword for keyword in keywords if keyword}
+        self._native = None
+
+        if ahocorasick is not None:
+            self._native = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._native.add_word(keyword, keyword)
+            if self.keywords:
+                self._native.make_automaton()
+            return
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+
+        for keyword in self.keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword: str) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(keyword)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # A state also emits every keyword that ends at its failure state
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[str]:
+        """Return the set of keywords that occur in text"""
+        found: Set[str] = set()
+        if not self.keywords:
+            return found
+
+        if self._native is not None:
+            return {keyword for _, keyword in self._native.iter(text)}
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+class KeywordHits:
+    """Lazily computed keyword hits for one testimonial, per field"""
+
+    def __init__(self, automata: Dict[str, KeywordAutomaton], testimonial_data: Dict[str, Any]):
+        self._automata = automata
+        self._testimonial_data = testimonial_data
+        self._hits: Dict[str, Set[str]] = {}
+
+    def get(self, field: str) -> Optional[Set[str]]:
+        """Keywords found in the field, or None if the field has no automaton"""
+        hits = self._hits.get(field)
+        if hits is None:
+            automaton = self._automata.get(field)
+            if automaton is None:
+                return None
+            hits = automaton.search(str(self._testimonial_data.get(field, '')).lower())
+            self._hits[field] = hits
+        return hits
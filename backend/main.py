@@ -1,12 +1,55 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Header, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from supabase import create_client, Client
 from datetime import datetime, timedelta
+import asyncio
+from contextlib import asynccontextmanager
 import os
 import uuid
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
 from dotenv import load_dotenv
 from notification_service import NotificationService
+from notification_queue import notification_queue
+from email_service import email_service
+from email_outbox import email_outbox
+from admin_analytics import AdminAnalyticsService
+from automation_engine import AutomationEngine, rule_cache, test_rule_on_samples, MAX_RULE_TEST_SAMPLES
+from rule_index import dispatch_stats
+from rule_compiler import CompiledRule, compile_rule, validate_conditions
+from safe_regex import RegexTimeout
+from rule_backfill import RuleBackfillService, BACKFILL_COLUMNS
+from fingerprint import FingerprintService, apply_duplicate_action
+from sentiment import score_sentiment, POSITIVE_THRESHOLD, NEGATIVE_THRESHOLD
+from media_upload import (
+    BodySizeLimitMiddleware,
+    spool_upload,
+    upload_media,
+    release_uploaded,
+    release_media,
+    content_addressed_path,
+    PendingUpload,
+    MediaUploadError,
+    UploadTooLarge,
+    MediaFormatMismatch,
+    expected_media_formats,
+    DirectUploadError,
+    create_direct_upload,
+    verify_direct_upload,
+    MAX_VIDEO_BYTES,
+    MAX_PHOTO_BYTES,
+    MAX_SUBMIT_BODY_BYTES
+)
+from resumable_upload import resumable_uploads, ResumableUploadError
+from media_processing import media_processor
+from media_gc import OrphanMediaCollector
+from rate_limiter import (
+    RateLimitMiddleware,
+    rate_limiter,
+    retry_after_header,
+    SUBMIT_PER_IP_LIMIT,
+    SUBMIT_PER_USER_LIMIT,
+    SIGNED_UPLOAD_PER_IP_LIMIT
+)
 from error_handler import (
     global_exception_handler, 
     CustomHTTPException, 
@@ -23,15 +66,43 @@ from error_handler import (
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the notification workers (and their recovery sweep) and the email outbox for the lifetime of the app"""
+    email_outbox.start(get_supabase_client, email_service.send_outbox_email)
+    notification_queue.start(get_supabase_client)
+    yield
+    await notification_queue.stop()
+    await email_outbox.stop()
+
 app = FastAPI(
     title="TestimonialFlow API",
     description="Backend API for TestimonialFlow - Collect and manage customer testimonials",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add global exception handler
 app.add_exception_handler(Exception, global_exception_handler)
 
+# Refuse oversized submissions from Content-Length, and cut off bodies that stream past the limit
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={"/submit-testimonial": MAX_SUBMIT_BODY_BYTES}
+)
+
+# Shed abusive submission traffic per client IP before the body is read
+# (added before CORS so that rate-limited responses still carry CORS headers)
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    limits={
+        "/submit-testimonial": SUBMIT_PER_IP_LIMIT,
+        "/uploads/signed-url": SIGNED_UPLOAD_PER_IP_LIMIT,
+        "/uploads/resumable": SIGNED_UPLOAD_PER_IP_LIMIT
+    }
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +110,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browsers read the resumable upload offset
+    expose_headers=["Upload-Offset", "Upload-Length", "Location"],
 )
 
 # Environment variables
@@ -48,6 +121,9 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
 
+# Shared secret for platform-wide admin endpoints (admin endpoints are disabled when unset)
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
+
 # Lazy Supabase client initialization
 _supabase_client = None
 
@@ -93,8 +169,188 @@ async def health_check():
             status_code=503
         )
 
+@app.post("/uploads/signed-url")
+async def create_signed_upload_url(
+    user_id: str = Form(...),
+    media_type: str = Form(...),
+    filename: str = Form(...)
+):
+    """
+    Issue a signed URL for uploading a testimonial video or photo straight to storage
+    
+    The client uploads the file to the returned URL, then passes the returned
+    path to /submit-testimonial as video_path or photo_path.
+    
+    Args:
+        user_id: The UUID of the collection link owner
+        media_type: 'video' or 'photo'
+        filename: Original filename (used for its extension)
+    
+    Returns:
+        bucket, path, signed_url, token and expires_in (seconds) for the upload
+    """
+    try:
+        uuid.UUID(user_id)
+    except ValueError:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message="Invalid user ID format. Please use a valid collection link."
+        )
+    
+    try:
+        supabase = get_supabase_client()
+        upload = await asyncio.to_thread(create_direct_upload, supabase, media_type, user_id, filename)
+        return {
+            "success": True,
+            **upload
+        }
+    except DirectUploadError as e:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=str(e)
+        )
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in create_signed_upload_url: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message="Failed to prepare the upload. Please try again."
+        )
+
+def resumable_upload_http_error(error: ResumableUploadError) -> CustomHTTPException:
+    """Map a resumable upload error to the API's error format"""
+    error_codes = {
+        404: ErrorCodes.NOT_FOUND,
+        413: ErrorCodes.PAYLOAD_TOO_LARGE
+    }
+    return CustomHTTPException(
+        error_code=error_codes.get(error.status_code, ErrorCodes.INVALID_INPUT),
+        message=str(error),
+        status_code=error.status_code
+    )
+
+@app.post("/uploads/resumable", status_code=201)
+async def create_resumable_upload(
+    response: Response,
+    user_id: str = Form(...),
+    media_type: str = Form(...),
+    filename: str = Form(...),
+    length: int = Form(...),
+    content_type: Optional[str] = Form(None)
+):
+    """
+    Start a resumable (tus-style) upload of a testimonial video or photo
+    
+    Send the file with PATCH /uploads/resumable/{upload_id} in chunks, each
+    with an Upload-Offset header. After a dropped connection, HEAD returns
+    the offset to resume from. Finalize to move the file to storage and get
+    the path to submit as video_path/photo_path.
+    
+    Args:
+        user_id: The UUID of the collection link owner
+        media_type: 'video' or 'photo'
+        filename: Original filename (used for its extension)
+        length: Total file size in bytes
+        content_type: MIME type (guessed from the filename if omitted)
+    
+    Returns:
+        upload_id, offset and upload URL
+    """
+    try:
+        uuid.UUID(user_id)
+    except ValueError:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message="Invalid user ID format. Please use a valid collection link."
+        )
+    
+    try:
+        session = await asyncio.to_thread(resumable_uploads.create, user_id, media_type, filename, length, content_type)
+    except ResumableUploadError as e:
+        raise resumable_upload_http_error(e)
+    
+    upload_url = f"/uploads/resumable/{session.upload_id}"
+    response.headers["Location"] = upload_url
+    response.headers["Upload-Offset"] = "0"
+    return {
+        "success": True,
+        "upload_id": session.upload_id,
+        "upload_url": upload_url,
+        "offset": 0,
+        "length": session.length,
+        "expires_in": resumable_uploads.ttl_seconds
+    }
+
+@app.head("/uploads/resumable/{upload_id}")
+async def get_resumable_upload_offset(upload_id: str):
+    """Bytes received so far for a resumable upload (Upload-Offset header)"""
+    try:
+        session = await asyncio.to_thread(resumable_uploads.get, upload_id)
+    except ResumableUploadError as e:
+        raise resumable_upload_http_error(e)
+    
+    return Response(status_code=200, headers={
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.length),
+        "Cache-Control": "no-store"
+    })
+
+@app.patch("/uploads/resumable/{upload_id}")
+async def append_resumable_upload(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    """
+    Append the request body to a resumable upload
+    
+    The Upload-Offset header must equal the bytes already received. The body
+    is streamed to disk, so an interrupted request still keeps what arrived.
+    """
+    try:
+        offset = await resumable_uploads.append(upload_id, upload_offset, request.stream())
+    except ResumableUploadError as e:
+        raise resumable_upload_http_error(e)
+    
+    return Response(status_code=204, headers={"Upload-Offset": str(offset)})
+
+@app.post("/uploads/resumable/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, user_id: str = Form(...)):
+    """
+    Send a completed resumable upload to storage
+    
+    Returns:
+        media_type and the storage path to submit as video_path/photo_path
+    """
+    try:
+        supabase = get_supabase_client()
+        session = await resumable_uploads.finalize(supabase, upload_id, user_id)
+        return {
+            "success": True,
+            "media_type": session.media_type,
+            "path": session.path
+        }
+    except ResumableUploadError as e:
+        raise resumable_upload_http_error(e)
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in finalize_resumable_upload: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message="Failed to store the upload. Please finalize again."
+        )
+
+async def verify_submitted_upload(supabase: Client, kind: str, user_id: str, object_path: str) -> str:
+    """Verify a directly uploaded file referenced by a submission and return its public URL"""
+    try:
+        return await asyncio.to_thread(verify_direct_upload, supabase, kind, user_id, object_path)
+    except DirectUploadError as e:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=str(e)
+        )
+
 @app.post("/submit-testimonial")
 async def submit_testimonial(
+    background_tasks: BackgroundTasks,
     user_id: str = Form(...),
     name: str = Form(...),
     text: str = Form(...),
@@ -103,7 +359,9 @@ async def submit_testimonial(
     email: Optional[str] = Form(None),
     allow_sharing: Optional[bool] = Form(True),
     video: Optional[UploadFile] = File(None),
-    photo: Optional[UploadFile] = File(None)
+    photo: Optional[UploadFile] = File(None),
+    video_path: Optional[str] = Form(None),
+    photo_path: Optional[str] = Form(None)
 ):
     """
     Submit a new testimonial
@@ -113,6 +371,8 @@ async def submit_testimonial(
         name: The name of the person giving the testimonial (max 100 chars)
         text: The testimonial text (10-500 chars)
         video: Optional video file upload
+        video_path / photo_path: Storage path of a file already uploaded
+            through /uploads/signed-url (instead of sending the file)
     
     Returns:
         JSON response with success message and testimonial ID
@@ -127,6 +387,16 @@ async def submit_testimonial(
             message="Invalid user ID format. Please use a valid collection link."
         )
     
+    # Limit submissions per collection link across all clients
+    allowed, retry_after = await rate_limiter.check("submit:user", user_id, SUBMIT_PER_USER_LIMIT)
+    if not allowed:
+        error_monitor.record_error(ErrorCodes.RATE_LIMIT_EXCEEDED)
+        raise CustomHTTPException(
+            error_code=ErrorCodes.RATE_LIMIT_EXCEEDED,
+            status_code=429,
+            headers=retry_after_header(retry_after)
+        )
+    
     # Validate and sanitize input
     name = name.strip()
     text = text.strip()
@@ -162,12 +432,16 @@ async def submit_testimonial(
             message="Testimonial is too short. Please write at least 10 characters."
         )
     
+    # Spooled files waiting to be stored, keyed by media kind
+    pending_uploads: Dict[str, PendingUpload] = {}
+    # Public URLs of files the client already uploaded straight to storage
+    direct_urls: Dict[str, str] = {}
+    
     try:
         supabase = get_supabase_client()
         
         # Generate unique ID for the testimonial
         testimonial_id = str(uuid.uuid4())
-        video_url = None
         
         # Handle video upload if provided
         if video and video.filename:
@@ -211,62 +485,34 @@ async def submit_testimonial(
                 )
             
             try:
-                # Read file content
-                file_content = await video.read()
-                
-                if not file_content:
+                # Check the size and container format of the spooled upload, then hash it in chunks
+                try:
+                    spooled_video = await spool_upload(
+                        video, MAX_VIDEO_BYTES, expected_media_formats(file_extension, video.content_type)
+                    )
+                except UploadTooLarge:
                     raise CustomHTTPException(
                         error_code=ErrorCodes.INVALID_INPUT,
-                        message="Video file appears to be empty. Please select a valid video file."
+                        message="Video file is too large. Maximum size allowed is 50MB. Please compress your video or choose a smaller file."
+                    )
+                except MediaFormatMismatch:
+                    raise CustomHTTPException(
+                        error_code=ErrorCodes.INVALID_INPUT,
+                        message=f"Video file content does not match its '{file_extension}' file type. The file may be corrupted or renamed; please select a valid video file."
                     )
                 
-                # Check file size (50MB limit as per migration)
-                if len(file_content) > 52428800:  # 50MB in bytes
-                    file_size_mb = len(file_content) / (1024 * 1024)
+                if spooled_video is None:
                     raise CustomHTTPException(
                         error_code=ErrorCodes.INVALID_INPUT,
-                        message=f"Video file is too large ({file_size_mb:.1f}MB). Maximum size allowed is 50MB. Please compress your video or choose a smaller file."
+                        message="Video file appears to be empty. Please select a valid video file."
                     )
                 
                 # Generate safe filename
                 safe_extension = file_extension if file_extension in valid_extensions else '.mp4'
-                filename = f"videos/{testimonial_id}{safe_extension}"
+                filename = content_addressed_path('video', spooled_video.sha256, safe_extension)
                 
-                # Upload to testimonial-videos bucket
-                try:
-                    print(f"Uploading file: {filename} ({len(file_content)} bytes)")
-                    
-                    storage_response = supabase.storage.from_('testimonial-videos').upload(
-                        path=filename,
-                        file=file_content,
-                        file_options={"content-type": video.content_type or "video/mp4"}
-                    )
-                    
-                    print(f"Upload response: {storage_response}")
-                    
-                    # Check if upload was successful
-                    if hasattr(storage_response, 'error') and storage_response.error:
-                        print(f"Upload error: {storage_response.error}")
-                        raise CustomHTTPException(
-                            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
-                            message=f"Failed to upload video: {storage_response.error}"
-                        )
-                    
-                    # Always construct the URL manually for reliability
-                    video_url = f"{SUPABASE_URL}/storage/v1/object/public/testimonial-videos/{filename}"
-                    print(f"Generated video URL: {video_url}")
-                    
-                except Exception as storage_error:
-                    print(f"Storage error: {str(storage_error)}")
-                    if "already exists" in str(storage_error).lower():
-                        # File already exists, construct URL anyway
-                        video_url = f"{SUPABASE_URL}/storage/v1/object/public/testimonial-videos/{filename}"
-                        print(f"File exists, using URL: {video_url}")
-                    else:
-                        raise CustomHTTPException(
-                            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
-                            message=f"Failed to upload video: {str(storage_error)}"
-                        )
+                # Uploaded to testimonial-videos bucket below, alongside the photo
+                pending_uploads['video'] = PendingUpload('testimonial-videos', filename, spooled_video, video.content_type or "video/mp4")
                         
             except CustomHTTPException:
                 raise
@@ -276,9 +522,10 @@ async def submit_testimonial(
                     error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
                     message="Failed to process video file. Please check the file format and try again."
                 )
+        elif video_path:
+            direct_urls['video'] = await verify_submitted_upload(supabase, 'video', user_id, video_path)
         
         # Handle photo upload if provided
-        photo_url = None
         if photo and photo.filename:
             # Validate photo file
             valid_photo_types = ['image/jpeg', 'image/png', 'image/webp']
@@ -298,50 +545,33 @@ async def submit_testimonial(
                 )
             
             try:
-                file_content = await photo.read()
-                
-                if not file_content:
+                try:
+                    spooled_photo = await spool_upload(
+                        photo, MAX_PHOTO_BYTES, expected_media_formats(file_extension, photo.content_type)
+                    )
+                except UploadTooLarge:
                     raise CustomHTTPException(
                         error_code=ErrorCodes.INVALID_INPUT,
-                        message="Photo file appears to be empty. Please select a valid photo file."
+                        message="Photo file is too large. Maximum size allowed is 5MB."
+                    )
+                except MediaFormatMismatch:
+                    raise CustomHTTPException(
+                        error_code=ErrorCodes.INVALID_INPUT,
+                        message=f"Photo file content does not match its '{file_extension}' file type. The file may be corrupted or renamed; please select a valid photo file."
                     )
                 
-                # Check file size (5MB limit for photos)
-                if len(file_content) > 5242880:  # 5MB in bytes
-                    file_size_mb = len(file_content) / (1024 * 1024)
+                if spooled_photo is None:
                     raise CustomHTTPException(
                         error_code=ErrorCodes.INVALID_INPUT,
-                        message=f"Photo file is too large ({file_size_mb:.1f}MB). Maximum size allowed is 5MB."
+                        message="Photo file appears to be empty. Please select a valid photo file."
                     )
                 
                 # Generate safe filename
                 safe_extension = file_extension if file_extension in valid_photo_extensions else '.jpg'
-                filename = f"photos/{testimonial_id}{safe_extension}"
+                filename = content_addressed_path('photo', spooled_photo.sha256, safe_extension)
                 
-                # Upload to testimonial-photos bucket
-                try:
-                    storage_response = supabase.storage.from_('testimonial-photos').upload(
-                        path=filename,
-                        file=file_content,
-                        file_options={"content-type": photo.content_type or "image/jpeg"}
-                    )
-                    
-                    if hasattr(storage_response, 'error') and storage_response.error:
-                        raise CustomHTTPException(
-                            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
-                            message=f"Failed to upload photo: {storage_response.error}"
-                        )
-                    
-                    photo_url = f"{SUPABASE_URL}/storage/v1/object/public/testimonial-photos/{filename}"
-                    
-                except Exception as storage_error:
-                    if "already exists" in str(storage_error).lower():
-                        photo_url = f"{SUPABASE_URL}/storage/v1/object/public/testimonial-photos/{filename}"
-                    else:
-                        raise CustomHTTPException(
-                            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
-                            message=f"Failed to upload photo: {str(storage_error)}"
-                        )
+                # Uploaded to testimonial-photos bucket below, alongside the video
+                pending_uploads['photo'] = PendingUpload('testimonial-photos', filename, spooled_photo, photo.content_type or "image/jpeg")
                         
             except CustomHTTPException:
                 raise
@@ -351,6 +581,15 @@ async def submit_testimonial(
                     error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
                     message="Failed to process photo file. Please check the file format and try again."
                 )
+        elif photo_path:
+            direct_urls['photo'] = await verify_submitted_upload(supabase, 'photo', user_id, photo_path)
+
+        # Start the uploads now; the text checks below run while they are in flight
+        upload_task = None
+        if pending_uploads:
+            for pending in pending_uploads.values():
+                print(f"Uploading file: {pending.object_path} ({pending.spooled.size} bytes)")
+            upload_task = asyncio.create_task(upload_media(supabase, pending_uploads))
 
         # Insert testimonial into database
         testimonial_data = {
@@ -362,12 +601,53 @@ async def submit_testimonial(
             "category": category,
             "email": email,
             "allow_sharing": allow_sharing,
-            "video_url": video_url,
-            "photo_url": photo_url,
+            "video_url": None,
+            "photo_url": None,
+            "sentiment_score": score_sentiment(text),
             "approved": False,
             "created_at": datetime.utcnow().isoformat()
         }
         
+        # Apply the user's automation rules and fingerprint the text concurrently; neither depends on the media
+        automation_engine = AutomationEngine(supabase)
+        automation_result, fingerprint_result = await asyncio.gather(
+            asyncio.to_thread(automation_engine.process_testimonial, user_id, testimonial_data),
+            asyncio.to_thread(FingerprintService(supabase).check, user_id, text),
+            return_exceptions=True
+        )
+        
+        automation_logs = []
+        if isinstance(automation_result, Exception):
+            print(f"Automation error (non-blocking): {str(automation_result)}")
+            # Don't fail the testimonial submission if automation fails
+        else:
+            testimonial_data.update(automation_result['updates'])
+            automation_logs = automation_result['logs']
+        
+        # Flag (or reject) near-duplicates of the user's earlier testimonials
+        if isinstance(fingerprint_result, Exception):
+            print(f"Fingerprint error (non-blocking): {str(fingerprint_result)}")
+        else:
+            testimonial_data.update(fingerprint_result['columns'])
+            if fingerprint_result['duplicate']:
+                apply_duplicate_action(testimonial_data, fingerprint_result['duplicate'])
+        
+        # The insert needs the media URLs, so wait for the uploads here
+        media_urls = dict(direct_urls)
+        if upload_task is not None:
+            try:
+                media_urls.update(await upload_task)
+            except MediaUploadError as upload_error:
+                print(f"Storage error: {str(upload_error)}")
+                raise CustomHTTPException(
+                    error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+                    message=f"Failed to upload {upload_error.kind}: {str(upload_error)}"
+                )
+        testimonial_data['video_url'] = media_urls.get('video')
+        testimonial_data['photo_url'] = media_urls.get('photo')
+        if testimonial_data['video_url']:
+            print(f"Generated video URL: {testimonial_data['video_url']}")
+        
         try:
             db_response = supabase.table('testimonials').insert(testimonial_data).execute()
             
@@ -377,30 +657,42 @@ async def submit_testimonial(
                     message=f"Failed to save testimonial: {db_response.status_code}"
                 )
             
-            # Trigger notification for new testimonial
-            try:
-                notification_service = NotificationService(supabase)
-                notification_data = {
-                    "name": name,
-                    "text": text,
-                    "id": testimonial_id
-                }
-                await notification_service.trigger_new_testimonial_notification(user_id, notification_data)
-            except Exception as notification_error:
-                print(f"Notification error (non-blocking): {str(notification_error)}")
-                # Don't fail the testimonial submission if notification fails
+            # Log executed rules after the response is sent (one batched insert)
+            if automation_logs:
+                background_tasks.add_task(automation_engine.write_logs, automation_logs)
+            
+            # Generate photo variants and a video poster in the media worker pool
+            if media_processor.available and (testimonial_data['photo_url'] or testimonial_data['video_url']):
+                background_tasks.add_task(
+                    media_processor.process_testimonial,
+                    supabase,
+                    testimonial_id,
+                    photo_url=testimonial_data['photo_url'],
+                    video_url=testimonial_data['video_url']
+                )
+            
+            # Notify the owner from the notification workers; the row is saved, so the response doesn't wait for email
+            notification_data = {
+                "name": name,
+                "text": text,
+                "id": testimonial_id
+            }
+            notification_queue.enqueue(supabase, testimonial_id, user_id, notification_data)
             
             return {
                 "success": True,
                 "message": "Testimonial submitted successfully",
                 "testimonial_id": testimonial_id,
-                "video_url": video_url
+                "video_url": testimonial_data['video_url']
             }
             
         except CustomHTTPException:
+            # Don't leave media behind for a testimonial that was never saved
+            await release_uploaded(supabase, list(pending_uploads.values()))
             raise
         except Exception as db_error:
             print(f"Database error: {str(db_error)}")
+            await release_uploaded(supabase, list(pending_uploads.values()))
             raise CustomHTTPException(
                 error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
                 message="Failed to save testimonial to database. Please try again."
@@ -414,6 +706,9 @@ async def submit_testimonial(
             error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
             message="An unexpected error occurred while submitting the testimonial"
         )
+    finally:
+        for pending in pending_uploads.values():
+            pending.spooled.close()
 
 @app.get("/testimonials/{user_id}")
 async def get_testimonials(user_id: str, approved_only: bool = False):
@@ -555,8 +850,8 @@ async def delete_testimonial(testimonial_id: str):
     try:
         supabase = get_supabase_client()
         
-        # First, get the testimonial to check if it has a video
-        get_response = supabase.table('testimonials').select('video_url').eq('id', testimonial_id).execute()
+        # First, get the testimonial to find its media
+        get_response = supabase.table('testimonials').select('video_url, photo_url').eq('id', testimonial_id).execute()
         
         if hasattr(get_response, 'status_code') and get_response.status_code >= 400:
             raise CustomHTTPException(
@@ -569,16 +864,7 @@ async def delete_testimonial(testimonial_id: str):
                 error_code=ErrorCodes.NOT_FOUND,
                 message="Testimonial not found"
             )
-        
-        # Delete video from storage if it exists
         testimonial = get_response.data[0]
-        if testimonial.get('video_url'):
-            try:
-                # Extract filename from URL and delete from storage
-                video_filename = testimonial['video_url'].split('/')[-1]
-                supabase.storage.from_('testimonial-videos').remove([video_filename])
-            except Exception as e:
-                print(f"Warning: Failed to delete video file: {str(e)}")
         
         # Delete from database
         delete_response = supabase.table('testimonials').delete().eq('id', testimonial_id).execute()
@@ -589,6 +875,14 @@ async def delete_testimonial(testimonial_id: str):
                 message=f"Failed to delete testimonial: {delete_response.status_code}"
             )
         
+        # Release the media once the row is gone; shared blobs are only removed with their last reference
+        for media_url in (testimonial.get('video_url'), testimonial.get('photo_url')):
+            if media_url:
+                try:
+                    await asyncio.to_thread(release_media, supabase, media_url)
+                except Exception as e:
+                    print(f"Warning: Failed to delete media file: {str(e)}")
+        
         return {
             "success": True,
             "message": "Testimonial deleted successfully"
@@ -647,7 +941,7 @@ async def create_automation_rule(
     name: str,
     description: str,
     type: str,
-    conditions: list,
+    conditions: Union[List[Any], Dict[str, Any]],
     actions: list,
     priority: int = 1,
     enabled: bool = True
@@ -660,7 +954,8 @@ async def create_automation_rule(
         name: Rule name
         description: Rule description
         type: Rule type (auto_approval, spam_detection, categorization)
-        conditions: List of rule conditions
+        conditions: List of rule conditions, or a condition group
+            ({"logic": "AND" | "OR" | "NOT", "conditions": [...]})
         actions: List of rule actions
         priority: Rule priority (1-10)
         enabled: Whether the rule is enabled
@@ -668,6 +963,14 @@ async def create_automation_rule(
     Returns:
         Created rule
     """
+    try:
+        validate_conditions(conditions)
+    except ValueError as e:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=str(e)
+        )
+    
     try:
         supabase = get_supabase_client()
         
@@ -693,6 +996,8 @@ async def create_automation_rule(
                 message=f"Failed to create automation rule: {response.status_code}"
             )
         
+        rule_cache.invalidate(user_id)
+        
         return {
             "success": True,
             "rule": response.data[0] if response.data else rule_data
@@ -713,7 +1018,7 @@ async def update_automation_rule(
     name: str,
     description: str,
     type: str,
-    conditions: list,
+    conditions: Union[List[Any], Dict[str, Any]],
     actions: list,
     priority: int,
     enabled: bool
@@ -726,7 +1031,7 @@ async def update_automation_rule(
         name: Rule name
         description: Rule description
         type: Rule type
-        conditions: List of rule conditions
+        conditions: List of rule conditions, or a condition group
         actions: List of rule actions
         priority: Rule priority
         enabled: Whether the rule is enabled
@@ -734,6 +1039,14 @@ async def update_automation_rule(
     Returns:
         Updated rule
     """
+    try:
+        validate_conditions(conditions)
+    except ValueError as e:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=str(e)
+        )
+    
     try:
         supabase = get_supabase_client()
         
@@ -762,6 +1075,8 @@ async def update_automation_rule(
                 message="Automation rule not found"
             )
         
+        rule_cache.invalidate(response.data[0].get('user_id'))
+        
         return {
             "success": True,
             "rule": response.data[0]
@@ -808,6 +1123,8 @@ async def toggle_automation_rule(rule_id: str, enabled: bool):
                 message="Automation rule not found"
             )
         
+        rule_cache.invalidate(response.data[0].get('user_id'))
+        
         return {
             "success": True,
             "message": f"Rule {'enabled' if enabled else 'disabled'} successfully"
@@ -844,6 +1161,9 @@ async def delete_automation_rule(rule_id: str):
                 message=f"Failed to delete automation rule: {response.status_code}"
             )
         
+        for deleted_rule in response.data or []:
+            rule_cache.invalidate(deleted_rule.get('user_id'))
+        
         return {
             "success": True,
             "message": "Automation rule deleted successfully"
@@ -885,7 +1205,15 @@ async def test_automation_rule(rule_id: str, testimonial_data: dict):
         rule = rule_response.data[0]
         
         # Test the rule conditions
-        conditions_met = evaluate_rule_conditions(rule['conditions'], testimonial_data)
+        try:
+            conditions_met = compile_rule(rule).matches(testimonial_data)
+        except RegexTimeout as e:
+            error_monitor.record_error(ErrorCodes.REGEX_TIMEOUT, {"rule_id": rule_id, "pattern": e.pattern})
+            raise CustomHTTPException(
+                error_code=ErrorCodes.REGEX_TIMEOUT,
+                message=str(e),
+                status_code=422
+            )
         
         # Determine actions to take
         actions_to_execute = rule['actions'] if conditions_met else []
@@ -907,83 +1235,176 @@ async def test_automation_rule(rule_id: str, testimonial_data: dict):
             message="An unexpected error occurred while testing the automation rule"
         )
 
-def evaluate_rule_conditions(conditions: list, testimonial_data: dict) -> bool:
+@app.post("/automation/rules/test-batch")
+async def test_automation_rule_batch(
+    user_id: str,
+    rule_id: Optional[str] = None,
+    conditions: Optional[Union[List[Any], Dict[str, Any]]] = None,
+    actions: Optional[list] = None,
+    samples: Optional[List[Dict[str, Any]]] = None,
+    last_n: Optional[int] = None
+):
     """
-    Evaluate rule conditions against testimonial data
-    
+    Test a saved rule or an unsaved draft against many testimonials at once
+
+    The rule is compiled once and evaluated against every sample, so rule
+    tuning takes a single round trip.
+
     Args:
-        conditions: List of rule conditions
-        testimonial_data: Testimonial data to evaluate against
-    
+        user_id: The UUID of the user
+        rule_id: Saved rule to test (used when no draft conditions are given)
+        conditions: Draft conditions, in either supported format
+        actions: Draft actions (defaults to the saved rule's actions)
+        samples: Sample testimonial data to test against
+        last_n: Test against the user's most recent testimonials instead of samples
+
     Returns:
-        True if all conditions are met, False otherwise
+        Match counts and per-sample results
+    """
+    if conditions is None and not rule_id:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.MISSING_REQUIRED_FIELD,
+            message="Provide draft conditions or a rule_id to test."
+        )
+    if (samples is None) == (last_n is None):
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message="Provide either samples or last_n."
+        )
+    if samples is not None and len(samples) > MAX_RULE_TEST_SAMPLES:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=f"Too many samples. Please limit to {MAX_RULE_TEST_SAMPLES} per request."
+        )
+    if last_n is not None and not 1 <= last_n <= MAX_RULE_TEST_SAMPLES:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=f"last_n must be between 1 and {MAX_RULE_TEST_SAMPLES}."
+        )
+    if conditions is not None:
+        try:
+            validate_conditions(conditions)
+        except ValueError as e:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.INVALID_INPUT,
+                message=str(e)
+            )
+
+    try:
+        supabase = get_supabase_client()
+
+        if rule_id:
+            rule_response = supabase.table('automation_rules').select('*').eq('id', rule_id).eq('user_id', user_id).execute()
+            if not rule_response.data:
+                raise CustomHTTPException(
+                    error_code=ErrorCodes.NOT_FOUND,
+                    message="Automation rule not found"
+                )
+            rule = rule_response.data[0]
+        else:
+            rule = {"user_id": user_id}
+
+        if conditions is not None or actions is not None:
+            # Drafts have no id, so they are compiled fresh instead of going through the rule cache
+            rule = {
+                **rule,
+                "id": None,
+                "conditions": conditions if conditions is not None else rule.get('conditions'),
+                "actions": actions if actions is not None else rule.get('actions') or []
+            }
+            compiled = CompiledRule(rule)
+        else:
+            compiled = compile_rule(rule)
+
+        if samples is None:
+            testimonials_response = supabase.table('testimonials').select(BACKFILL_COLUMNS).eq('user_id', user_id).order('created_at', desc=True).limit(last_n).execute()
+            samples = testimonials_response.data or []
+
+        return {
+            "success": True,
+            "rule_id": rule_id,
+            "conditions_evaluated": rule.get('conditions'),
+            **test_rule_on_samples(compiled, samples)
+        }
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in test_automation_rule_batch: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message="An unexpected error occurred while testing the automation rule"
+        )
+
+@app.post("/automation/rules/{rule_id}/backfill")
+async def backfill_automation_rule(rule_id: str, dry_run: bool = False, page_size: int = 500):
     """
-    if not conditions:
-        return True
+    Apply an automation rule to the user's existing testimonials
+
+    The job runs in the background, streaming testimonials page by page;
+    poll GET /automation/backfill/{job_id} for progress.
     
-    result = True
-    logical_operator = 'AND'
+    Args:
+        rule_id: The UUID of the rule to apply
+        dry_run: If True, only count matches without updating testimonials
+        page_size: Testimonials evaluated per page (max 1000)
     
-    for i, condition in enumerate(conditions):
-        if i > 0 and 'logical_operator' in condition:
-            logical_operator = condition['logical_operator']
+    Returns:
+        The started backfill job
+    """
+    try:
+        supabase = get_supabase_client()
         
-        condition_result = evaluate_single_condition(condition, testimonial_data)
+        rule_response = supabase.table('automation_rules').select('*').eq('id', rule_id).execute()
         
-        if logical_operator == 'AND':
-            result = result and condition_result
-        else:  # OR
-            result = result or condition_result
-    
-    return result
+        if not rule_response.data:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.NOT_FOUND,
+                message="Automation rule not found"
+            )
+        
+        backfill_service = RuleBackfillService(supabase)
+        result = backfill_service.start_backfill(rule_response.data[0], dry_run, page_size)
+        
+        if not result['success']:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.INVALID_INPUT,
+                message=result['error'],
+                details={"job": result['job']},
+                status_code=409
+            )
+        
+        return result
+        
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in backfill_automation_rule: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message="An unexpected error occurred while starting the rule backfill"
+        )
 
-def evaluate_single_condition(condition: dict, testimonial_data: dict) -> bool:
+@app.get("/automation/backfill/{job_id}")
+async def get_backfill_job(job_id: str):
     """
-    Evaluate a single condition against testimonial data
+    Get progress of a rule backfill job
     
     Args:
-        condition: Single rule condition
-        testimonial_data: Testimonial data to evaluate against
+        job_id: Backfill job identifier
     
     Returns:
-        True if condition is met, False otherwise
+        Job status with processed, matched and updated counts
     """
-    field = condition.get('field', '')
-    operator = condition.get('operator', 'equals')
-    value = condition.get('value', '')
-    
-    # Get the actual value from testimonial data
-    actual_value = testimonial_data.get(field, '')
+    job = RuleBackfillService.get_job(job_id)
     
-    # Handle special fields
-    if field == 'text_length':
-        actual_value = len(testimonial_data.get('text', ''))
-        value = int(value) if value.isdigit() else 0
-    
-    # Convert to strings for comparison
-    actual_value_str = str(actual_value).lower()
-    value_str = str(value).lower()
+    if not job:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.NOT_FOUND,
+            message="Backfill job not found"
+        )
     
-    try:
-        if operator == 'equals':
-            return actual_value_str == value_str
-        elif operator == 'contains':
-            return value_str in actual_value_str
-        elif operator == 'starts_with':
-            return actual_value_str.startswith(value_str)
-        elif operator == 'ends_with':
-            return actual_value_str.endswith(value_str)
-        elif operator == 'greater_than':
-            return float(actual_value) > float(value)
-        elif operator == 'less_than':
-            return float(actual_value) < float(value)
-        elif operator == 'regex':
-            import re
-            return bool(re.search(value, actual_value_str))
-        else:
-            return False
-    except (ValueError, TypeError):
-        return False
+    return {"success": True, "job": job}
 
 @app.get("/automation/stats/{user_id}")
 async def get_automation_stats(user_id: str):
@@ -1020,7 +1441,11 @@ async def get_automation_stats(user_id: str):
             "totalRules": total_rules,
             "activeRules": active_rules,
             "rulesExecuted": rules_executed,
-            "automationRate": automation_rate
+            "automationRate": automation_rate,
+            "dispatch": {
+                **dispatch_stats.get(user_id),
+                "index": AutomationEngine(supabase).get_rule_index(user_id).describe()
+            }
         }
         
     except CustomHTTPException:
@@ -1540,6 +1965,154 @@ async def get_analytics_timeline(user_id: str, days: int = 30):
             message=f"Failed to get analytics timeline: {str(e)}"
         )
 
+def parse_date_param(value: Optional[str], param_name: str) -> Optional[str]:
+    """
+    Validate an optional ISO 8601 date/datetime query parameter
+
+    Args:
+        value: Raw query parameter value
+        param_name: Parameter name used in the error message
+
+    Returns:
+        Normalized ISO string, or None if the parameter was not supplied
+    """
+    if not value:
+        return None
+
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INVALID_INPUT,
+            message=f"Invalid {param_name}. Please use ISO 8601 format (YYYY-MM-DD)."
+        )
+
+@app.get("/analytics/{user_id}/distribution")
+async def get_analytics_distribution(
+    user_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Get rating and category distribution for analytics charts
+
+    Aggregation happens in the database (testimonial_distribution function),
+    so only the grouped counts are transferred, never the testimonial rows.
+
+    Args:
+        user_id: The UUID of the user
+        start_date: Inclusive start of the date range (ISO 8601, optional)
+        end_date: Exclusive end of the date range (ISO 8601, optional)
+
+    Returns:
+        Rating histogram, category counts and average rating by category
+    """
+    start = parse_date_param(start_date, "start_date")
+    end = parse_date_param(end_date, "end_date")
+
+    try:
+        supabase = get_supabase_client()
+
+        response = supabase.rpc('testimonial_distribution', {
+            "p_user_id": user_id,
+            "p_start": start,
+            "p_end": end
+        }).execute()
+
+        distribution = response.data or {}
+
+        # Always return all five star buckets so charts have a stable x-axis
+        rating_counts = {
+            row['rating']: row['count']
+            for row in distribution.get('rating_histogram', [])
+        }
+        rating_histogram = [
+            {"rating": rating, "count": rating_counts.get(rating, 0)}
+            for rating in range(1, 6)
+        ]
+
+        return {
+            "success": True,
+            "distribution": {
+                "startDate": start,
+                "endDate": end,
+                "totalTestimonials": distribution.get('total', 0),
+                "ratedTestimonials": distribution.get('rated', 0),
+                "averageRating": distribution.get('average_rating'),
+                "ratingHistogram": rating_histogram,
+                "categoryCounts": distribution.get('category_counts', []),
+                "ratingByCategory": distribution.get('rating_by_category', [])
+            }
+        }
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting analytics distribution: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message=f"Failed to get analytics distribution: {str(e)}"
+        )
+
+@app.get("/analytics/{user_id}/sentiment")
+async def get_analytics_sentiment(
+    user_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Get sentiment breakdown and daily trend for analytics charts
+
+    Scores are computed once at submission (sentiment_score column) and
+    aggregated in the database by the testimonial_sentiment function.
+
+    Args:
+        user_id: The UUID of the user
+        start_date: Inclusive start of the date range (ISO 8601, optional)
+        end_date: Exclusive end of the date range (ISO 8601, optional)
+
+    Returns:
+        Positive/neutral/negative counts, average score and daily trend
+    """
+    start = parse_date_param(start_date, "start_date")
+    end = parse_date_param(end_date, "end_date")
+
+    try:
+        supabase = get_supabase_client()
+
+        response = supabase.rpc('testimonial_sentiment', {
+            "p_user_id": user_id,
+            "p_start": start,
+            "p_end": end,
+            "p_positive": POSITIVE_THRESHOLD,
+            "p_negative": NEGATIVE_THRESHOLD
+        }).execute()
+
+        sentiment = response.data or {}
+
+        return {
+            "success": True,
+            "sentiment": {
+                "startDate": start,
+                "endDate": end,
+                "scoredTestimonials": sentiment.get('scored', 0),
+                "averageScore": sentiment.get('average_score'),
+                "positive": sentiment.get('positive', 0),
+                "neutral": sentiment.get('neutral', 0),
+                "negative": sentiment.get('negative', 0),
+                "dailyTrend": sentiment.get('daily_trend', [])
+            }
+        }
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting analytics sentiment: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message=f"Failed to get analytics sentiment: {str(e)}"
+        )
+
 # Notification endpoints
 @app.get("/notifications/preferences/{user_id}")
 async def get_notification_preferences(user_id: str):
@@ -1830,6 +2403,140 @@ async def send_welcome_email(user_email: str, user_name: Optional[str] = None):
             message=f"Failed to send welcome email: {str(e)}"
         )
 
+# Admin endpoints
+def verify_admin_key(admin_key: Optional[str]) -> None:
+    """
+    Ensure the request carries the platform admin key
+
+    Args:
+        admin_key: Value of the X-Admin-Key header
+    """
+    if not ADMIN_API_KEY or admin_key != ADMIN_API_KEY:
+        raise CustomHTTPException(
+            error_code=ErrorCodes.FORBIDDEN,
+            status_code=403
+        )
+
+@app.get("/admin/analytics/overview")
+async def get_admin_analytics_overview(
+    hours: int = 24,
+    limit: int = 10,
+    x_admin_key: Optional[str] = Header(None)
+):
+    """
+    Get platform-wide analytics across all users
+
+    Args:
+        hours: Size of the reporting window in hours (default 24)
+        limit: Number of top tenants to return (default 10)
+        x_admin_key: Platform admin key
+
+    Returns:
+        Submissions per hour, top tenants by volume and notification failure rate
+    """
+    verify_admin_key(x_admin_key)
+
+    try:
+        admin_analytics = AdminAnalyticsService(get_supabase_client())
+
+        result = await admin_analytics.get_overview(hours, limit)
+
+        if result['success']:
+            return result
+        else:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+                message=result['error']
+            )
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting admin analytics overview: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message=f"Failed to get admin analytics overview: {str(e)}"
+        )
+
+@app.get("/admin/analytics/tenants")
+async def get_admin_tenant_breakdown(
+    hours: int = 24,
+    limit: int = 10,
+    x_admin_key: Optional[str] = Header(None)
+):
+    """
+    Get the top tenants with their rating and category distribution
+
+    Args:
+        hours: Size of the reporting window in hours (default 24)
+        limit: Number of tenants to include (default 10)
+        x_admin_key: Platform admin key
+
+    Returns:
+        Top tenants by volume, each with its distribution for the window
+    """
+    verify_admin_key(x_admin_key)
+
+    try:
+        admin_analytics = AdminAnalyticsService(get_supabase_client())
+
+        result = await admin_analytics.get_tenant_breakdown(hours, limit)
+
+        if result['success']:
+            return result
+        else:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+                message=result['error']
+            )
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting admin tenant breakdown: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message=f"Failed to get admin tenant breakdown: {str(e)}"
+        )
+
+@app.post("/admin/media/gc")
+async def collect_orphaned_media(
+    dry_run: bool = True,
+    x_admin_key: Optional[str] = Header(None)
+):
+    """
+    Remove stored videos, photos and derived media that no testimonial references
+
+    Args:
+        dry_run: Only report the orphans (default true)
+        x_admin_key: Platform admin key
+
+    Returns:
+        Objects scanned, orphans found and removed, and a sample of orphan paths
+    """
+    verify_admin_key(x_admin_key)
+
+    try:
+        # Listing and removal use the sync storage client, so keep them off the event loop
+        result = await asyncio.to_thread(OrphanMediaCollector(get_supabase_client()).collect, dry_run)
+
+        if result['success']:
+            return result
+        else:
+            raise CustomHTTPException(
+                error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+                message=result['error']
+            )
+
+    except CustomHTTPException:
+        raise
+    except Exception as e:
+        print(f"Error collecting orphaned media: {str(e)}")
+        raise CustomHTTPException(
+            error_code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message=f"Failed to collect orphaned media: {str(e)}"
+        )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,212 @@
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Any
+from datetime import datetime, timedelta, timezone
+import os
+from supabase import Client
+from media_upload import MEDIA_KINDS, storage_object_from_url
+from media_processing import DERIVED_MEDIA_BUCKET, HLS_BUCKET
+
+# Objects listed per storage list call, and testimonials read per page
+GC_PAGE_SIZE = int(os.getenv("MEDIA_GC_PAGE_SIZE", "1000"))
+
+# Paths per storage remove call
+GC_REMOVE_BATCH_SIZE = int(os.getenv("MEDIA_GC_REMOVE_BATCH_SIZE", "100"))
+
+# Objects younger than this are never collected: they may belong to a submission
+# still in progress or a signed/resumable upload not yet submitted
+GC_MIN_AGE_SECONDS = int(os.getenv("MEDIA_GC_MIN_AGE", "86400"))
+
+# Orphan paths included in the result
+GC_REPORT_LIMIT = 100
+
+# Top-level folders of uploaded media, per bucket
+UPLOAD_PREFIXES = tuple(f"{media['prefix']}/" for media in MEDIA_KINDS.values())
+
+# Folders written by media_processing, keyed by testimonial id (variants/<id>/, posters/<id>.jpg, hls/<id>/)
+DERIVED_PREFIXES = ('variants/', 'posters/', 'hls/')
+
+# Testimonial columns holding storage URLs
+MEDIA_COLUMNS = 'id, video_url, photo_url, photo_variants, video_poster_url, video_hls_url'
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Storage timestamp as an aware datetime"""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+class OrphanMediaCollector:
+    """
+    Remove stored media that no testimonial references
+
+    Orphans come from testimonials deleted before their photo and derived
+    media were cleaned up, and from uploads whose testimonial was never
+    saved. The referenced objects are collected into a set first (one
+    keyset-paginated pass over testimonials), then each bucket is listed
+    page by page and the objects missing from the set are removed in
+    batches. With dry_run the orphans are only counted.
+    """
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+
+    def _referenced(self) -> Tuple[Set[Tuple[str, str]], Set[str]]:
+        """(bucket, path) of every referenced object, and the ids of all testimonials"""
+        referenced: Set[Tuple[str, str]] = set()
+        testimonial_ids: Set[str] = set()
+        last_id = None
+        while True:
+            query = self.supabase.table('testimonials').select(MEDIA_COLUMNS)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(GC_PAGE_SIZE).execute().data or []
+            for testimonial in page:
+                testimonial_ids.add(str(testimonial['id']))
+                urls = [testimonial.get(column) for column in ('video_url', 'photo_url', 'video_poster_url', 'video_hls_url')]
+                urls.extend((testimonial.get('photo_variants') or {}).values())
+                for url in urls:
+                    storage_object = storage_object_from_url(url) if isinstance(url, str) else None
+                    if storage_object:
+                        referenced.add(storage_object)
+            if len(page) < GC_PAGE_SIZE:
+                return referenced, testimonial_ids
+            last_id = page[-1]['id']
+
+    def _list_folder(self, bucket: str, folder: str) -> Iterator[Dict[str, Any]]:
+        """Entries of one folder, page by page"""
+        offset = 0
+        while True:
+            page = self.supabase.storage.from_(bucket).list(folder, {
+                'limit': GC_PAGE_SIZE,
+                'offset': offset,
+                'sortBy': {'column': 'name', 'order': 'asc'}
+            }) or []
+            yield from page
+            if len(page) < GC_PAGE_SIZE:
+                return
+            offset += len(page)
+
+    def _walk(self, bucket: str) -> Iterator[List[Tuple[str, Dict[str, Any]]]]:
+        """
+        (path, entry) pairs of the files in each media folder of a bucket
+
+        A folder is listed completely before its files are yielded, so
+        removing them does not shift the offsets of a listing in progress.
+        """
+        folders = [prefix.rstrip('/') for prefix in UPLOAD_PREFIXES + DERIVED_PREFIXES]
+        while folders:
+            folder = folders.pop()
+            files = []
+            for entry in self._list_folder(bucket, folder):
+                name = entry.get('name') or ''
+                if not name or name.startswith('.'):
+                    # Placeholders the storage dashboard creates for empty folders
+                    continue
+                path = f"{folder}/{name}"
+                if entry.get('id') is None:
+                    folders.append(path)
+                else:
+                    files.append((path, entry))
+            if files:
+                yield files
+
+    @staticmethod
+    def _is_live_derived(path: str, testimonial_ids: Set[str]) -> bool:
+        """Whether a derived object belongs to an existing testimonial"""
+        if not path.startswith(DERIVED_PREFIXES):
+            return False
+        owner = path.split('/')[1].split('.')[0]
+        return owner in testimonial_ids
+
+    def _recently_acquired(self, bucket: str, paths: List[str], cutoff: datetime) -> Set[str]:
+        """Content-addressed paths whose reference count changed after the cutoff"""
+        recent = set()
+        for start in range(0, len(paths), GC_REMOVE_BATCH_SIZE):
+            try:
+                rows = self.supabase.table('media_blobs').select('path, updated_at').eq('bucket', bucket).in_(
+                    'path', paths[start:start + GC_REMOVE_BATCH_SIZE]
+                ).execute().data or []
+            except Exception as e:
+                print(f"Media reference count error (content-addressed blobs kept): {str(e)}")
+                return set(paths)
+            recent.update(
+                row['path'] for row in rows
+                if (_parse_timestamp(row.get('updated_at')) or cutoff) > cutoff
+            )
+        return recent
+
+    def _remove(self, bucket: str, batch: List[str]) -> int:
+        """Remove a batch of objects in one call, dropping the reference counts of content-addressed ones"""
+        self.supabase.storage.from_(bucket).remove(batch)
+        blobs = [path for path in batch if '/sha256/' in path]
+        if blobs:
+            try:
+                self.supabase.table('media_blobs').delete().eq('bucket', bucket).in_('path', blobs).execute()
+            except Exception as e:
+                print(f"Media reference count error (stale counts left): {str(e)}")
+        return len(batch)
+
+    def collect(self, dry_run: bool = True, min_age_seconds: int = GC_MIN_AGE_SECONDS) -> Dict[str, Any]:
+        """
+        Find (and unless dry_run, remove) objects no testimonial references
+
+        Args:
+            dry_run: Only report the orphans
+            min_age_seconds: Objects created more recently are kept
+
+        Returns:
+            Objects scanned, orphans found and removed, and a sample of orphan paths
+        """
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds)
+            # Taken before listing, so objects of testimonials saved meanwhile are newer than the cutoff
+            referenced, testimonial_ids = self._referenced()
+
+            scanned = orphans = orphan_bytes = removed = 0
+            sample: List[str] = []
+            for bucket in sorted({media['bucket'] for media in MEDIA_KINDS.values()} | {DERIVED_MEDIA_BUCKET, HLS_BUCKET}):
+                # Orphans from several folders share a remove call
+                pending: List[str] = []
+                for files in self._walk(bucket):
+                    scanned += len(files)
+                    candidates = [
+                        (path, entry) for path, entry in files
+                        if (bucket, path) not in referenced
+                        and not self._is_live_derived(path, testimonial_ids)
+                        and (_parse_timestamp(entry.get('created_at')) or cutoff) < cutoff
+                    ]
+                    # A blob shared by content hash may have been reused by a submission after the snapshot
+                    recent = self._recently_acquired(bucket, [path for path, _ in candidates if '/sha256/' in path], cutoff)
+                    candidates = [(path, entry) for path, entry in candidates if path not in recent]
+                    if not candidates:
+                        continue
+
+                    orphans += len(candidates)
+                    orphan_bytes += sum(int((entry.get('metadata') or {}).get('size') or 0) for _, entry in candidates)
+                    sample.extend(f"{bucket}/{path}" for path, _ in candidates[:GC_REPORT_LIMIT - len(sample)])
+                    if not dry_run:
+                        pending.extend(path for path, _ in candidates)
+                        while len(pending) >= GC_REMOVE_BATCH_SIZE:
+                            removed += self._remove(bucket, pending[:GC_REMOVE_BATCH_SIZE])
+                            pending = pending[GC_REMOVE_BATCH_SIZE:]
+                if pending:
+                    removed += self._remove(bucket, pending)
+
+            return {
+                "success": True,
+                "gc": {
+                    "dryRun": dry_run,
+                    "referenced": len(referenced),
+                    "scanned": scanned,
+                    "orphans": orphans,
+                    "orphanBytes": orphan_bytes,
+                    "removed": removed,
+                    "sample": sample
+                }
+            }
+
+        except Exception as e:
+            print(f"Error collecting orphaned media: {str(e)}")
+            return {"success": False, "error": str(e)}
@@ -0,0 +1,360 @@
+from typing import Dict, List, Optional, Any
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import urllib.request
+from supabase import Client
+from media_upload import MAX_PHOTO_BYTES, public_url
+
+# Optional image processing for photo variants (pip install Pillow)
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+MEDIA_PROCESSING_ENABLED = os.getenv("MEDIA_PROCESSING_ENABLED", "true").lower() == "true"
+
+# ffmpeg executable for video posters (posters are skipped when it is not found)
+FFMPEG_BINARY = shutil.which(os.getenv("FFMPEG_BINARY", "ffmpeg"))
+
+# Widths of the WebP variants generated for each photo
+PHOTO_VARIANT_WIDTHS = sorted(int(width) for width in os.getenv("MEDIA_PHOTO_VARIANT_WIDTHS", "160,480,960").split(','))
+PHOTO_VARIANT_QUALITY = 80
+
+# Poster frame: taken this far into the video, scaled down to this width
+VIDEO_POSTER_OFFSET_SECONDS = 1
+VIDEO_POSTER_WIDTH = 640
+
+# Worker processes doing image decoding and ffmpeg runs
+MEDIA_WORKER_PROCESSES = int(os.getenv("MEDIA_WORKER_PROCESSES", "2"))
+
+# Testimonials waiting for or in processing; further ones are skipped (see backfill)
+MEDIA_MAX_PENDING_JOBS = int(os.getenv("MEDIA_MAX_PENDING_JOBS", "32"))
+
+# Adaptive streaming: package videos as HLS at these "<height>:<video kbps>" renditions
+MEDIA_HLS_ENABLED = os.getenv("MEDIA_HLS_ENABLED", "false").lower() == "true"
+HLS_RENDITIONS = [
+    tuple(int(part) for part in rendition.split(':'))
+    for rendition in os.getenv("MEDIA_HLS_RENDITIONS", "360:800,720:2500").split(',')
+]
+HLS_SEGMENT_SECONDS = 6
+HLS_AUDIO_BITRATE = '96k'
+
+# Bucket for HLS playlists and segments (must accept application/vnd.apple.mpegurl and video/mp2t)
+HLS_BUCKET = os.getenv("MEDIA_HLS_BUCKET", "testimonial-videos")
+
+FFMPEG_TIMEOUT_SECONDS = 60
+HLS_TIMEOUT_SECONDS = 900
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+# Derived images live in the photos bucket
+DERIVED_MEDIA_BUCKET = 'testimonial-photos'
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t'
+}
+
+def make_photo_variants(source_url: str, widths: List[int]) -> Dict[int, bytes]:
+    """
+    Download a photo and encode a WebP variant per width
+
+    Runs in a worker process. Widths at or above the photo's own width
+    collapse into a single variant at the original size.
+    """
+    try:
+        with urllib.request.urlopen(source_url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+            source = response.read(MAX_PHOTO_BYTES + 1)
+    except OSError as e:
+        # HTTP errors hold the response and cannot be sent back from the worker
+        raise ValueError(f"Failed to download photo: {str(e)}")
+    if len(source) > MAX_PHOTO_BYTES:
+        raise ValueError("Photo is larger than the upload limit")
+
+    variants: Dict[int, bytes] = {}
+    with Image.open(io.BytesIO(source)) as image:
+        # Let JPEG decode at reduced scale when even the largest variant is much smaller
+        image.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        # Largest first, each variant resized from the previous one
+        current = image
+        for width in sorted(widths, reverse=True):
+            target = min(width, image.width)
+            if target in variants:
+                continue
+            if current.width != target:
+                current = current.resize((target, max(1, round(current.height * target / current.width))), Image.LANCZOS)
+            output = io.BytesIO()
+            current.save(output, 'WEBP', quality=PHOTO_VARIANT_QUALITY, method=4)
+            variants[target] = output.getvalue()
+    return variants
+
+def extract_video_poster(ffmpeg: str, source_url: str) -> Optional[bytes]:
+    """
+    Grab one frame of a video as a JPEG with ffmpeg
+
+    Runs in a worker process. Seeking before the input lets ffmpeg fetch
+    only the part of the file it needs.
+    """
+    for offset in (VIDEO_POSTER_OFFSET_SECONDS, 0):
+        result = subprocess.run(
+            [
+                ffmpeg, '-v', 'error', '-ss', str(offset), '-i', source_url,
+                '-frames:v', '1', '-vf', f"scale='min({VIDEO_POSTER_WIDTH},iw)':-2",
+                '-f', 'image2', '-c:v', 'mjpeg', '-q:v', '4', 'pipe:1'
+            ],
+            capture_output=True,
+            timeout=FFMPEG_TIMEOUT_SECONDS
+        )
+        # Videos shorter than the offset yield no frame; retry from the start
+        if result.stdout:
+            return result.stdout
+    return None
+
+def probe_video(ffmpeg: str, source_url: str) -> Dict[str, Any]:
+    """Height of the first video stream and whether there is an audio stream"""
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-i', source_url],
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS
+    )
+    # With no output file ffmpeg exits with an error after printing the input's streams
+    streams = result.stderr.decode('utf-8', errors='replace')
+    size = re.search(r"Stream #.*?Video:.*?(\d{2,5})x(\d{2,5})", streams)
+    return {
+        "height": int(size.group(2)) if size else None,
+        "has_audio": re.search(r"Stream #.*?Audio:", streams) is not None
+    }
+
+def package_hls(ffmpeg: str, source_url: str, renditions: List[tuple]) -> str:
+    """
+    Transcode a video into HLS renditions with one ffmpeg run
+
+    Runs in a worker process. Renditions taller than the source are dropped
+    (the smallest is always kept). Returns a temporary directory holding
+    master.m3u8 and one playlist plus segments per rendition; the caller
+    removes it.
+    """
+    source = probe_video(ffmpeg, source_url)
+    if source['height'] is None:
+        raise ValueError("No video stream found")
+    renditions = sorted(renditions)
+    renditions = [r for r in renditions if r[0] <= source['height']] or [(source['height'], renditions[0][1])]
+
+    output_dir = tempfile.mkdtemp(prefix='testimonial-hls-')
+    splits = ''.join(f'[v{i}]' for i in range(len(renditions)))
+    filters = [f"[0:v]split={len(renditions)}{splits}"] + [
+        f"[v{i}]scale=-2:{height}[v{i}out]" for i, (height, _) in enumerate(renditions)
+    ]
+    command = [ffmpeg, '-v', 'error', '-i', source_url, '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for i, (height, kbps) in enumerate(renditions):
+        command += [
+            '-map', f'[v{i}out]', f'-c:v:{i}', 'libx264', f'-b:v:{i}', f'{kbps}k',
+            f'-maxrate:v:{i}', f'{int(kbps * 1.07)}k', f'-bufsize:v:{i}', f'{kbps * 2}k'
+        ]
+        if source['has_audio']:
+            command += ['-map', 'a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', HLS_AUDIO_BITRATE]
+            stream_map.append(f'v:{i},a:{i},name:{height}p')
+        else:
+            stream_map.append(f'v:{i},name:{height}p')
+    command += [
+        # Keyframes on segment boundaries so every rendition switches cleanly
+        '-preset', 'veryfast', '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})', '-sc_threshold', '0',
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%03d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8')
+    ]
+
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=HLS_TIMEOUT_SECONDS)
+        if result.returncode != 0:
+            raise ValueError(f"ffmpeg failed: {result.stderr.decode('utf-8', errors='replace')[-500:]}")
+    except BaseException:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    return output_dir
+
+def upload_derived(supabase: Client, object_path: str, data: Any, content_type: str, bucket: str = DERIVED_MEDIA_BUCKET) -> str:
+    """Store a derived file (bytes or a local path, replacing an earlier one) and return its public URL"""
+    supabase.storage.from_(bucket).upload(
+        path=object_path,
+        file=data,
+        file_options={"content-type": content_type, "upsert": "true"}
+    )
+    return public_url(bucket, object_path)
+
+class MediaProcessor:
+    """
+    Generates photo variants and video posters after a testimonial is saved
+
+    Decoding and encoding run in a bounded process pool, so the API event
+    loop only awaits results and uploads them. Failures are logged and leave
+    the testimonial without derived media.
+    """
+
+    def __init__(self, max_workers: int = MEDIA_WORKER_PROCESSES, max_pending: int = MEDIA_MAX_PENDING_JOBS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def available(self) -> bool:
+        return MEDIA_PROCESSING_ENABLED and (Image is not None or FFMPEG_BINARY is not None)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers don't inherit the API's threads and open connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def _run(self, func: Any, *args: Any) -> Any:
+        pool = self._pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for later jobs
+            if self._executor is pool:
+                self._executor = None
+            raise
+
+    async def _photo_variants(self, supabase: Client, testimonial_id: str, photo_url: str) -> Dict[str, str]:
+        variants = await self._run(make_photo_variants, photo_url, PHOTO_VARIANT_WIDTHS)
+        urls = await asyncio.gather(*(
+            asyncio.to_thread(upload_derived, supabase, f"variants/{testimonial_id}/{width}.webp", data, 'image/webp')
+            for width, data in variants.items()
+        ))
+        return {str(width): url for width, url in zip(variants, urls)}
+
+    async def _video_poster(self, supabase: Client, testimonial_id: str, video_url: str) -> Optional[str]:
+        poster = await self._run(extract_video_poster, FFMPEG_BINARY, video_url)
+        if poster is None:
+            return None
+        return await asyncio.to_thread(upload_derived, supabase, f"posters/{testimonial_id}.jpg", poster, 'image/jpeg')
+
+    async def _video_hls(self, supabase: Client, testimonial_id: str, video_url: str) -> str:
+        output_dir = await self._run(package_hls, FFMPEG_BINARY, video_url, HLS_RENDITIONS)
+        try:
+            files = [
+                os.path.relpath(os.path.join(directory, name), output_dir)
+                for directory, _, names in os.walk(output_dir)
+                for name in names
+            ]
+            # Playlists last, so a manifest never points at segments that are not stored yet
+            segments = [name for name in files if not name.endswith('.m3u8')]
+            playlists = [name for name in files if name.endswith('.m3u8')]
+            for batch in (segments, playlists):
+                await asyncio.gather(*(
+                    asyncio.to_thread(
+                        upload_derived, supabase, f"hls/{testimonial_id}/{name}", os.path.join(output_dir, name),
+                        HLS_CONTENT_TYPES[os.path.splitext(name)[1]], HLS_BUCKET
+                    )
+                    for name in batch
+                ))
+            return public_url(HLS_BUCKET, f"hls/{testimonial_id}/master.m3u8")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    async def _apply(self, supabase: Client, testimonial_id: str, column: str, job: Any) -> Any:
+        """Run one job and store its result as soon as it is ready"""
+        try:
+            value = await job
+            if value:
+                await asyncio.to_thread(
+                    lambda: supabase.table('testimonials').update({column: value}).eq('id', testimonial_id).execute()
+                )
+            return value
+        except Exception as e:
+            print(f"Media processing error for {testimonial_id} ({column}): {str(e)}")
+            return None
+
+    async def process_testimonial(self, supabase: Client, testimonial_id: str,
+                                  photo_url: Optional[str] = None, video_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Derive media for one testimonial and store the URLs on its row
+
+        Each derived column is written as soon as its job finishes, so photo
+        variants and posters don't wait for HLS packaging.
+
+        Returns:
+            The columns written (photo_variants, video_poster_url, video_hls_url)
+        """
+        if not self.available or not (photo_url or video_url):
+            return {}
+        if self._pending >= self.max_pending:
+            print(f"Media processing queue full, skipping testimonial {testimonial_id}")
+            return {}
+
+        self._pending += 1
+        try:
+            jobs = {}
+            if photo_url and Image is not None:
+                jobs['photo_variants'] = self._photo_variants(supabase, testimonial_id, photo_url)
+            if video_url and FFMPEG_BINARY is not None:
+                jobs['video_poster_url'] = self._video_poster(supabase, testimonial_id, video_url)
+                if MEDIA_HLS_ENABLED:
+                    jobs['video_hls_url'] = self._video_hls(supabase, testimonial_id, video_url)
+
+            results = await asyncio.gather(*(
+                self._apply(supabase, testimonial_id, column, job) for column, job in jobs.items()
+            ))
+            return {column: result for column, result in zip(jobs, results) if result}
+        except Exception as e:
+            print(f"Media processing error (non-blocking): {str(e)}")
+            return {}
+        finally:
+            self._pending -= 1
+
+    async def backfill(self, supabase: Client, page_size: int = 100) -> int:
+        """Process existing testimonials that have media but no derived media; returns rows updated"""
+        updated = 0
+        last_id = None
+        while True:
+            missing_video = 'or(video_poster_url.is.null,video_hls_url.is.null)' if MEDIA_HLS_ENABLED else 'video_poster_url.is.null'
+            query = supabase.table('testimonials').select('id, photo_url, video_url, photo_variants, video_poster_url, video_hls_url').or_(
+                f'and(photo_url.not.is.null,photo_variants.is.null),and(video_url.not.is.null,{missing_video})'
+            )
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(page_size).execute().data or []
+            if not page:
+                break
+            last_id = page[-1]['id']
+
+            # One batch per worker round, so the pending limit is never hit
+            for start in range(0, len(page), self.max_workers):
+                results = await asyncio.gather(*(
+                    self.process_testimonial(
+                        supabase,
+                        testimonial['id'],
+                        photo_url=testimonial['photo_url'] if not testimonial.get('photo_variants') else None,
+                        video_url=testimonial['video_url'] if not testimonial.get('video_poster_url') or (
+                            MEDIA_HLS_ENABLED and not testimonial.get('video_hls_url')
+                        ) else None
+                    )
+                    for testimonial in page[start:start + self.max_workers]
+                ))
+                updated += sum(1 for result in results if result)
+
+            if len(page) < page_size:
+                break
+        return updated
+
+# Global media processor instance
+media_processor = MediaProcessor()
@@ -0,0 +1,587 @@
+from typing import BinaryIO, Collection, Dict, List, Optional, Set, Tuple, Any
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+import uuid
+from fastapi import UploadFile
+from supabase import Client
+from error_handler import CustomHTTPException, ErrorCodes, create_error_response
+
+# Bytes read from an upload per step; bounds per-request memory regardless of file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Size limits per media type (match the storage bucket limits)
+MAX_VIDEO_BYTES = 52428800  # 50MB
+MAX_PHOTO_BYTES = 5242880  # 5MB
+
+# Seconds a signed upload URL can be used for; storage keeps its own token valid longer,
+# so a file uploaded after this is refused when it is submitted
+SIGNED_UPLOAD_TTL_SECONDS = int(os.getenv("MEDIA_SIGNED_UPLOAD_TTL", "300"))
+
+# Seconds an upload waits for an identical file to finish being removed before giving up,
+# and between checks (the database takes a removal over after two minutes)
+BLOB_REMOVAL_WAIT_SECONDS = float(os.getenv("MEDIA_BLOB_REMOVAL_WAIT", "10"))
+BLOB_REMOVAL_POLL_SECONDS = 0.5
+
+# Multipart boundaries and the text fields of a submission
+SUBMIT_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+# Largest request body /submit-testimonial can legitimately receive
+MAX_SUBMIT_BODY_BYTES = MAX_VIDEO_BYTES + MAX_PHOTO_BYTES + SUBMIT_FORM_OVERHEAD_BYTES
+
+# Storage bucket, object prefix, accepted extensions and size limit per media kind
+MEDIA_KINDS: Dict[str, Dict[str, Any]] = {
+    'video': {
+        'bucket': 'testimonial-videos',
+        'prefix': 'videos',
+        'extensions': ['.mp4', '.mov', '.avi', '.wmv', '.webm', '.mpeg', '.mpg'],
+        'content_type_prefix': 'video/',
+        'max_bytes': MAX_VIDEO_BYTES
+    },
+    'photo': {
+        'bucket': 'testimonial-photos',
+        'prefix': 'photos',
+        'extensions': ['.jpg', '.jpeg', '.png', '.webp'],
+        'content_type_prefix': 'image/',
+        'max_bytes': MAX_PHOTO_BYTES
+    }
+}
+
+# Bytes at the start of a file needed to recognise its container format
+MEDIA_SNIFF_BYTES = 12
+
+# Container format expected for each accepted file extension and content type
+EXTENSION_FORMATS: Dict[str, str] = {
+    '.mp4': 'isobmff',
+    '.mov': 'isobmff',
+    '.webm': 'ebml',
+    '.avi': 'avi',
+    '.wmv': 'asf',
+    '.mpeg': 'mpeg',
+    '.mpg': 'mpeg',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.webp': 'webp'
+}
+CONTENT_TYPE_FORMATS: Dict[str, str] = {
+    'video/mp4': 'isobmff',
+    'video/quicktime': 'isobmff',
+    'video/webm': 'ebml',
+    'video/x-msvideo': 'avi',
+    'video/x-ms-wmv': 'asf',
+    'video/mpeg': 'mpeg',
+    'image/jpeg': 'jpeg',
+    'image/png': 'png',
+    'image/webp': 'webp'
+}
+
+def sniff_media_format(head: bytes) -> Optional[str]:
+    """Container format of a file from its first MEDIA_SNIFF_BYTES bytes, or None if unrecognised"""
+    # MP4/MOV start with an ftyp box; older QuickTime files start with another top-level atom
+    if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return 'isobmff'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'ebml'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'avi'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return 'asf'
+    if head[:4] in (b'\x00\x00\x01\xba', b'\x00\x00\x01\xb3'):
+        return 'mpeg'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    return None
+
+def expected_media_formats(extension: str, content_type: Optional[str] = None) -> Set[str]:
+    """
+    Container formats a file may have given its extension and declared content type
+
+    An empty set means the two contradict each other, so no content can match.
+    """
+    formats = {EXTENSION_FORMATS[extension]} if extension in EXTENSION_FORMATS else set()
+    if content_type in CONTENT_TYPE_FORMATS:
+        formats &= {CONTENT_TYPE_FORMATS[content_type]}
+    return formats
+
+class MediaFormatMismatch(ValueError):
+    """Raised when the first bytes of an upload do not match its declared type"""
+
+    def __init__(self, detected: Optional[str]):
+        self.detected = detected
+        super().__init__(f"Upload content is {detected or 'an unrecognised format'}")
+
+class UploadTooLarge(ValueError):
+    """Raised as soon as an upload stream passes its size limit"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+
+class SpooledUpload:
+    """
+    An upload held on disk: a temporary file removed on close, or the file
+    Starlette already spooled the request body into (closed by Starlette)
+    """
+
+    def __init__(self, path: Optional[str], size: int, sha256: Optional[str] = None, file: Optional[BinaryIO] = None):
+        self.path = path
+        self.size = size
+        # Hex SHA-256 of the content, computed while spooling
+        self.sha256 = sha256
+        self.file = file
+
+    def open(self) -> BinaryIO:
+        """A reader positioned at the start of the content; the caller closes it"""
+        if self.path is not None:
+            return open(self.path, 'rb')
+        # A separate descriptor, so closing the reader leaves the upload open; an upload
+        # small enough for Starlette to keep in memory is written to disk by fileno()
+        reader = os.fdopen(os.dup(self.file.fileno()), 'rb')
+        reader.seek(0)
+        return reader
+
+    def close(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+async def spool_upload(upload: UploadFile, max_bytes: int, expected_formats: Optional[Collection[str]] = None,
+                       chunk_size: int = UPLOAD_CHUNK_SIZE) -> Optional[SpooledUpload]:
+    """
+    Check and hash an upload in place, without copying it
+
+    By the time a handler runs, Starlette has received the whole multipart
+    body and spooled each file into UploadFile.file. That file is used as it
+    is: its size is checked before any of it is read, the container signature
+    of the first bytes is checked when expected_formats is given, and the
+    content is hashed (SHA-256) in one pass of fixed-size chunks, so memory
+    use stays at one chunk and no second copy is written. Rejecting an
+    oversized body before it is received is BodySizeLimitMiddleware's job.
+
+    Args:
+        upload: Uploaded file from the multipart request
+        max_bytes: Maximum accepted size
+        expected_formats: Accepted formats (see expected_media_formats)
+
+    Returns:
+        The upload, readable through SpooledUpload.open, or None if it is empty
+
+    Raises:
+        UploadTooLarge: If the file is larger than max_bytes
+        MediaFormatMismatch: If the first bytes are not one of expected_formats
+    """
+    def inspect() -> Optional[SpooledUpload]:
+        source = upload.file
+        size = source.seek(0, os.SEEK_END)
+        if size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        if size == 0:
+            return None
+
+        source.seek(0)
+        head = source.read(MEDIA_SNIFF_BYTES)
+        if expected_formats is not None:
+            detected = sniff_media_format(head)
+            if detected not in expected_formats:
+                raise MediaFormatMismatch(detected)
+
+        digest = hashlib.sha256(head)
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+        source.seek(0)
+        return SpooledUpload(None, size, digest.hexdigest(), file=source)
+
+    return await asyncio.to_thread(inspect)
+
+def content_addressed_path(kind: str, sha256: str, extension: str) -> str:
+    """Object path for media stored under its content hash, shared by every testimonial with the same file"""
+    return f"{MEDIA_KINDS[kind]['prefix']}/sha256/{sha256}{extension}"
+
+def public_url(bucket: str, object_path: str) -> str:
+    """Public URL of an object in a public storage bucket"""
+    return f"{os.getenv('SUPABASE_URL')}/storage/v1/object/public/{bucket}/{object_path}"
+
+def storage_object_from_url(url: str) -> Optional[Tuple[str, str]]:
+    """(bucket, object path) of a public storage URL, or None for other URLs"""
+    marker = '/storage/v1/object/public/'
+    if not url or marker not in url:
+        return None
+    bucket, _, object_path = url.split(marker, 1)[1].split('?', 1)[0].partition('/')
+    return (bucket, object_path) if bucket and object_path else None
+
+class BlobBeingRemoved(RuntimeError):
+    """Raised when an identical file is still being removed from storage"""
+
+def acquire_blob(supabase: Client, bucket: str, object_path: str, sha256: str, size: int) -> Optional[int]:
+    """
+    Add a reference to a content-addressed object
+
+    While the last reference to the object is being released and the object
+    removed (a tombstone), no reference can be taken; the call waits for the
+    removal to finish, up to BLOB_REMOVAL_WAIT_SECONDS.
+
+    Returns:
+        The object's reference count including this one, or None if reference
+        counts are unavailable (the object is then left to the orphan GC)
+
+    Raises:
+        BlobBeingRemoved: If the removal did not finish in time
+    """
+    deadline = time.monotonic() + BLOB_REMOVAL_WAIT_SECONDS
+    while True:
+        try:
+            refs = supabase.rpc('acquire_media_blob', {
+                'p_bucket': bucket,
+                'p_path': object_path,
+                'p_sha256': sha256,
+                'p_size': size
+            }).execute().data
+        except Exception as e:
+            print(f"Media reference count error (blob left untracked): {str(e)}")
+            return None
+        if refs != 0:
+            return refs
+        if time.monotonic() >= deadline:
+            raise BlobBeingRemoved(f"An identical file is still being removed from storage: {object_path}")
+        time.sleep(BLOB_REMOVAL_POLL_SECONDS)
+
+def release_blob(supabase: Client, bucket: str, object_path: str) -> None:
+    """
+    Drop a reference to a content-addressed object, removing the object with its last reference
+
+    The last release leaves a tombstone that keeps new references out until
+    the object is removed; only then is the row deleted. If the removal
+    fails, the tombstone is taken over by the next upload of the same file
+    after its lease, or cleared by the orphan GC.
+    """
+    try:
+        remaining = supabase.rpc('release_media_blob', {'p_bucket': bucket, 'p_path': object_path}).execute().data
+    except Exception as e:
+        print(f"Media reference count error (blob kept): {str(e)}")
+        return
+    # None: the object was never tracked, so other testimonials may still use it
+    if remaining != 0:
+        return
+    supabase.storage.from_(bucket).remove([object_path])
+    try:
+        supabase.rpc('finish_media_blob_removal', {'p_bucket': bucket, 'p_path': object_path}).execute()
+    except Exception as e:
+        print(f"Media reference count error (tombstone left until its lease expires): {str(e)}")
+
+def release_media(supabase: Client, url: str) -> None:
+    """Release a testimonial's reference to a stored video or photo"""
+    storage_object = storage_object_from_url(url)
+    if storage_object is None:
+        return
+    bucket, object_path = storage_object
+    if '/sha256/' in object_path:
+        release_blob(supabase, bucket, object_path)
+    else:
+        # Stored per testimonial before content addressing
+        supabase.storage.from_(bucket).remove([object_path])
+
+def upload_to_storage(supabase: Client, bucket: str, object_path: str, spooled: SpooledUpload, content_type: str) -> str:
+    """
+    Stream a spooled file to a storage bucket
+
+    The storage client reads the file in chunks as it sends it, so the file
+    is never held in memory as a whole.
+
+    Returns:
+        Public URL of the stored object
+    """
+    try:
+        with spooled.open() as reader:
+            supabase.storage.from_(bucket).upload(
+                path=object_path,
+                file=reader,
+                file_options={"content-type": content_type}
+            )
+    except Exception as storage_error:
+        # Identical content maps to the same object path
+        if "already exists" not in str(storage_error).lower():
+            raise
+    return public_url(bucket, object_path)
+
+class DirectUploadError(ValueError):
+    """Raised when a direct upload cannot be issued or does not check out"""
+
+def file_extension(filename: Optional[str]) -> str:
+    """Lower-case extension of a filename including the dot, or '' if there is none"""
+    return '.' + filename.split('.')[-1].lower() if filename and '.' in filename else ''
+
+def direct_upload_prefix(kind: str, user_id: str) -> str:
+    """Object path prefix for files uploaded straight to storage for a collection link"""
+    return f"{MEDIA_KINDS[kind]['prefix']}/direct/{user_id}/"
+
+def create_direct_upload(supabase: Client, kind: str, user_id: str, filename: str) -> Dict[str, Any]:
+    """
+    Issue a signed URL the client can upload one file to, bypassing the API
+
+    The object path is generated here, under a prefix tied to the collection
+    link, so a submission can only reference paths this endpoint handed out.
+    Storage enforces the bucket size limit on the upload itself. The issue
+    time is part of the path, and verify_direct_upload refuses a file
+    uploaded more than SIGNED_UPLOAD_TTL_SECONDS later.
+
+    Returns:
+        bucket, path, signed_url, token and expires_in (seconds) for the upload
+    """
+    media = MEDIA_KINDS.get(kind)
+    if media is None:
+        raise DirectUploadError("Media type must be 'video' or 'photo'.")
+
+    extension = file_extension(filename)
+    if extension not in media['extensions']:
+        raise DirectUploadError(f"File type '{extension}' is not supported for {kind} uploads.")
+
+    object_path = f"{direct_upload_prefix(kind, user_id)}{int(time.time())}-{uuid.uuid4()}{extension}"
+    signed = supabase.storage.from_(media['bucket']).create_signed_upload_url(object_path)
+    return {
+        "bucket": media['bucket'],
+        "path": object_path,
+        "signed_url": signed['signed_url'],
+        "token": signed['token'],
+        "expires_in": SIGNED_UPLOAD_TTL_SECONDS
+    }
+
+def _uploaded_at(info: Dict[str, Any]) -> Optional[float]:
+    """Epoch seconds a storage object was written, from its info"""
+    metadata = info.get('metadata') or {}
+    value = info.get('created_at') or info.get('last_modified') or metadata.get('lastModified')
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)).timestamp()
+
+def verify_direct_upload(supabase: Client, kind: str, user_id: str, object_path: str) -> str:
+    """
+    Check a file the client uploaded through a signed URL before it is referenced
+
+    Costs one metadata request; the file itself is never downloaded.
+
+    Returns:
+        Public URL of the stored object
+
+    Raises:
+        DirectUploadError: If the path was not issued for this collection link,
+            the object does not exist, was uploaded after its URL expired, or
+            its size or type is not acceptable
+    """
+    media = MEDIA_KINDS[kind]
+    # Signed upload paths start with their issue time; resumable uploads are written by the API and have none
+    pattern = re.escape(direct_upload_prefix(kind, user_id)) + r"(?:(\d+)-)?[0-9a-f-]{36}\.[a-z0-9]+"
+    match = re.fullmatch(pattern, object_path or '')
+    if not match or file_extension(object_path) not in media['extensions']:
+        raise DirectUploadError(f"Invalid {kind} upload path. Please upload the file again.")
+
+    try:
+        info = supabase.storage.from_(media['bucket']).info(object_path)
+    except Exception:
+        raise DirectUploadError(f"The uploaded {kind} was not found. Please upload the file again.")
+
+    metadata = info.get('metadata') or {}
+    size = info.get('size', metadata.get('size'))
+    content_type = info.get('content_type', metadata.get('mimetype')) or ''
+    if size is None or not 0 < int(size) <= media['max_bytes']:
+        raise DirectUploadError(f"The uploaded {kind} is empty or too large.")
+    if not content_type.startswith(media['content_type_prefix']):
+        raise DirectUploadError(f"The uploaded file is not a valid {kind}.")
+
+    if match.group(1) is not None:
+        uploaded_at = _uploaded_at(info)
+        if uploaded_at is None or uploaded_at > int(match.group(1)) + SIGNED_UPLOAD_TTL_SECONDS:
+            raise DirectUploadError(f"The upload link for this {kind} expired. Please upload the file again.")
+
+    return public_url(media['bucket'], object_path)
+
+class PendingUpload:
+    """A spooled file waiting to be stored, with its destination"""
+
+    def __init__(self, bucket: str, object_path: str, spooled: SpooledUpload, content_type: str):
+        self.bucket = bucket
+        self.object_path = object_path
+        self.spooled = spooled
+        self.content_type = content_type
+        # Set once store_blob has taken a reference that must be released on failure
+        self.acquired = False
+
+class MediaUploadError(Exception):
+    """Raised when one of several concurrent uploads fails"""
+
+    def __init__(self, kind: str, error: BaseException):
+        self.kind = kind
+        self.error = error
+        super().__init__(str(error))
+
+def store_blob(supabase: Client, pending: PendingUpload) -> str:
+    """
+    Store a spooled file under its content-addressed path and take a reference
+
+    When the blob is already referenced and present in storage, the upload
+    is skipped entirely.
+
+    Returns:
+        Public URL of the stored object
+    """
+    refs = acquire_blob(supabase, pending.bucket, pending.object_path, pending.spooled.sha256, pending.spooled.size)
+    pending.acquired = refs is not None
+    try:
+        if refs is not None and refs > 1 and supabase.storage.from_(pending.bucket).exists(pending.object_path):
+            return public_url(pending.bucket, pending.object_path)
+        return upload_to_storage(supabase, pending.bucket, pending.object_path, pending.spooled, pending.content_type)
+    except BaseException:
+        if pending.acquired:
+            release_blob(supabase, pending.bucket, pending.object_path)
+            pending.acquired = False
+        raise
+
+async def upload_media(supabase: Client, uploads: Dict[str, PendingUpload]) -> Dict[str, str]:
+    """
+    Store several spooled files concurrently, all or nothing
+
+    Each upload runs in a worker thread, so a submission waits for the
+    slowest upload rather than the sum of them. Uploads already in flight
+    cannot be interrupted; if any upload fails, the others are allowed to
+    finish and their references are then released again.
+
+    Args:
+        uploads: Pending uploads keyed by media kind (e.g. "video", "photo")
+
+    Returns:
+        Public URL per media kind
+
+    Raises:
+        MediaUploadError: For the first failed upload, after cleanup
+    """
+    kinds = list(uploads)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(store_blob, supabase, pending) for pending in uploads.values()),
+        return_exceptions=True
+    )
+
+    urls: Dict[str, str] = {}
+    failure: Optional[MediaUploadError] = None
+    for kind, result in zip(kinds, results):
+        if isinstance(result, BaseException):
+            failure = failure or MediaUploadError(kind, result)
+        else:
+            urls[kind] = result
+
+    if failure is not None:
+        await release_uploaded(supabase, [uploads[kind] for kind in urls])
+        raise failure
+    return urls
+
+async def release_uploaded(supabase: Client, uploads: List[PendingUpload]) -> None:
+    """
+    Best-effort release of stored blobs; a blob still used by another testimonial is kept
+
+    Only uploads that took a reference are released. An upload stored while
+    reference counts were unavailable holds none, and releasing it would drop
+    another testimonial's reference; it is left to the orphan GC instead.
+    """
+    for pending in uploads:
+        if not pending.acquired:
+            continue
+        pending.acquired = False
+        try:
+            await asyncio.to_thread(release_blob, supabase, pending.bucket, pending.object_path)
+        except Exception as cleanup_error:
+            print(f"Failed to release uploaded media {pending.object_path}: {str(cleanup_error)}")
+
+class PayloadTooLarge(CustomHTTPException):
+    """Raised from the request body stream once it passes the path's limit"""
+
+    def __init__(self):
+        super().__init__(error_code=ErrorCodes.PAYLOAD_TOO_LARGE, status_code=413)
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware capping request body size for selected paths
+
+    A declared Content-Length over the limit is refused with 413 before any
+    of the body is read. Bodies without a (truthful) Content-Length are
+    counted as they stream in and cut off as soon as they pass the limit.
+    """
+
+    def __init__(self, app: Any, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        max_bytes = self.limits.get(scope.get('path')) if scope.get('type') == 'http' else None
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get('headers') or []:
+            if name == b'content-length':
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = None
+                if declared is not None and declared > max_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > max_bytes:
+                    raise PayloadTooLarge()
+            return message
+
+        async def tracking_send(message: Dict[str, Any]) -> None:
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except PayloadTooLarge:
+            if response_started:
+                raise
+            await self._reject(send)
+
+    async def _reject(self, send: Any) -> None:
+        error_response = create_error_response(ErrorCodes.PAYLOAD_TOO_LARGE, status_code=413)
+        body = json.dumps(error_response.to_dict()).encode('utf-8')
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('latin-1')),
+                (b'connection', b'close')
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Migration script to create the SQL functions behind the analytics endpoints.
+
+The aggregates are computed inside Postgres and returned as a single JSON
+document, so the API never has to pull every testimonial row to build charts.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+# Indexes that let the aggregate functions run as index range scans
+INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_testimonials_user_created_at ON testimonials(user_id, created_at DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_testimonials_user_category_rating ON testimonials(user_id, category, rating);",
+    "CREATE INDEX IF NOT EXISTS idx_testimonials_created_at_user ON testimonials(created_at DESC, user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_notification_logs_created_at ON notification_logs(created_at DESC);"
+]
+
+FUNCTIONS_SQL = [
+    # Rating histogram, category counts and mean rating per category for one user
+    """
+    CREATE OR REPLACE FUNCTION testimonial_distribution(
+        p_user_id UUID,
+        p_start TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+        p_end TIMESTAMP WITH TIME ZONE DEFAULT NULL
+    )
+    RETURNS JSONB
+    LANGUAGE sql
+    STABLE
+    AS $$
+        WITH filtered AS (
+            SELECT rating, COALESCE(NULLIF(category, ''), 'uncategorized') AS category
+            FROM testimonials
+            WHERE user_id = p_user_id
+              AND (p_start IS NULL OR created_at >= p_start)
+              AND (p_end IS NULL OR created_at < p_end)
+        )
+        SELECT jsonb_build_object(
+            'total', (SELECT count(*) FROM filtered),
+            'rated', (SELECT count(rating) FROM filtered),
+            'average_rating', (SELECT round(avg(rating)::numeric, 2) FROM filtered),
+            'rating_histogram', COALESCE((
+                SELECT jsonb_agg(jsonb_build_object('rating', rating, 'count', n) ORDER BY rating)
+                FROM (
+                    SELECT rating, count(*) AS n
+                    FROM filtered
+                    WHERE rating IS NOT NULL
+                    GROUP BY rating
+                ) r
+            ), '[]'::jsonb),
+            'category_counts', COALESCE((
+                SELECT jsonb_agg(jsonb_build_object('category', category, 'count', n) ORDER BY n DESC, category)
+                FROM (
+                    SELECT category, count(*) AS n
+                    FROM filtered
+                    GROUP BY category
+                ) c
+            ), '[]'::jsonb),
+            'rating_by_category', COALESCE((
+                SELECT jsonb_agg(jsonb_build_object(
+                    'category', category,
+                    'average_rating', round(avg_rating::numeric, 2),
+                    'rated_count', n
+                ) ORDER BY category)
+                FROM (
+                    SELECT category, avg(rating) AS avg_rating, count(*) AS n
+                    FROM filtered
+                    WHERE rating IS NOT NULL
+                    GROUP BY category
+                ) rc
+            ), '[]'::jsonb)
+        );
+    $$;
+    """,
+
+    # Platform-wide submissions bucketed by hour (admin analytics)
+    """
+    CREATE OR REPLACE FUNCTION admin_submissions_per_hour(p_since TIMESTAMP WITH TIME ZONE)
+    RETURNS TABLE (hour TIMESTAMP WITH TIME ZONE, submissions BIGINT, tenants BIGINT)
+    LANGUAGE sql
+    STABLE
+    AS $$
+        SELECT date_trunc('hour', created_at) AS hour,
+               count(*) AS submissions,
+               count(DISTINCT user_id) AS tenants
+        FROM testimonials
+        WHERE created_at >= p_since
+        GROUP BY 1
+        ORDER BY 1;
+    $$;
+    """,
+
+    # Tenants with the most submissions since a point in time (admin analytics)
+    """
+    CREATE OR REPLACE FUNCTION admin_top_tenants(p_since TIMESTAMP WITH TIME ZONE, p_limit INTEGER DEFAULT 10)
+    RETURNS TABLE (user_id UUID, submissions BIGINT, approved BIGINT, last_submission_at TIMESTAMP WITH TIME ZONE)
+    LANGUAGE sql
+    STABLE
+    AS $$
+        SELECT user_id,
+               count(*) AS submissions,
+               count(*) FILTER (WHERE approved) AS approved,
+               max(created_at) AS last_submission_at
+        FROM testimonials
+        WHERE created_at >= p_since
+        GROUP BY user_id
+        ORDER BY submissions DESC
+        LIMIT p_limit;
+    $$;
+    """,
+
+    # Notification delivery failure rate, overall and per notification type (admin analytics)
+    """
+    CREATE OR REPLACE FUNCTION admin_notification_failure_rate(p_since TIMESTAMP WITH TIME ZONE)
+    RETURNS JSONB
+    LANGUAGE sql
+    STABLE
+    AS $$
+        WITH per_type AS (
+            SELECT notification_type,
+                   count(*) AS total,
+                   count(*) FILTER (WHERE status = 'failed') AS failed
+            FROM notification_logs
+            WHERE created_at >= p_since
+            GROUP BY notification_type
+        )
+        SELECT jsonb_build_object(
+            'total', COALESCE(sum(total), 0),
+            'failed', COALESCE(sum(failed), 0),
+            'failure_rate', CASE WHEN COALESCE(sum(total), 0) = 0 THEN 0
+                                 ELSE round(sum(failed)::numeric * 100 / sum(total), 2) END,
+            'by_type', COALESCE(jsonb_agg(jsonb_build_object(
+                'notification_type', notification_type,
+                'total', total,
+                'failed', failed,
+                'failure_rate', round(failed::numeric * 100 / total, 2)
+            ) ORDER BY notification_type), '[]'::jsonb)
+        )
+        FROM per_type;
+    $$;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the analytics functions migration"""
+    print("🚀 Starting analytics functions migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        print("🔍 Creating indexes...")
+        for index_sql in INDEXES_SQL:
+            try:
+                supabase.rpc('exec_sql', {'sql': index_sql}).execute()
+                print(f"✅ Index created: {index_sql.split('ON')[1].split('(')[0].strip()}")
+            except Exception as e:
+                print(f"⚠️  Index creation warning: {str(e)}")
+
+        print("📋 Creating analytics functions...")
+        for function_sql in FUNCTIONS_SQL:
+            supabase.rpc('exec_sql', {'sql': function_sql}).execute()
+            function_name = function_sql.split('FUNCTION')[1].split('(')[0].strip()
+            print(f"✅ Function created: {function_name}")
+
+        print("\n🎉 Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
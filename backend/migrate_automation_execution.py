@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Migration script to support running automation rules on testimonial submission
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    # Flags set by spam_detection rules (e.g. "potential_spam")
+    """
+    ALTER TABLE testimonials
+    ADD COLUMN IF NOT EXISTS flags JSONB NOT NULL DEFAULT '[]';
+    """,
+
+    # Serves the per-user "enabled rules by priority" lookup on the submit path
+    """
+    CREATE INDEX IF NOT EXISTS idx_automation_rules_user_enabled_priority
+    ON automation_rules(user_id, priority DESC) WHERE enabled = true;
+    """,
+
+    """
+    CREATE INDEX IF NOT EXISTS idx_testimonials_flags
+    ON testimonials USING GIN (flags);
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the automation execution migration"""
+    print("🚀 Starting automation execution migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Added flags column to testimonials")
+        print("  ✅ Created index for enabled rules by priority")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
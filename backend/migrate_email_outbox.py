@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Migration script for the persistent email outbox
+
+Emails are stored in email_outbox and sent by background workers, which
+claim batches with claim_email_outbox (FOR UPDATE SKIP LOCKED, so several
+API instances never claim the same email), retry failures with exponential
+backoff and record the final status on the row.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    # status: pending -> sending -> sent, or back to pending for a retry, or failed
+    """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id UUID,
+        email_type TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        data JSONB,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        locked_at TIMESTAMP WITH TIME ZONE,
+        last_error TEXT,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        sent_at TIMESTAMP WITH TIME ZONE
+    );
+    """,
+
+    """
+    CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+    ON email_outbox(next_attempt_at)
+    WHERE status IN ('pending', 'sending');
+    """,
+
+    # Claims due emails, plus emails whose worker died mid-send (lease expired)
+    """
+    CREATE OR REPLACE FUNCTION claim_email_outbox(p_limit INTEGER, p_lease_seconds INTEGER)
+    RETURNS SETOF email_outbox
+    LANGUAGE sql
+    AS $$
+        UPDATE email_outbox o
+        SET status = 'sending',
+            locked_at = NOW(),
+            attempts = o.attempts + 1
+        WHERE o.id IN (
+            SELECT id
+            FROM email_outbox
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+               OR (status = 'sending' AND locked_at < NOW() - make_interval(secs => p_lease_seconds))
+            ORDER BY next_attempt_at
+            LIMIT p_limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING o.*;
+    $$;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the email outbox migration"""
+    print("🚀 Starting email outbox migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Created email_outbox table")
+        print("  ✅ Created claim_email_outbox function")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
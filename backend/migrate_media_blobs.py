@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Migration script to reference-count content-addressed media
+
+Uploaded videos and photos are stored under the SHA-256 of their content,
+so the same file submitted twice is stored once. media_blobs counts the
+testimonials using each object; deleting a testimonial only removes the
+object from storage when its last reference goes. The row stays behind as
+a tombstone (deleting_at set) until the object is gone, so a concurrent
+submission of the same file waits instead of reusing an object about to
+be removed.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS media_blobs (
+        bucket TEXT NOT NULL,
+        path TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        size BIGINT NOT NULL,
+        ref_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        PRIMARY KEY (bucket, path)
+    );
+    """,
+
+    # Set while the object of a released blob is being removed from storage
+    """
+    ALTER TABLE media_blobs
+    ADD COLUMN IF NOT EXISTS deleting_at TIMESTAMP WITH TIME ZONE;
+    """,
+
+    # Adds a reference and returns the new count (1 means the object must be uploaded),
+    # or 0 while the object is being removed. A removal not finished within two minutes
+    # is taken over: the blob is revived and uploaded again.
+    """
+    CREATE OR REPLACE FUNCTION acquire_media_blob(p_bucket TEXT, p_path TEXT, p_sha256 TEXT, p_size BIGINT)
+    RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        refs INTEGER;
+    BEGIN
+        INSERT INTO media_blobs (bucket, path, sha256, size, ref_count)
+        VALUES (p_bucket, p_path, p_sha256, p_size, 1)
+        ON CONFLICT (bucket, path) DO UPDATE
+        SET ref_count = CASE WHEN media_blobs.deleting_at IS NULL THEN media_blobs.ref_count + 1 ELSE 1 END,
+            deleting_at = NULL,
+            updated_at = NOW()
+        WHERE media_blobs.deleting_at IS NULL
+           OR media_blobs.deleting_at < NOW() - INTERVAL '2 minutes'
+        RETURNING ref_count INTO refs;
+
+        RETURN COALESCE(refs, 0);
+    END;
+    $$;
+    """,
+
+    # Drops a reference and returns the remaining count, or NULL for an object that is not
+    # tracked. At 0 the row becomes a tombstone: the caller removes the object, then calls
+    # finish_media_blob_removal.
+    """
+    CREATE OR REPLACE FUNCTION release_media_blob(p_bucket TEXT, p_path TEXT)
+    RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        remaining INTEGER;
+    BEGIN
+        UPDATE media_blobs
+        SET ref_count = GREATEST(ref_count - 1, 0),
+            deleting_at = CASE WHEN ref_count <= 1 THEN NOW() END,
+            updated_at = NOW()
+        WHERE bucket = p_bucket AND path = p_path AND deleting_at IS NULL
+        RETURNING ref_count INTO remaining;
+
+        RETURN remaining;
+    END;
+    $$;
+    """,
+
+    # Deletes the tombstone once its object is removed (unless the blob was taken over meanwhile)
+    """
+    CREATE OR REPLACE FUNCTION finish_media_blob_removal(p_bucket TEXT, p_path TEXT)
+    RETURNS VOID
+    LANGUAGE sql
+    AS $$
+        DELETE FROM media_blobs
+        WHERE bucket = p_bucket AND path = p_path AND ref_count = 0 AND deleting_at IS NOT NULL;
+    $$;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the media blobs migration"""
+    print("🚀 Starting media blobs migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Created media_blobs table")
+        print("  ✅ Added deleting_at column (tombstones for blobs being removed)")
+        print("  ✅ Created acquire_media_blob, release_media_blob and finish_media_blob_removal functions")
+        print("\nℹ️  Media uploaded before this migration keeps its per-testimonial path and is removed with its testimonial")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Migration script to store derived media on testimonials
+
+Photo variants (resized WebP files keyed by width), video poster frames and
+optional HLS packages are generated in the background after a testimonial
+is saved, so widgets can show small images and stream adaptively instead of
+loading the original uploads.
+"""
+
+import asyncio
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+from media_processing import media_processor
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    # {"160": url, "480": url, ...}; NULL until processed
+    """
+    ALTER TABLE testimonials
+    ADD COLUMN IF NOT EXISTS photo_variants JSONB,
+    ADD COLUMN IF NOT EXISTS video_poster_url TEXT,
+    ADD COLUMN IF NOT EXISTS video_hls_url TEXT;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the media variants migration"""
+    print("🚀 Starting media variants migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        if media_processor.available:
+            print("🔄 Processing media of existing testimonials...")
+            updated = asyncio.run(media_processor.backfill(supabase))
+            print(f"✅ Processed media of {updated} testimonials")
+        else:
+            print("⚠️  Pillow and ffmpeg not found; skipping existing testimonials")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Added photo_variants, video_poster_url and video_hls_url columns to testimonials")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
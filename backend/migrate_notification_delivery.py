@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Migration script to track new-testimonial notification delivery
+
+Notifications are sent by background workers after the submission has been
+answered. notified_at records that a testimonial's notification went out,
+and notification_claimed_at that a worker is sending it, so unsent
+notifications can be found and retried after a failure or restart.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    """
+    ALTER TABLE testimonials
+    ADD COLUMN IF NOT EXISTS notified_at TIMESTAMP WITH TIME ZONE,
+    ADD COLUMN IF NOT EXISTS notification_claimed_at TIMESTAMP WITH TIME ZONE;
+    """,
+
+    # Existing testimonials were notified inline when they were submitted
+    """
+    UPDATE testimonials
+    SET notified_at = created_at
+    WHERE notified_at IS NULL;
+    """,
+
+    # Keeps the recovery sweep's lookup of unsent notifications small
+    """
+    CREATE INDEX IF NOT EXISTS idx_testimonials_unnotified
+    ON testimonials(created_at)
+    WHERE notified_at IS NULL;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the notification delivery migration"""
+    print("🚀 Starting notification delivery migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Added notified_at and notification_claimed_at columns to testimonials")
+        print("  ✅ Marked existing testimonials as notified")
+        print("  ✅ Created index for unsent notifications")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Migration script to store lexicon sentiment scores on testimonials
+
+Scores are computed once per testimonial (at submission, or by the backfill
+below), so sentiment charts and rule conditions read a plain indexed column.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+from sentiment import SentimentService
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    # Score from -1 (negative) to 1 (positive); NULL until scored
+    """
+    ALTER TABLE testimonials
+    ADD COLUMN IF NOT EXISTS sentiment_score REAL;
+    """,
+
+    """
+    CREATE INDEX IF NOT EXISTS idx_testimonials_user_sentiment
+    ON testimonials(user_id, sentiment_score);
+    """,
+
+    # Writes a page of backfilled scores in one UPDATE
+    """
+    CREATE OR REPLACE FUNCTION set_sentiment_scores(p_scores JSONB)
+    RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        updated_count INTEGER;
+    BEGIN
+        UPDATE testimonials t
+        SET sentiment_score = s.score
+        FROM jsonb_to_recordset(p_scores) AS s(id UUID, score REAL)
+        WHERE t.id = s.id;
+
+        GET DIAGNOSTICS updated_count = ROW_COUNT;
+        RETURN updated_count;
+    END;
+    $$;
+    """,
+
+    # Sentiment buckets, average and daily trend for one user
+    """
+    CREATE OR REPLACE FUNCTION testimonial_sentiment(
+        p_user_id UUID,
+        p_start TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+        p_end TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+        p_positive REAL DEFAULT 0.05,
+        p_negative REAL DEFAULT -0.05
+    )
+    RETURNS JSONB
+    LANGUAGE sql
+    STABLE
+    AS $$
+        WITH scored AS (
+            SELECT sentiment_score, created_at
+            FROM testimonials
+            WHERE user_id = p_user_id
+              AND sentiment_score IS NOT NULL
+              AND (p_start IS NULL OR created_at >= p_start)
+              AND (p_end IS NULL OR created_at < p_end)
+        )
+        SELECT jsonb_build_object(
+            'scored', (SELECT count(*) FROM scored),
+            'average_score', (SELECT round(avg(sentiment_score)::numeric, 3) FROM scored),
+            'positive', (SELECT count(*) FROM scored WHERE sentiment_score >= p_positive),
+            'negative', (SELECT count(*) FROM scored WHERE sentiment_score <= p_negative),
+            'neutral', (SELECT count(*) FROM scored WHERE sentiment_score > p_negative AND sentiment_score < p_positive),
+            'daily_trend', COALESCE((
+                SELECT jsonb_agg(jsonb_build_object(
+                    'date', day,
+                    'average_score', round(avg_score::numeric, 3),
+                    'count', n
+                ) ORDER BY day)
+                FROM (
+                    SELECT date_trunc('day', created_at)::date AS day, avg(sentiment_score) AS avg_score, count(*) AS n
+                    FROM scored
+                    GROUP BY 1
+                ) d
+            ), '[]'::jsonb)
+        );
+    $$;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the sentiment scores migration"""
+    print("🚀 Starting sentiment scores migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("🔄 Scoring existing testimonials...")
+        updated = SentimentService(supabase).backfill()
+        print(f"✅ Scored {updated} testimonials")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Added sentiment_score column to testimonials")
+        print("  ✅ Created index on (user_id, sentiment_score)")
+        print("  ✅ Created set_sentiment_scores and testimonial_sentiment functions")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Migration script to add near-duplicate fingerprints to testimonials
+
+Each testimonial stores a 64-bit SimHash of its normalized text and the
+fingerprint's band keys. A GIN index on the band keys finds every earlier
+testimonial sharing a band, and the SQL function below compares only those.
+"""
+
+import os
+import sys
+from supabase import create_client, Client
+from dotenv import load_dotenv
+from fingerprint import FingerprintService
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+    sys.exit(1)
+
+MIGRATION_SQL = [
+    """
+    ALTER TABLE testimonials
+    ADD COLUMN IF NOT EXISTS simhash BIGINT,
+    ADD COLUMN IF NOT EXISTS simhash_bands INTEGER[],
+    ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES testimonials(id) ON DELETE SET NULL;
+    """,
+
+    # Lets user_id share one GIN index with the band keys
+    """
+    CREATE EXTENSION IF NOT EXISTS btree_gin;
+    """,
+
+    # Band keys encode their position, so array overlap means "some band is identical"
+    """
+    CREATE INDEX IF NOT EXISTS idx_testimonials_user_simhash_bands
+    ON testimonials USING GIN (user_id, simhash_bands);
+    """,
+
+    # Closest earlier testimonial of the same user within a Hamming distance
+    """
+    CREATE OR REPLACE FUNCTION find_near_duplicate_testimonial(
+        p_user_id UUID,
+        p_simhash BIGINT,
+        p_bands INTEGER[],
+        p_max_distance INTEGER
+    )
+    RETURNS TABLE (id UUID, distance INTEGER)
+    LANGUAGE sql
+    STABLE
+    AS $$
+        SELECT id, distance
+        FROM (
+            SELECT t.id, t.created_at, bit_count((t.simhash # p_simhash)::bit(64))::INTEGER AS distance
+            FROM testimonials t
+            WHERE t.user_id = p_user_id
+              AND t.simhash_bands && p_bands
+        ) candidates
+        WHERE distance <= p_max_distance
+        ORDER BY distance, created_at
+        LIMIT 1;
+    $$;
+    """,
+
+    # Writes a page of backfilled fingerprints in one UPDATE
+    """
+    CREATE OR REPLACE FUNCTION set_testimonial_fingerprints(p_rows JSONB)
+    RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        updated_count INTEGER;
+    BEGIN
+        UPDATE testimonials t
+        SET simhash = f.simhash,
+            simhash_bands = f.simhash_bands
+        FROM jsonb_to_recordset(p_rows) AS f(id UUID, simhash BIGINT, simhash_bands INTEGER[])
+        WHERE t.id = f.id;
+
+        GET DIAGNOSTICS updated_count = ROW_COUNT;
+        RETURN updated_count;
+    END;
+    $$;
+    """
+]
+
+def create_supabase_client() -> Client:
+    """Create Supabase client"""
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        print(f"❌ Failed to create Supabase client: {str(e)}")
+        sys.exit(1)
+
+def run_migration():
+    """Run the testimonial fingerprints migration"""
+    print("🚀 Starting testimonial fingerprints migration...")
+
+    try:
+        supabase = create_supabase_client()
+
+        for i, sql in enumerate(MIGRATION_SQL, 1):
+            try:
+                print(f"🔄 Executing migration {i}/{len(MIGRATION_SQL)}...")
+                supabase.rpc('exec_sql', {'sql': sql}).execute()
+                print(f"✅ Migration {i} completed successfully")
+            except Exception as e:
+                print(f"⚠️  Migration {i} warning (may already exist): {str(e)}")
+
+        print("🔄 Fingerprinting existing testimonials...")
+        updated = FingerprintService(supabase).backfill()
+        print(f"✅ Fingerprinted {updated} testimonials")
+
+        print("\n🎉 Migration completed successfully!")
+        print("\n📋 Summary of changes:")
+        print("  ✅ Added simhash, simhash_bands and duplicate_of columns to testimonials")
+        print("  ✅ Created per-user GIN index on fingerprint band keys")
+        print("  ✅ Created find_near_duplicate_testimonial and set_testimonial_fingerprints functions")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_migration()
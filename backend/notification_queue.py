@@ -0,0 +1,174 @@
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import os
+from supabase import Client
+from notification_service import NotificationService
+
+# Concurrent notification sends
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+
+# Notifications waiting in memory; beyond this they are left to the recovery sweep
+NOTIFICATION_MAX_PENDING = int(os.getenv("NOTIFICATION_MAX_PENDING", "1000"))
+
+# Attempts per notification before it is left to the recovery sweep, with exponential backoff in between
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "4"))
+NOTIFICATION_RETRY_BASE_SECONDS = 2
+
+# A claimed notification not marked sent after this many seconds is claimed again (its worker died mid-send)
+NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", "300"))
+
+# Seconds between sweeps for unsent notifications, and how far back the sweep looks
+NOTIFICATION_SWEEP_INTERVAL = int(os.getenv("NOTIFICATION_SWEEP_INTERVAL", "60"))
+NOTIFICATION_RECOVERY_HOURS = int(os.getenv("NOTIFICATION_RECOVERY_HOURS", "24"))
+
+# Seconds a shutdown waits for queued notifications before leaving them to the next start
+NOTIFICATION_SHUTDOWN_TIMEOUT = 10
+
+class NotificationQueue:
+    """
+    Sends new-testimonial notifications from background workers, at least once
+
+    The submit request only enqueues the notification after the testimonial
+    row is saved. The row itself is the durable record: notified_at is set
+    once the notification is sent, and notification_claimed_at keeps two
+    workers (or API instances) from sending it at the same time. A periodic
+    sweep re-enqueues testimonials that were never marked notified, so
+    notifications lost to a full queue, a restart or a failed send are
+    retried; a crash between sending and marking can send one twice.
+    """
+
+    def __init__(self, workers: int = NOTIFICATION_WORKERS, max_pending: int = NOTIFICATION_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._client_factory: Optional[Callable[[], Client]] = None
+
+    def start(self, client_factory: Callable[[], Client]) -> None:
+        """Start the workers and the recovery sweep on the running event loop"""
+        self._client_factory = client_factory
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self) -> None:
+        """Give queued notifications a moment to finish, then stop; the rest are recovered on the next start"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), NOTIFICATION_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Notification queue stopped with {self._queue.qsize()} notifications pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def enqueue(self, supabase: Client, testimonial_id: str, user_id: str, testimonial_data: Dict[str, Any]) -> bool:
+        """
+        Queue the notification for a saved testimonial without waiting for it
+
+        Returns:
+            Whether it was queued; otherwise the recovery sweep sends it later
+        """
+        if not self._tasks:
+            self.start(self._client_factory or (lambda: supabase))
+        try:
+            self._queue.put_nowait((testimonial_id, user_id, testimonial_data))
+            return True
+        except asyncio.QueueFull:
+            print(f"Notification queue full; testimonial {testimonial_id} left to the recovery sweep")
+            return False
+
+    def _claim(self, supabase: Client, testimonial_id: str) -> bool:
+        """Mark a notification as being sent unless it was sent or another worker holds it"""
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=NOTIFICATION_CLAIM_TIMEOUT)).isoformat()
+        try:
+            result = supabase.table('testimonials').update({'notification_claimed_at': now.isoformat()}).eq(
+                'id', testimonial_id
+            ).is_('notified_at', 'null').or_(
+                f'notification_claimed_at.is.null,notification_claimed_at.lt.{stale}'
+            ).execute()
+        except Exception as e:
+            print(f"Notification claim error (sending unclaimed): {str(e)}")
+            return True
+        return bool(result.data)
+
+    def _mark_notified(self, supabase: Client, testimonial_id: str) -> None:
+        try:
+            supabase.table('testimonials').update({'notified_at': datetime.utcnow().isoformat()}).eq('id', testimonial_id).execute()
+        except Exception as e:
+            print(f"Error marking testimonial {testimonial_id} notified: {str(e)}")
+
+    async def _send(self, testimonial_id: str, user_id: str, testimonial_data: Dict[str, Any]) -> None:
+        """Claim, send with retries and mark one notification"""
+        supabase = self._client_factory()
+        if not await asyncio.to_thread(self._claim, supabase, testimonial_id):
+            return
+
+        notification_service = NotificationService(supabase)
+        for attempt in range(NOTIFICATION_MAX_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            result = await notification_service.trigger_new_testimonial_notification(user_id, testimonial_data)
+            # Missing preferences or disabled notifications are final; failed sends are retried
+            if result.get('success') or not result.get('retryable'):
+                await asyncio.to_thread(self._mark_notified, supabase, testimonial_id)
+                return
+            print(f"Notification for testimonial {testimonial_id} failed (attempt {attempt + 1}): {result.get('error')}")
+        print(f"Notification for testimonial {testimonial_id} left to the recovery sweep after {NOTIFICATION_MAX_ATTEMPTS} attempts")
+
+    async def _worker(self) -> None:
+        while True:
+            testimonial_id, user_id, testimonial_data = await self._queue.get()
+            try:
+                await self._send(testimonial_id, user_id, testimonial_data)
+            except Exception as e:
+                print(f"Notification error for testimonial {testimonial_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _unsent(self, supabase: Client) -> List[Dict[str, Any]]:
+        """Recent testimonials never marked notified and not claimed by a live worker"""
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=NOTIFICATION_CLAIM_TIMEOUT)).isoformat()
+        return supabase.table('testimonials').select('id, user_id, name, text').is_('notified_at', 'null').gte(
+            'created_at', (now - timedelta(hours=NOTIFICATION_RECOVERY_HOURS)).isoformat()
+        ).lt('created_at', stale).or_(
+            f'notification_claimed_at.is.null,notification_claimed_at.lt.{stale}'
+        ).order('created_at').limit(self.max_pending).execute().data or []
+
+    async def recover(self) -> int:
+        """Re-enqueue unsent notifications; returns how many were queued"""
+        if self._client_factory is None or self._queue is None:
+            return 0
+        testimonials = await asyncio.to_thread(self._unsent, self._client_factory())
+        queued = 0
+        for testimonial in testimonials:
+            if self._queue.full():
+                break
+            self._queue.put_nowait((
+                testimonial['id'],
+                testimonial['user_id'],
+                {"name": testimonial['name'], "text": testimonial['text'], "id": testimonial['id']}
+            ))
+            queued += 1
+        return queued
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                queued = await self.recover()
+                if queued:
+                    print(f"Re-queued {queued} unsent testimonial notifications")
+            except Exception as e:
+                print(f"Notification recovery error: {str(e)}")
+            await asyncio.sleep(NOTIFICATION_SWEEP_INTERVAL)
+
+# Global notification queue
+notification_queue = NotificationQueue()
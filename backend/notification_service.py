@@ -82,22 +82,25 @@ class NotificationService:
             # Send email notification
             email_result = await email_service.send_new_testimonial_notification(
                 preferences['email'], 
-                testimonial_data
+                testimonial_data,
+                user_id=user_id
             )
             
-            # Log the notification
-            await self._log_notification(
-                user_id=user_id,
-                notification_type="new_testimonial",
-                status="sent" if email_result['success'] else "failed",
-                data=testimonial_data
-            )
+            # Log the notification (queued emails are logged by the outbox once delivered or failed)
+            if not email_result.get('queued'):
+                await self._log_notification(
+                    user_id=user_id,
+                    notification_type="new_testimonial",
+                    status="sent" if email_result['success'] else "failed",
+                    data=testimonial_data
+                )
             
-            return email_result
+            # A failed send is worth retrying; missing preferences are not
+            return {**email_result, "retryable": not email_result['success']}
             
         except Exception as e:
             print(f"Error triggering new testimonial notification: {str(e)}")
-            return {"success": False, "error": str(e)}
+            return {"success": False, "error": str(e), "retryable": True}
     
     async def send_weekly_summary(self, user_id: str) -> Dict[str, Any]:
         """Send weekly summary email to user"""
@@ -119,16 +122,18 @@ class NotificationService:
             # Send email
             email_result = await email_service.send_weekly_summary(
                 preferences['email'], 
-                summary_data
+                summary_data,
+                user_id=user_id
             )
             
-            # Log the notification
-            await self._log_notification(
-                user_id=user_id,
-                notification_type="weekly_summary",
-                status="sent" if email_result['success'] else "failed",
-                data=summary_data
-            )
+            # Log the notification (queued emails are logged by the outbox once delivered or failed)
+            if not email_result.get('queued'):
+                await self._log_notification(
+                    user_id=user_id,
+                    notification_type="weekly_summary",
+                    status="sent" if email_result['success'] else "failed",
+                    data=summary_data
+                )
             
             return email_result
             
@@ -161,16 +166,18 @@ class NotificationService:
             # Send email
             email_result = await email_service.send_pending_reminder(
                 preferences['email'], 
-                pending_count
+                pending_count,
+                user_id=user_id
             )
             
-            # Log the notification
-            await self._log_notification(
-                user_id=user_id,
-                notification_type="pending_reminder",
-                status="sent" if email_result['success'] else "failed",
-                data={"pending_count": pending_count}
-            )
+            # Log the notification (queued emails are logged by the outbox once delivered or failed)
+            if not email_result.get('queued'):
+                await self._log_notification(
+                    user_id=user_id,
+                    notification_type="pending_reminder",
+                    status="sent" if email_result['success'] else "failed",
+                    data={"pending_count": pending_count}
+                )
             
             return email_result
             
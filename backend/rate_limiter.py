@@ -0,0 +1,198 @@
+from typing import Dict, Optional, Any, Tuple
+from collections import OrderedDict
+import json
+import math
+import os
+import time
+from error_handler import ErrorCodes, handle_rate_limit_error, error_monitor
+
+# Optional shared backend (pip install redis)
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+# Buckets are shared across API instances through Redis when configured
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+# Only trust X-Forwarded-For when the API runs behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+# Maximum buckets held by the in-memory backend
+MAX_MEMORY_BUCKETS = 100000
+
+class RateLimit:
+    """Token bucket parameters: up to `capacity` requests, refilled evenly over `period_seconds`"""
+
+    def __init__(self, capacity: int, period_seconds: float):
+        self.capacity = capacity
+        self.period_seconds = period_seconds
+        self.refill_per_second = capacity / period_seconds
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse "<requests>/<seconds>", e.g. "10/60" """
+        requests, seconds = value.split('/')
+        return cls(int(requests), float(seconds))
+
+# Submissions from one client IP, and to one collection link (user_id) from all clients
+SUBMIT_PER_IP_LIMIT = RateLimit.parse(os.getenv("RATE_LIMIT_SUBMIT_PER_IP", "10/60"))
+SUBMIT_PER_USER_LIMIT = RateLimit.parse(os.getenv("RATE_LIMIT_SUBMIT_PER_USER", "60/60"))
+
+# Signed upload URLs from one client IP (a submission needs at most two)
+SIGNED_UPLOAD_PER_IP_LIMIT = RateLimit.parse(os.getenv("RATE_LIMIT_SIGNED_UPLOAD_PER_IP", "20/60"))
+
+class InMemoryRateLimitBackend:
+    """
+    Token buckets held in process memory
+
+    Buckets are kept in least-recently-used order, so the oldest ones can be
+    dropped in O(1) when the table is full; a dropped bucket starts over full.
+    """
+
+    def __init__(self, max_buckets: int = MAX_MEMORY_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def consume(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_per_second)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+
+        retry_after = 0.0 if allowed else (1 - tokens) / limit.refill_per_second
+        return allowed, retry_after
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all API instances, updated atomically in Redis"""
+
+    # Refill and take a token in one round trip, using Redis' clock so instances agree
+    CONSUME_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill_per_ms = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * refill_per_ms)
+
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_per_ms))
+
+    local retry_after_ms = 0
+    if allowed == 0 then
+        retry_after_ms = math.ceil((1 - tokens) / refill_per_ms)
+    end
+    return {allowed, retry_after_ms}
+    """
+
+    def __init__(self, url: str):
+        self.client = redis_asyncio.from_url(url)
+        self._script = self.client.register_script(self.CONSUME_SCRIPT)
+
+    async def consume(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        allowed, retry_after_ms = await self._script(
+            keys=[f"rate_limit:{key}"],
+            args=[limit.capacity, limit.refill_per_second / 1000]
+        )
+        return bool(allowed), int(retry_after_ms) / 1000
+
+class RateLimiter:
+    """Token bucket rate limiting over a pluggable backend"""
+
+    def __init__(self, backend: Any, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+
+    async def check(self, scope: str, identifier: str, limit: RateLimit) -> Tuple[bool, float]:
+        """
+        Take one token from the bucket for (scope, identifier)
+
+        Fails open: if the backend is unavailable the request is allowed.
+
+        Returns:
+            Whether the request is allowed, and seconds until a token is available
+        """
+        if not self.enabled or not identifier:
+            return True, 0.0
+        try:
+            return await self.backend.consume(f"{scope}:{identifier}", limit)
+        except Exception as e:
+            print(f"Rate limiter error (allowing request): {str(e)}")
+            return True, 0.0
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the rate limiter from the environment (Redis when configured, otherwise in-memory)"""
+    if RATE_LIMIT_REDIS_URL and redis_asyncio is not None:
+        backend = RedisRateLimitBackend(RATE_LIMIT_REDIS_URL)
+    else:
+        if RATE_LIMIT_REDIS_URL:
+            print("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using in-memory rate limits")
+        backend = InMemoryRateLimitBackend()
+    return RateLimiter(backend, enabled=RATE_LIMIT_ENABLED)
+
+# Global rate limiter instance
+rate_limiter = create_rate_limiter()
+
+def retry_after_header(retry_after: float) -> Dict[str, str]:
+    """Retry-After header value in whole seconds (at least 1)"""
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+def client_ip(scope: Dict[str, Any]) -> Optional[str]:
+    """Client IP of an ASGI request"""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope.get('headers') or []:
+            if name == b'x-forwarded-for':
+                return value.decode('latin-1').split(',')[0].strip()
+    client = scope.get('client')
+    return client[0] if client else None
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying per-IP token buckets to selected POST paths
+
+    Runs before the request body is read, so rejected requests never reach
+    the endpoint, storage or the database.
+    """
+
+    def __init__(self, app: Any, limiter: RateLimiter, limits: Dict[str, RateLimit]):
+        self.app = app
+        self.limiter = limiter
+        self.limits = limits
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        limit = self.limits.get(scope.get('path')) if scope.get('type') == 'http' and scope.get('method') == 'POST' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, retry_after = await self.limiter.check(f"ip:{scope['path']}", client_ip(scope), limit)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        # Counted without context so a flood does not grow the monitor's history
+        error_monitor.record_error(ErrorCodes.RATE_LIMIT_EXCEEDED)
+        body = json.dumps(handle_rate_limit_error(retry_after).to_dict()).encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1'))
+        ] + [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in retry_after_header(retry_after).items()]
+        await send({"type": "http.response.start", "status": 429, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,276 @@
+from typing import AsyncIterator, Dict, Iterator, Optional, Any
+from contextlib import contextmanager
+import asyncio
+import fcntl
+import json
+import mimetypes
+import os
+import tempfile
+import time
+import uuid
+from supabase import Client
+from media_upload import (
+    MEDIA_KINDS,
+    MEDIA_SNIFF_BYTES,
+    SpooledUpload,
+    direct_upload_prefix,
+    expected_media_formats,
+    file_extension,
+    sniff_media_format,
+    upload_to_storage
+)
+
+# Directory holding partial uploads (must be shared by all API workers that serve them;
+# requests for one upload are serialized with flock, so a shared filesystem must support it)
+RESUMABLE_UPLOAD_DIR = os.getenv("RESUMABLE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "testimonial-resumable"))
+
+# Upload sessions with no activity for this many seconds are deleted
+RESUMABLE_UPLOAD_TTL = int(os.getenv("RESUMABLE_UPLOAD_TTL", "86400"))
+
+# Minimum seconds between two sweeps for expired sessions
+EXPIRY_SWEEP_INTERVAL = 60
+
+class ResumableUploadError(ValueError):
+    """Raised for a resumable upload request that cannot be applied"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        self.status_code = status_code
+        super().__init__(message)
+
+class UploadSession:
+    """A resumable upload: its destination, declared length and bytes received so far"""
+
+    def __init__(self, upload_id: str, user_id: str, media_type: str, filename: str,
+                 content_type: str, length: int, offset: int = 0, path: Optional[str] = None):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.media_type = media_type
+        self.filename = filename
+        self.content_type = content_type
+        self.length = length
+        self.offset = offset
+        # Storage path once finalized
+        self.path = path
+
+    @property
+    def finalized(self) -> bool:
+        return self.path is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "user_id": self.user_id,
+            "media_type": self.media_type,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "length": self.length,
+            "path": self.path
+        }
+
+class ResumableUploadStore:
+    """
+    tus-style resumable uploads backed by files on local disk
+
+    Each session is a metadata file plus a data file the chunks are appended
+    to. The data file's size is the upload offset, so every chunk written
+    before a dropped connection counts and the client resumes from there.
+    Sessions idle for longer than the TTL are swept on the next create.
+
+    Appends and finalizes of one upload hold an exclusive flock on its data
+    file, so they are serialized across processes and instances sharing the
+    directory; a request arriving while another holds the lock is rejected
+    with 409 and retried by the client.
+    """
+
+    def __init__(self, directory: str = RESUMABLE_UPLOAD_DIR, ttl_seconds: int = RESUMABLE_UPLOAD_TTL):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._last_sweep = 0.0
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _write_meta(self, session: UploadSession) -> None:
+        meta_path = self._meta_path(session.upload_id)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump(session.to_dict(), meta_file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @contextmanager
+    def _lock(self, upload_id: str) -> Iterator[None]:
+        """Hold the upload's data file locked; a finalized or expired upload has nothing to lock"""
+        try:
+            uuid.UUID(upload_id)
+            lock_file = open(self._data_path(upload_id), 'rb')
+        except (ValueError, FileNotFoundError):
+            yield
+            return
+        try:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ResumableUploadError("Upload is busy with another request. Check its offset and retry.", status_code=409)
+            yield
+        finally:
+            # Closing the file releases the lock
+            lock_file.close()
+
+    def _check_format(self, session: UploadSession, chunk: bytes) -> None:
+        """Reject a chunk that completes the file signature with the wrong container format"""
+        with open(self._data_path(session.upload_id), 'rb') as data_file:
+            head = data_file.read(session.offset) + chunk
+        if len(head) < MEDIA_SNIFF_BYTES and session.offset + len(chunk) < session.length:
+            return
+        detected = sniff_media_format(head[:MEDIA_SNIFF_BYTES])
+        if detected not in expected_media_formats(file_extension(session.filename), session.content_type):
+            raise ResumableUploadError(
+                f"File content does not match its '{file_extension(session.filename)}' file type.",
+                status_code=415
+            )
+
+    def create(self, user_id: str, media_type: str, filename: str, length: int,
+               content_type: Optional[str] = None) -> UploadSession:
+        """Start an upload of `length` bytes"""
+        media = MEDIA_KINDS.get(media_type)
+        if media is None:
+            raise ResumableUploadError("Media type must be 'video' or 'photo'.")
+        if file_extension(filename) not in media['extensions']:
+            raise ResumableUploadError(f"File type '{file_extension(filename)}' is not supported for {media_type} uploads.")
+        if length <= 0:
+            raise ResumableUploadError("Upload length must be greater than zero.")
+        if length > media['max_bytes']:
+            raise ResumableUploadError(f"The {media_type} is too large.", status_code=413)
+
+        content_type = content_type or mimetypes.guess_type(filename)[0] or ''
+        if not content_type.startswith(media['content_type_prefix']):
+            raise ResumableUploadError(f"File type '{content_type}' is not a valid {media_type} format.")
+
+        self.expire()
+        os.makedirs(self.directory, exist_ok=True)
+        session = UploadSession(str(uuid.uuid4()), user_id, media_type, filename, content_type, length)
+        open(self._data_path(session.upload_id), 'wb').close()
+        self._write_meta(session)
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        """Load a session with its current offset"""
+        try:
+            uuid.UUID(upload_id)
+            with open(self._meta_path(upload_id)) as meta_file:
+                data = json.load(meta_file)
+        except (ValueError, FileNotFoundError):
+            raise ResumableUploadError("Upload not found or expired.", status_code=404)
+
+        session = UploadSession(**data)
+        if session.finalized:
+            session.offset = session.length
+        else:
+            try:
+                session.offset = os.path.getsize(self._data_path(upload_id))
+            except FileNotFoundError:
+                raise ResumableUploadError("Upload not found or expired.", status_code=404)
+        return session
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Append a request body at `offset`
+
+        The offset must match the bytes already received (the client learns it
+        from HEAD after a failure), so a chunk is never written twice. The
+        container signature is checked as soon as the first bytes arrive.
+
+        Returns:
+            The new offset
+        """
+        with self._lock(upload_id):
+            session = self.get(upload_id)
+            if session.finalized:
+                raise ResumableUploadError("Upload is already finalized.", status_code=409)
+            if offset != session.offset:
+                raise ResumableUploadError(f"Upload offset is {session.offset}, not {offset}.", status_code=409)
+
+            with open(self._data_path(upload_id), 'ab') as data_file:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if session.offset + len(chunk) > session.length:
+                        raise ResumableUploadError("Chunk runs past the declared upload length.", status_code=413)
+                    # Checked on the first bytes, before the rest of the file is sent
+                    if session.offset < MEDIA_SNIFF_BYTES:
+                        self._check_format(session, chunk)
+                    await asyncio.to_thread(data_file.write, chunk)
+                    await asyncio.to_thread(data_file.flush)
+                    session.offset += len(chunk)
+            return session.offset
+
+    async def finalize(self, supabase: Client, upload_id: str, user_id: str) -> UploadSession:
+        """
+        Send a complete upload to storage and return the session with its path
+
+        The object lands under the same per-link prefix as signed uploads, so
+        the path is submitted to /submit-testimonial as video_path/photo_path.
+        Finalizing again returns the same path.
+        """
+        with self._lock(upload_id):
+            session = self.get(upload_id)
+            if session.user_id != user_id:
+                raise ResumableUploadError("Upload not found or expired.", status_code=404)
+            if session.finalized:
+                return session
+            if session.offset != session.length:
+                raise ResumableUploadError(
+                    f"Upload is incomplete ({session.offset} of {session.length} bytes received).",
+                    status_code=409
+                )
+
+            media = MEDIA_KINDS[session.media_type]
+            path = f"{direct_upload_prefix(session.media_type, user_id)}{upload_id}{file_extension(session.filename)}"
+            spooled = SpooledUpload(self._data_path(upload_id), session.length)
+            await asyncio.to_thread(upload_to_storage, supabase, media['bucket'], path, spooled, session.content_type)
+
+            session.path = path
+            self._write_meta(session)
+            # Kept until the upload succeeds, so a failed finalize can be retried
+            spooled.close()
+            return session
+
+    def expire(self, force: bool = False) -> int:
+        """Delete sessions idle for longer than the TTL; returns sessions removed"""
+        now = time.time()
+        if not force and now - self._last_sweep < EXPIRY_SWEEP_INTERVAL:
+            return 0
+        self._last_sweep = now
+
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+
+        removed = 0
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                last_activity = max(
+                    os.path.getmtime(path)
+                    for path in (self._meta_path(upload_id), self._data_path(upload_id))
+                    if os.path.exists(path)
+                )
+            except (ValueError, FileNotFoundError):
+                continue
+            if now - last_activity < self.ttl_seconds:
+                continue
+            for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+# Global resumable upload store
+resumable_uploads = ResumableUploadStore()
@@ -0,0 +1,315 @@
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import json
+import os
+import time
+import uuid
+from supabase import Client
+from rule_compiler import compile_rule, is_condition_group, normalize_conditions
+from automation_engine import apply_rule_actions
+from safe_regex import RegexTimeout
+from error_handler import ErrorCodes, error_monitor
+
+# Testimonials fetched and evaluated per page
+BACKFILL_PAGE_SIZE = int(os.getenv("AUTOMATION_BACKFILL_PAGE_SIZE", "500"))
+
+# Maximum ids per batched UPDATE ... WHERE id IN (...)
+UPDATE_BATCH_SIZE = 200
+
+# Seconds a finished backfill job stays available for polling
+BACKFILL_JOB_TTL_SECONDS = int(os.getenv("AUTOMATION_BACKFILL_JOB_TTL", "3600"))
+
+# Columns a rule can read or write; everything else stays in the database
+BACKFILL_COLUMNS = 'id, user_id, name, text, rating, category, email, sentiment_score, approved, flags, created_at'
+
+# Columns that can be pre-filtered in the database, by operator
+PUSHDOWN_COLUMNS = {
+    'equals': ('name', 'text', 'category', 'email', 'rating'),
+    'contains': ('name', 'text', 'category', 'email'),
+    'starts_with': ('name', 'text', 'category', 'email'),
+    'ends_with': ('name', 'text', 'category', 'email'),
+    'greater_than': ('rating',),
+    'less_than': ('rating',)
+}
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards in a literal"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def pushdown_filters(conditions: Any) -> List[Tuple[str, str, Any]]:
+    """
+    Derive database filters implied by a rule's conditions
+
+    Only conditions that every match must satisfy (direct children of the
+    root AND group) are pushed down. The filters narrow the rows streamed
+    from the database; the compiled rule is still applied to each row, so
+    a filter only needs to be a superset of the rule's matches.
+
+    Args:
+        conditions: Rule conditions in either supported format
+
+    Returns:
+        (method, column, value) tuples to apply to a PostgREST query
+    """
+    tree = normalize_conditions(conditions)
+    if tree.get('logic') != 'AND':
+        return []
+
+    filters = []
+    for node in tree.get('conditions') or []:
+        if is_condition_group(node):
+            continue
+
+        field = node.get('field')
+        operator = node.get('operator', 'equals')
+        value = str(node.get('value', '')).lower()
+
+        # Unscored rows are scored when the rule runs, so they must pass the filter
+        if field == 'sentiment' and operator in ('greater_than', 'less_than'):
+            # A query takes a single or= filter
+            if any(method == 'or_' for method, _, _ in filters):
+                continue
+            try:
+                number = float(value)
+            except ValueError:
+                continue
+            comparison = 'gt' if operator == 'greater_than' else 'lt'
+            filters.append(('or_', 'sentiment_score', f"sentiment_score.{comparison}.{number},sentiment_score.is.null"))
+            continue
+
+        # Rows with a NULL column compare as the string "none", which SQL filters would drop
+        if field not in PUSHDOWN_COLUMNS.get(operator, ()) or value in ('', 'none'):
+            continue
+
+        if field == 'rating':
+            try:
+                number = float(value)
+            except ValueError:
+                continue
+            if operator == 'equals':
+                if number.is_integer():
+                    filters.append(('eq', field, int(number)))
+            elif operator == 'greater_than':
+                filters.append(('gt', field, number))
+            else:
+                filters.append(('lt', field, number))
+            continue
+
+        literal = _escape_like(value)
+        if operator == 'equals':
+            filters.append(('ilike', field, literal))
+        elif operator == 'contains':
+            filters.append(('ilike', field, f"%{literal}%"))
+        elif operator == 'starts_with':
+            filters.append(('ilike', field, f"{literal}%"))
+        else:
+            filters.append(('ilike', field, f"%{literal}"))
+
+    return filters
+
+# In-memory job registry (in production, use database)
+backfill_jobs: Dict[str, Dict[str, Any]] = {}
+
+# Running tasks, kept referenced so they are not garbage collected mid-run
+_backfill_tasks: Dict[str, asyncio.Task] = {}
+
+def _prune_finished_jobs() -> None:
+    """Drop jobs that finished more than BACKFILL_JOB_TTL_SECONDS ago"""
+    cutoff = (datetime.utcnow() - timedelta(seconds=BACKFILL_JOB_TTL_SECONDS)).isoformat()
+    for job_id in [job_id for job_id, job in backfill_jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+        del backfill_jobs[job_id]
+
+class RuleBackfillService:
+    """Applies an automation rule retroactively to a user's existing testimonials"""
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+
+    def start_backfill(self, rule: Dict[str, Any], dry_run: bool = False, page_size: int = BACKFILL_PAGE_SIZE) -> Dict[str, Any]:
+        """Start a backfill job in the background and return its initial state"""
+        _prune_finished_jobs()
+        for job in backfill_jobs.values():
+            if job['rule_id'] == rule['id'] and job['status'] in ('queued', 'running'):
+                return {"success": False, "error": "A backfill for this rule is already running", "job": job}
+
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "rule_id": rule['id'],
+            "user_id": rule['user_id'],
+            "dry_run": dry_run,
+            "status": "queued",
+            "total": None,
+            "processed": 0,
+            "matched": 0,
+            "updated": 0,
+            "errors": 0,
+            "pages": 0,
+            "pushdown_filters": [],
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "finished_at": None
+        }
+        backfill_jobs[job_id] = job
+
+        task = asyncio.create_task(self._run(job, rule, dry_run, max(1, min(page_size, 1000))))
+        _backfill_tasks[job_id] = task
+        task.add_done_callback(lambda _: _backfill_tasks.pop(job_id, None))
+
+        return {"success": True, "job": job}
+
+    def _base_query(self, user_id: str, filters: List[Tuple[str, str, Any]], columns: str, **select_options):
+        query = self.supabase.table('testimonials').select(columns, **select_options).eq('user_id', user_id)
+        for method, column, value in filters:
+            if method == 'or_':
+                query = query.or_(value)
+            else:
+                query = getattr(query, method)(column, value)
+        return query
+
+    async def _run(self, job: Dict[str, Any], rule: Dict[str, Any], dry_run: bool, page_size: int) -> None:
+        job['status'] = 'running'
+        user_id = rule['user_id']
+        compiled = compile_rule(rule)
+        filters = pushdown_filters(rule.get('conditions') or [])
+        job['pushdown_filters'] = [list(f) for f in filters]
+
+        try:
+            count_response = await asyncio.to_thread(
+                lambda: self._base_query(user_id, filters, 'id', count='exact').limit(1).execute()
+            )
+            job['total'] = count_response.count
+
+            last_id = None
+            while True:
+                def fetch_page():
+                    query = self._base_query(user_id, filters, BACKFILL_COLUMNS)
+                    if last_id is not None:
+                        query = query.gt('id', last_id)
+                    return query.order('id').limit(page_size).execute()
+
+                page = (await asyncio.to_thread(fetch_page)).data or []
+                if not page:
+                    break
+                last_id = page[-1]['id']
+
+                # Regex conditions are CPU-bound; evaluating off the event loop keeps requests responsive
+                updates_by_payload, logs = await asyncio.to_thread(self._evaluate_page, compiled, rule, page)
+                job['matched'] += sum(1 for log in logs if log['conditions_met'])
+                job['errors'] += sum(1 for log in logs if log['error_message'])
+
+                if not dry_run:
+                    job['updated'] += await asyncio.to_thread(self._write_page, updates_by_payload, logs)
+
+                # A rule regex that timed out would time out on the remaining rows too, so the job stops there
+                timed_out = next((log for log in logs if log['error_message']), None)
+                if timed_out:
+                    job['processed'] += [row['id'] for row in page].index(timed_out['testimonial_id']) + 1
+                    job['pages'] += 1
+                    job['status'] = 'failed'
+                    job['error'] = f"Stopped after a regex timeout on testimonial {timed_out['testimonial_id']}: {timed_out['error_message']}"
+                    return
+
+                job['processed'] += len(page)
+                job['pages'] += 1
+
+                if len(page) < page_size:
+                    break
+
+            job['status'] = 'completed'
+
+        except Exception as e:
+            print(f"Error running rule backfill {job['id']}: {str(e)}")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            job['finished_at'] = datetime.utcnow().isoformat()
+
+    def _evaluate_page(self, compiled, rule: Dict[str, Any], page: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], List[Dict[str, Any]]]:
+        """
+        Evaluate the rule over one page
+
+        Evaluation stops at the first regex timeout; the rows before it are
+        still returned so their updates are written.
+
+        Returns:
+            Testimonial ids grouped by identical update payload, and automation log rows
+            (matches, and the row whose evaluation timed out)
+        """
+        updates_by_payload: Dict[str, List[str]] = {}
+        logs = []
+
+        for testimonial in page:
+            started = time.perf_counter()
+            error_message = None
+            changes: Dict[str, Any] = {}
+            executed_actions: List[str] = []
+            try:
+                conditions_met = compiled.matches(testimonial)
+            except RegexTimeout as e:
+                conditions_met = False
+                error_message = str(e)
+                error_monitor.record_error(ErrorCodes.REGEX_TIMEOUT, {
+                    "user_id": rule['user_id'],
+                    "rule_id": rule['id'],
+                    "testimonial_id": testimonial['id'],
+                    "pattern": e.pattern,
+                    "elapsed_ms": e.elapsed_ms
+                })
+
+            if conditions_met:
+                updates: Dict[str, Any] = {}
+                executed_actions = apply_rule_actions(rule.get('actions'), updates)
+
+                # Keep existing flags and drop updates that would not change anything
+                if 'flags' in updates:
+                    existing_flags = testimonial.get('flags') or []
+                    merged = existing_flags + [flag for flag in updates['flags'] if flag not in existing_flags]
+                    updates['flags'] = merged
+                changes = {key: value for key, value in updates.items() if testimonial.get(key) != value}
+
+                if changes:
+                    payload_key = json.dumps(changes, sort_keys=True)
+                    updates_by_payload.setdefault(payload_key, []).append(testimonial['id'])
+            elif not error_message:
+                continue
+
+            logs.append({
+                "id": str(uuid.uuid4()),
+                "user_id": rule['user_id'],
+                "rule_id": rule['id'],
+                "testimonial_id": testimonial['id'],
+                "rule_name": rule.get('name', ''),
+                "rule_type": rule.get('type', ''),
+                "conditions_evaluated": rule.get('conditions') or [],
+                "conditions_met": conditions_met,
+                "actions_executed": executed_actions if changes else [],
+                "execution_time_ms": round((time.perf_counter() - started) * 1000),
+                "error_message": error_message,
+                "created_at": datetime.utcnow().isoformat()
+            })
+            if error_message:
+                break
+
+        return updates_by_payload, logs
+
+    def _write_page(self, updates_by_payload: Dict[str, List[str]], logs: List[Dict[str, Any]]) -> int:
+        """Apply grouped updates with one UPDATE per payload and id batch; returns rows updated"""
+        updated = 0
+        for payload_key, ids in updates_by_payload.items():
+            payload = json.loads(payload_key)
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                batch = ids[start:start + UPDATE_BATCH_SIZE]
+                self.supabase.table('testimonials').update(payload).in_('id', batch).execute()
+                updated += len(batch)
+
+        if logs:
+            self.supabase.table('automation_logs').insert(logs).execute()
+
+        return updated
+
+    @staticmethod
+    def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current state of a backfill job"""
+        return backfill_jobs.get(job_id)
@@ -0,0 +1,322 @@
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from collections import OrderedDict
+import os
+from safe_regex import compile_pattern, validate_pattern
+from keyword_matcher import KEYWORD_HITS_KEY
+from sentiment import score_sentiment
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+# Maximum number of compiled rules kept in memory
+COMPILED_RULE_CACHE_SIZE = int(os.getenv("COMPILED_RULE_CACHE_SIZE", "10000"))
+
+def _always(result: bool) -> Predicate:
+    """Predicate with a constant result"""
+    return lambda testimonial_data: result
+
+def _to_float(value: Any) -> Optional[float]:
+    """Convert a value to float, or None if it is not numeric"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def _field_getter(field: str) -> Callable[[Dict[str, Any]], Any]:
+    """Build an accessor for a condition field, resolving special fields"""
+    if field == 'text_length':
+        return lambda testimonial_data: len(testimonial_data.get('text', ''))
+    if field == 'sentiment':
+        # Stored at submit time; scored on the fly for samples and rows that predate the column
+        def get_sentiment(testimonial_data: Dict[str, Any]) -> Any:
+            score = testimonial_data.get('sentiment_score')
+            return score if score is not None else score_sentiment(testimonial_data.get('text', ''))
+        return get_sentiment
+    return lambda testimonial_data: testimonial_data.get(field, '')
+
+def compile_condition(condition: Dict[str, Any]) -> Predicate:
+    """
+    Compile a single condition into a predicate over testimonial data
+
+    Literals are lowercased, numbers converted and regexes compiled here,
+    once, instead of on every evaluation.
+
+    Args:
+        condition: Single rule condition
+
+    Returns:
+        Function taking testimonial data and returning whether the condition is met
+    """
+    field = condition.get('field', '')
+    operator = condition.get('operator', 'equals')
+    value = condition.get('value', '')
+
+    get_value = _field_getter(field)
+
+    # text_length compares against an integer; anything non-numeric counts as 0
+    if field == 'text_length':
+        value = int(value) if str(value).isdigit() else 0
+
+    value_str = str(value).lower()
+
+    if operator == 'equals':
+        return lambda testimonial_data: str(get_value(testimonial_data)).lower() == value_str
+    elif operator == 'contains':
+        if not value_str:
+            return _always(True)
+
+        def contains(testimonial_data: Dict[str, Any]) -> bool:
+            # Keywords already found by the user's Aho-Corasick automaton, when available
+            keyword_hits = testimonial_data.get(KEYWORD_HITS_KEY)
+            if keyword_hits is not None:
+                found = keyword_hits.get(field)
+                if found is not None:
+                    return value_str in found
+            return value_str in str(get_value(testimonial_data)).lower()
+
+        return contains
+    elif operator == 'starts_with':
+        return lambda testimonial_data: str(get_value(testimonial_data)).lower().startswith(value_str)
+    elif operator == 'ends_with':
+        return lambda testimonial_data: str(get_value(testimonial_data)).lower().endswith(value_str)
+    elif operator in ('greater_than', 'less_than'):
+        threshold = _to_float(value)
+        if threshold is None:
+            return _always(False)
+        greater = operator == 'greater_than'
+
+        def compare(testimonial_data: Dict[str, Any]) -> bool:
+            actual = _to_float(get_value(testimonial_data))
+            if actual is None:
+                return False
+            return actual > threshold if greater else actual < threshold
+
+        return compare
+    elif operator == 'regex':
+        # Patterns must be strings (text_length values are converted to int above)
+        if not isinstance(value, str):
+            return _always(False)
+        # Unsafe patterns saved before validation existed never run
+        try:
+            validate_pattern(value)
+            search = compile_pattern(value)
+        except ValueError:
+            return _always(False)
+        return lambda testimonial_data: search(str(get_value(testimonial_data)).lower())
+    else:
+        return _always(False)
+
+# Logical operators allowed in condition groups
+GROUP_OPERATORS = ('AND', 'OR', 'NOT')
+
+# Relative evaluation cost per operator; cheaper predicates run first within a group
+OPERATOR_COSTS = {
+    'equals': 1,
+    'greater_than': 1,
+    'less_than': 1,
+    'starts_with': 2,
+    'ends_with': 2,
+    'contains': 3,
+    'regex': 10
+}
+
+def is_condition_group(node: Any) -> bool:
+    """Whether a condition node is an AND/OR/NOT group rather than a single condition"""
+    return isinstance(node, dict) and 'logic' in node
+
+def _group(logic: str, conditions: List[Any]) -> Dict[str, Any]:
+    """Build a condition group node"""
+    return {"logic": logic, "conditions": conditions}
+
+def normalize_conditions(conditions: Any) -> Dict[str, Any]:
+    """
+    Read a rule's conditions into a condition tree
+
+    Two formats are accepted:
+
+    * Condition tree - a group node ``{"logic": "AND" | "OR" | "NOT",
+      "conditions": [...]}`` whose children are conditions or nested groups.
+    * Flat list (legacy) - conditions combined left to right, where a
+      condition's logical_operator joins it to everything before it and
+      carries over to the following conditions until overridden. Entries
+      that only carry a logical_operator set the operator for the next
+      condition. Consecutive conditions joined by the same operator become
+      one group, so ``[a, OR b, OR c, AND d]`` reads as ``(a OR b OR c) AND d``.
+
+    Args:
+        conditions: Rule conditions in either format
+
+    Returns:
+        Condition tree whose root is always a group node
+    """
+    if is_condition_group(conditions):
+        return conditions
+
+    if isinstance(conditions, dict):
+        return _group('AND', [conditions])
+
+    tree: Optional[Any] = None
+    tree_logic: Optional[str] = None
+    logical_operator = 'AND'
+
+    for i, condition in enumerate(conditions or []):
+        if i > 0 and 'logical_operator' in condition:
+            logical_operator = condition['logical_operator']
+
+        if 'field' not in condition and not is_condition_group(condition):
+            continue
+
+        # Anything other than AND has always been treated as OR
+        logic = 'AND' if logical_operator == 'AND' else 'OR'
+
+        if tree is None:
+            tree = condition
+        elif tree_logic == logic:
+            tree['conditions'].append(condition)
+        else:
+            tree = _group(logic, [tree, condition])
+            tree_logic = logic
+
+    if tree is None:
+        return _group('AND', [])
+    if is_condition_group(tree):
+        return tree
+    return _group('AND', [tree])
+
+def validate_conditions(conditions: Any) -> None:
+    """
+    Check that rule conditions are well formed
+
+    Args:
+        conditions: Rule conditions in either supported format
+
+    Raises:
+        ValueError: With a user-facing message describing the first problem found
+    """
+    if not isinstance(conditions, (list, dict)):
+        raise ValueError("Conditions must be a list of conditions or a condition group.")
+
+    def check(node: Any) -> None:
+        if is_condition_group(node):
+            logic = node.get('logic')
+            children = node.get('conditions')
+            if logic not in GROUP_OPERATORS:
+                raise ValueError(f"Invalid group operator '{logic}'. Use AND, OR or NOT.")
+            if not isinstance(children, list):
+                raise ValueError("A condition group must contain a list of conditions.")
+            if logic == 'NOT' and len(children) != 1:
+                raise ValueError("A NOT group must contain exactly one condition.")
+            for child in children:
+                check(child)
+        elif isinstance(node, dict):
+            if 'field' in node and not node.get('field'):
+                raise ValueError("Every condition needs a field.")
+            if node.get('operator') == 'regex' and node.get('field') != 'text_length':
+                validate_pattern(node.get('value'))
+        else:
+            raise ValueError("Each condition must be an object.")
+
+    for node in (conditions if isinstance(conditions, list) else [conditions]):
+        check(node)
+
+def _compile_node(node: Any) -> Tuple[Predicate, int]:
+    """Compile a condition tree node into a predicate and its estimated cost"""
+    if not is_condition_group(node):
+        return compile_condition(node), OPERATOR_COSTS.get(node.get('operator', 'equals'), 1)
+
+    logic = node.get('logic', 'AND')
+    children = [_compile_node(child) for child in node.get('conditions') or []]
+
+    if logic == 'NOT':
+        inner, cost = children[0] if children else (_always(True), 0)
+        return (lambda testimonial_data: not inner(testimonial_data)), cost
+
+    # AND/OR are commutative over side-effect-free predicates, so cheap ones go first
+    children.sort(key=lambda child: child[1])
+    predicates = [predicate for predicate, _ in children]
+    cost = sum(child_cost for _, child_cost in children)
+
+    if not predicates:
+        return _always(logic != 'OR'), 0
+    if len(predicates) == 1:
+        return predicates[0], cost
+
+    if logic == 'OR':
+        def any_of(testimonial_data: Dict[str, Any]) -> bool:
+            for predicate in predicates:
+                if predicate(testimonial_data):
+                    return True
+            return False
+        return any_of, cost
+
+    def all_of(testimonial_data: Dict[str, Any]) -> bool:
+        for predicate in predicates:
+            if not predicate(testimonial_data):
+                return False
+        return True
+    return all_of, cost
+
+def compile_conditions(conditions: Any) -> Predicate:
+    """
+    Compile a rule's conditions into a single predicate
+
+    Groups short-circuit, and within a group cheap predicates (equals,
+    numeric comparisons) are evaluated before expensive ones (contains, regex).
+
+    Args:
+        conditions: Rule conditions, as a condition tree or legacy flat list
+
+    Returns:
+        Function taking testimonial data and returning whether the conditions are met
+    """
+    predicate, _ = _compile_node(normalize_conditions(conditions))
+    return predicate
+
+class CompiledRule:
+    """An automation rule with its conditions compiled into a predicate"""
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.rule = rule
+        self.rule_id = rule.get('id')
+        self.tree = normalize_conditions(rule.get('conditions') or [])
+        self.predicate, _ = _compile_node(self.tree)
+
+    def matches(self, testimonial_data: Dict[str, Any]) -> bool:
+        """Whether the rule's conditions are met by the testimonial"""
+        return self.predicate(testimonial_data)
+
+class CompiledRuleCache:
+    """LRU cache of compiled rules keyed by (rule_id, updated_at)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[Any, Any], CompiledRule]" = OrderedDict()
+
+    def get(self, rule: Dict[str, Any]) -> CompiledRule:
+        """Return the compiled form of a rule, compiling it on first use"""
+        rule_id = rule.get('id')
+        if rule_id is None:
+            # Unsaved drafts have no stable identity to cache under
+            return CompiledRule(rule)
+
+        key = (rule_id, rule.get('updated_at'))
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self._entries.move_to_end(key)
+            return compiled
+
+        compiled = CompiledRule(rule)
+        self._entries[key] = compiled
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        """Drop all compiled rules"""
+        self._entries.clear()
+
+# Shared across requests; an edited rule gets a new updated_at and therefore a new entry
+compiled_rule_cache = CompiledRuleCache(COMPILED_RULE_CACHE_SIZE)
+
+def compile_rule(rule: Dict[str, Any]) -> CompiledRule:
+    """Get the compiled form of a rule from the shared cache"""
+    return compiled_rule_cache.get(rule)
@@ -0,0 +1,154 @@
+from typing import Dict, List, Optional, Any, Tuple
+from rule_compiler import CompiledRule, compile_rule, is_condition_group
+from keyword_matcher import KEYWORD_HITS_KEY, MIN_AUTOMATON_KEYWORDS, KeywordAutomaton, KeywordHits
+
+# Fields tried first when choosing which equality condition to index a rule under
+PREFERRED_INDEX_FIELDS = ('category', 'rating', 'email', 'name')
+
+# Computed fields are not plain lookups and cannot be indexed
+NON_INDEXABLE_FIELDS = ('text_length', 'sentiment')
+
+def find_index_key(compiled: CompiledRule) -> Optional[Tuple[str, str]]:
+    """
+    Pick an equality condition every match of the rule must satisfy
+
+    Only direct children of the root AND group qualify: if such a
+    condition is false the whole rule is false, so the rule can be skipped
+    without evaluating it.
+
+    Returns:
+        (field, lowercased value) to index the rule under, or None
+    """
+    tree = compiled.tree
+    if tree.get('logic') != 'AND':
+        return None
+
+    candidates = {}
+    for node in tree.get('conditions') or []:
+        if is_condition_group(node) or node.get('operator', 'equals') != 'equals':
+            continue
+        field = node.get('field', '')
+        if not field or field in NON_INDEXABLE_FIELDS:
+            continue
+        candidates.setdefault(field, str(node.get('value', '')).lower())
+
+    if not candidates:
+        return None
+
+    for field in PREFERRED_INDEX_FIELDS:
+        if field in candidates:
+            return field, candidates[field]
+    field = sorted(candidates)[0]
+    return field, candidates[field]
+
+def collect_contains_keywords(node: Any, keywords: Dict[str, set]) -> None:
+    """Gather the lowercased literals of every contains condition in a tree, by field"""
+    if is_condition_group(node):
+        for child in node.get('conditions') or []:
+            collect_contains_keywords(child, keywords)
+        return
+
+    if node.get('operator', 'equals') != 'contains':
+        return
+    field = node.get('field', '')
+    value = str(node.get('value', '')).lower()
+    if field and field not in NON_INDEXABLE_FIELDS and value:
+        keywords.setdefault(field, set()).add(value)
+
+class RuleIndex:
+    """
+    A user's enabled rules indexed by equality conditions (field -> value -> rules)
+
+    Rules without an indexable condition go on a fallback list that is
+    always evaluated. Candidates are returned in the original priority order.
+
+    The literals of all contains conditions are also compiled into one
+    keyword automaton per field, so a testimonial is scanned once per field
+    instead of once per contains condition.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = rules
+        self.by_field: Dict[str, Dict[str, List[Tuple[int, CompiledRule]]]] = {}
+        self.fallback: List[Tuple[int, CompiledRule]] = []
+        self.automata: Dict[str, KeywordAutomaton] = {}
+
+        keywords: Dict[str, set] = {}
+        for position, rule in enumerate(rules):
+            compiled = compile_rule(rule)
+            collect_contains_keywords(compiled.tree, keywords)
+            key = find_index_key(compiled)
+            if key is None:
+                self.fallback.append((position, compiled))
+            else:
+                field, value = key
+                self.by_field.setdefault(field, {}).setdefault(value, []).append((position, compiled))
+
+        for field, field_keywords in keywords.items():
+            if len(field_keywords) >= MIN_AUTOMATON_KEYWORDS:
+                self.automata[field] = KeywordAutomaton(field_keywords)
+
+    def with_keyword_hits(self, testimonial_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Testimonial data extended with lazily computed keyword hits for compiled contains conditions"""
+        if not self.automata:
+            return testimonial_data
+        return {**testimonial_data, KEYWORD_HITS_KEY: KeywordHits(self.automata, testimonial_data)}
+
+    def candidates(self, testimonial_data: Dict[str, Any]) -> List[CompiledRule]:
+        """Rules that could match the testimonial, highest priority first"""
+        selected = list(self.fallback)
+        for field, rules_by_value in self.by_field.items():
+            matching = rules_by_value.get(str(testimonial_data.get(field, '')).lower())
+            if matching:
+                selected.extend(matching)
+
+        if len(selected) != len(self.fallback):
+            selected.sort(key=lambda entry: entry[0])
+        return [compiled for _, compiled in selected]
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary of how the rules were indexed"""
+        return {
+            "totalRules": len(self.rules),
+            "fallbackRules": len(self.fallback),
+            "indexedRules": len(self.rules) - len(self.fallback),
+            "indexedFields": {
+                field: sum(len(rules) for rules in rules_by_value.values())
+                for field, rules_by_value in self.by_field.items()
+            },
+            "keywordAutomata": {
+                field: len(automaton.keywords)
+                for field, automaton in self.automata.items()
+            }
+        }
+
+class DispatchStats:
+    """Per-user counters of rules evaluated vs skipped by the index (per process)"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, user_id: str, total: int, evaluated: int, matched: int) -> None:
+        """Record the outcome of dispatching one testimonial"""
+        stats = self._stats.setdefault(user_id, {
+            "testimonials": 0,
+            "rulesEvaluated": 0,
+            "rulesSkipped": 0,
+            "rulesMatched": 0
+        })
+        stats["testimonials"] += 1
+        stats["rulesEvaluated"] += evaluated
+        stats["rulesSkipped"] += total - evaluated
+        stats["rulesMatched"] += matched
+
+    def get(self, user_id: str) -> Dict[str, int]:
+        """Counters for a user (zeros if nothing was dispatched yet)"""
+        return dict(self._stats.get(user_id, {
+            "testimonials": 0,
+            "rulesEvaluated": 0,
+            "rulesSkipped": 0,
+            "rulesMatched": 0
+        }))
+
+# Global dispatch statistics instance
+dispatch_stats = DispatchStats()
@@ -0,0 +1,244 @@
+from typing import Any, Callable, List, Optional, Set, Tuple
+import os
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Linear-time engine used to run rule regexes (google-re2 in requirements.txt)
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Alternative backtracking engine with a hard matching timeout (pip install regex)
+try:
+    import regex as regex_module
+except ImportError:
+    regex_module = None
+
+# The stdlib engine cannot be interrupted, so regex conditions are disabled without either engine
+REGEX_ENGINE_MISSING = "Regex conditions need the google-re2 package. Please install the backend requirements."
+
+# Time budget for a single regex match
+REGEX_TIMEOUT_MS = float(os.getenv("AUTOMATION_REGEX_TIMEOUT_MS", "50"))
+
+# Longest pattern accepted in an automation rule
+MAX_PATTERN_LENGTH = int(os.getenv("AUTOMATION_REGEX_MAX_LENGTH", "500"))
+
+REPEAT_OPS = ('MAX_REPEAT', 'MIN_REPEAT')
+
+class RegexTimeout(Exception):
+    """Raised when a rule regex exceeds its time budget"""
+
+    def __init__(self, pattern: str, elapsed_ms: Optional[float] = None):
+        self.pattern = pattern
+        self.elapsed_ms = elapsed_ms
+        super().__init__(f"Regex pattern exceeded its {REGEX_TIMEOUT_MS:g}ms time budget: {pattern}")
+
+def _op_name(op: Any) -> str:
+    return str(op).upper()
+
+def _is_variable_repeat(av: Tuple[int, int, Any]) -> bool:
+    """Whether a repeat can match a varying number of times (e.g. +, *, {1,5})"""
+    min_count, max_count, _ = av
+    return max_count > 1 and min_count != max_count
+
+def _set_literals(items: Any) -> Optional[Set[int]]:
+    """Code points a character set matches, or None when they cannot be listed (categories, negation)"""
+    chars: Set[int] = set()
+    for item_op, item_av in items:
+        item_name = _op_name(item_op)
+        if item_name == 'LITERAL':
+            chars.add(item_av)
+        elif item_name == 'RANGE' and item_av[1] - item_av[0] < 256:
+            chars.update(range(item_av[0], item_av[1] + 1))
+        else:
+            return None
+    return chars
+
+def _first_literals(subpattern: Any) -> Optional[Set[int]]:
+    """
+    Literal code points an alternative can start with, or None when unknown
+
+    Only plain literals and literal character sets are resolved; anything
+    else (categories, wildcards, groups) is treated as unknown.
+    """
+    for op, av in subpattern:
+        name = _op_name(op)
+        if name == 'LITERAL':
+            return {av}
+        if name == 'IN':
+            return _set_literals(av)
+        return None
+    return None
+
+def _set_members_overlap(items: Any) -> bool:
+    """
+    Whether members of a character set can match the same character
+
+    The parser folds single-character alternatives such as (\w|\d) into one
+    set, so an overlapping set alone in a group is treated like overlapping
+    alternatives. Members that cannot be listed overlap everything.
+    """
+    if len(items) < 2:
+        return False
+    seen: Set[int] = set()
+    for item in items:
+        chars = _set_literals([item])
+        if chars is None or seen & chars:
+            return True
+        seen |= chars
+    return False
+
+def _children(op_name: str, av: Any) -> List[Any]:
+    """Sub-patterns nested inside a parse tree node"""
+    if op_name in REPEAT_OPS or op_name == 'POSSESSIVE_REPEAT':
+        return [av[2]]
+    if op_name == 'SUBPATTERN':
+        return [av[-1]]
+    if op_name == 'BRANCH':
+        return list(av[1])
+    if op_name in ('ASSERT', 'ASSERT_NOT'):
+        return [av[1]]
+    if op_name == 'ATOMIC_GROUP':
+        return [av]
+    return []
+
+def _contains_variable_repeat(subpattern: Any, unbounded_only: bool = False) -> bool:
+    for op, av in subpattern:
+        name = _op_name(op)
+        if name in REPEAT_OPS and _is_variable_repeat(av):
+            if not unbounded_only or av[1] == sre_parse.MAXREPEAT:
+                return True
+        if any(_contains_variable_repeat(child, unbounded_only) for child in _children(name, av)):
+            return True
+    return False
+
+def _has_ambiguous_branch(subpattern: Any) -> bool:
+    """
+    Whether an alternation has branches that can match the same input start
+
+    A branch whose first characters are unknown (a wildcard, a category, a
+    group) is assumed to overlap every other branch.
+    """
+    for op, av in subpattern:
+        name = _op_name(op)
+        if name == 'BRANCH':
+            alternatives = av[1]
+            seen: Set[int] = set()
+            for alternative in alternatives:
+                if alternative.getwidth()[0] == 0:
+                    return True
+                first = _first_literals(alternative)
+                if first is None or seen & first:
+                    return True
+                seen |= first
+        if name == 'SUBPATTERN' and len(av[-1]) == 1:
+            inner_op, inner_av = av[-1][0]
+            if _op_name(inner_op) == 'IN' and _set_members_overlap(inner_av):
+                return True
+        if any(_has_ambiguous_branch(child) for child in _children(name, av)):
+            return True
+    return False
+
+def _check_tree(subpattern: Any) -> None:
+    """Reject constructs that can backtrack exponentially"""
+    for op, av in subpattern:
+        name = _op_name(op)
+
+        if name in ('GROUPREF', 'GROUPREF_EXISTS'):
+            raise ValueError("Backreferences are not supported in regex conditions.")
+
+        if name in REPEAT_OPS and av[1] > 1:
+            body = av[2]
+            unbounded = av[1] == sre_parse.MAXREPEAT
+            if _is_variable_repeat(av) and _contains_variable_repeat(body):
+                raise ValueError("Nested quantifiers such as (a+)+ can cause catastrophic backtracking.")
+            if _contains_variable_repeat(body, unbounded_only=True):
+                raise ValueError("Repeating a group that contains * or +, such as (.*a){20}, can cause catastrophic backtracking.")
+            if unbounded and body.getwidth()[0] == 0:
+                raise ValueError("Repeating a group that can match an empty string, such as (a?)*, is not allowed.")
+            if unbounded and _has_ambiguous_branch(body):
+                raise ValueError("Repeated alternatives that overlap, such as (a|ab)*, can cause catastrophic backtracking.")
+
+        for child in _children(name, av):
+            _check_tree(child)
+
+def validate_pattern(pattern: Any) -> None:
+    """
+    Check that a rule regex is safe to run on the request path
+
+    Args:
+        pattern: Regex pattern from an automation rule condition
+
+    Raises:
+        ValueError: With a user-facing message when the pattern is invalid or unsafe
+    """
+    if not isinstance(pattern, str) or not pattern:
+        raise ValueError("Regex conditions need a non-empty pattern.")
+
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"Regex pattern is too long. Please limit to {MAX_PATTERN_LENGTH} characters or less.")
+
+    try:
+        tree = sre_parse.parse(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid regex pattern: {str(e)}")
+
+    if re2 is None and regex_module is None:
+        raise ValueError(REGEX_ENGINE_MISSING)
+
+    if re2 is not None:
+        # RE2 runs in linear time, but only supports a subset of Python's syntax
+        try:
+            re2.compile(pattern)
+        except Exception as e:
+            raise ValueError(f"Regex pattern uses unsupported syntax: {str(e)}")
+        return
+
+    _check_tree(tree)
+
+def compile_pattern(pattern: str) -> Callable[[str], bool]:
+    """
+    Compile a validated rule regex into a time-bounded search function
+
+    Uses RE2 (linear time), or the ``regex`` module with a hard timeout
+    when only that is installed. The stdlib engine is never used: a match
+    cannot be interrupted there, so a runaway pattern would hold the GIL
+    for as long as it runs.
+
+    Args:
+        pattern: Regex pattern that passed validate_pattern
+
+    Returns:
+        Function returning whether the pattern matches a string
+
+    Raises:
+        ValueError: If the pattern cannot be compiled or no engine is installed
+    """
+    if re2 is not None:
+        try:
+            compiled = re2.compile(pattern)
+        except Exception as e:
+            raise ValueError(f"Invalid regex pattern: {str(e)}")
+        return lambda text: compiled.search(text) is not None
+
+    if regex_module is None:
+        raise ValueError(REGEX_ENGINE_MISSING)
+
+    try:
+        compiled = regex_module.compile(pattern)
+    except regex_module.error as e:
+        raise ValueError(f"Invalid regex pattern: {str(e)}")
+    timeout_seconds = REGEX_TIMEOUT_MS / 1000
+
+    def search_with_timeout(text: str) -> bool:
+        try:
+            return compiled.search(text, timeout=timeout_seconds) is not None
+        except TimeoutError:
+            raise RegexTimeout(pattern, REGEX_TIMEOUT_MS)
+
+    return search_with_timeout
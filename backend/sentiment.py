@@ -0,0 +1,154 @@
+from typing import Dict, List
+import math
+import re
+from supabase import Client
+
+# Scores at or above / below these thresholds are reported as positive / negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+# Word valence on a -4 (very negative) to +4 (very positive) scale
+LEXICON: Dict[str, float] = {
+    # Positive
+    'amazing': 3.1, 'awesome': 3.1, 'excellent': 3.2, 'outstanding': 3.3, 'fantastic': 3.3,
+    'incredible': 3.0, 'wonderful': 3.0, 'superb': 3.1, 'brilliant': 2.9, 'perfect': 2.9,
+    'exceptional': 3.0, 'phenomenal': 3.2, 'best': 3.2, 'love': 3.2, 'loved': 2.9, 'loves': 2.7,
+    'great': 3.1, 'good': 1.9, 'nice': 1.8, 'fine': 0.8, 'ok': 0.9, 'okay': 0.9, 'decent': 1.0, 'solid': 1.4,
+    'happy': 2.7, 'glad': 2.0, 'pleased': 2.2, 'satisfied': 1.8, 'delighted': 3.0, 'thrilled': 3.0,
+    'impressed': 2.4, 'impressive': 2.5, 'recommend': 1.9, 'recommended': 1.8, 'helpful': 1.9,
+    'friendly': 2.2, 'professional': 1.6, 'reliable': 1.9, 'easy': 1.9, 'fast': 1.2, 'quick': 1.2,
+    'efficient': 1.8, 'smooth': 1.6, 'seamless': 2.0, 'intuitive': 1.8, 'responsive': 1.6,
+    'valuable': 2.1, 'worth': 1.6, 'affordable': 1.5, 'quality': 1.3, 'beautiful': 2.9,
+    'clean': 1.7, 'fun': 2.3, 'enjoy': 2.2, 'enjoyed': 2.3, 'thanks': 1.9, 'thank': 1.5,
+    'grateful': 2.5, 'appreciate': 2.0, 'appreciated': 2.2, 'exceeded': 2.0, 'special': 1.7,
+    'favorite': 2.0, 'favourite': 2.0, 'top': 1.5, 'super': 2.9, 'lifesaver': 2.6,
+    'success': 2.7, 'successful': 2.7, 'improved': 2.0, 'effective': 2.1, 'trust': 2.3,
+    'trustworthy': 2.3, 'knowledgeable': 1.9, 'patient': 1.3, 'kind': 2.4, 'caring': 2.1,
+    'attentive': 1.8, 'recommendable': 1.9, 'flawless': 2.8, 'stellar': 2.8,
+
+    # Negative
+    'bad': -2.5, 'terrible': -3.1, 'horrible': -2.5, 'awful': -3.1, 'worst': -3.1, 'poor': -2.1,
+    'disappointing': -2.2, 'disappointed': -1.9, 'disappointment': -2.3, 'useless': -1.8,
+    'broken': -2.0, 'broke': -1.8, 'slow': -1.1, 'rude': -2.0, 'unhelpful': -1.8,
+    'unprofessional': -2.1, 'unreliable': -1.8, 'expensive': -0.9, 'overpriced': -1.9,
+    'waste': -1.8, 'wasted': -2.2, 'hate': -2.7, 'hated': -3.2, 'annoying': -1.7, 'annoyed': -1.6,
+    'frustrating': -1.9, 'frustrated': -2.0, 'confusing': -1.3, 'confused': -1.3, 'difficult': -1.5,
+    'hard': -0.4, 'problem': -1.7, 'problems': -1.7, 'issue': -0.9, 'issues': -1.0, 'bug': -1.3,
+    'bugs': -1.3, 'buggy': -1.7, 'crash': -1.9, 'crashes': -1.9, 'failed': -2.3, 'fail': -2.5,
+    'fails': -2.5, 'failure': -2.3, 'scam': -2.8, 'fraud': -2.8, 'spam': -1.5,
+    'mediocre': -1.3, 'meh': -0.9, 'lacking': -1.3, 'lacks': -1.3, 'unhappy': -1.8, 'sad': -2.1,
+    'angry': -2.3, 'upset': -1.6, 'regret': -1.8, 'avoid': -1.4, 'ignored': -1.4, 'late': -0.8,
+    'delay': -1.3, 'delayed': -1.3, 'refund': -0.8, 'cheap': -0.4, 'damaged': -2.2, 'lost': -1.3,
+    'worse': -2.1, 'nightmare': -2.7, 'unacceptable': -2.5, 'misleading': -2.2, 'incompetent': -2.4
+}
+
+# Words that scale the following sentiment word up (or down)
+BOOSTERS: Dict[str, float] = {
+    'very': 0.293, 'really': 0.293, 'extremely': 0.293, 'so': 0.293, 'super': 0.293,
+    'incredibly': 0.293, 'absolutely': 0.293, 'highly': 0.293, 'truly': 0.293, 'totally': 0.293,
+    'completely': 0.293, 'most': 0.293, 'exceptionally': 0.293, 'too': 0.293,
+    'slightly': -0.293, 'somewhat': -0.293, 'kinda': -0.293, 'barely': -0.293, 'fairly': -0.293,
+    'little': -0.293, 'marginally': -0.293
+}
+
+NEGATIONS = {
+    'not', 'no', 'never', 'none', 'nothing', 'neither', 'nor', 'nobody', 'nowhere', 'without',
+    'cannot', 'cant', 'dont', 'doesnt', 'didnt', 'isnt', 'wasnt', 'arent', 'werent', 'wont',
+    'wouldnt', 'shouldnt', 'couldnt', 'hasnt', 'havent', 'hadnt', 'aint'
+}
+
+# Negated words keep a reduced, flipped share of their valence ("not great" is mildly negative)
+NEGATION_SCALAR = -0.74
+
+# Sentiment words this many tokens after a negation or booster are affected by it
+MODIFIER_WINDOW = 3
+
+# Normalization constant mapping unbounded sums into [-1, 1]
+NORMALIZATION_ALPHA = 15
+
+_TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?|!")
+
+def _tokenize(text: str) -> List[str]:
+    return [token.replace("'", '') for token in _TOKEN.findall((text or '').lower())]
+
+def score_sentiment(text: str) -> float:
+    """
+    Lexicon-based sentiment score of a text, from -1 (negative) to 1 (positive)
+
+    Handles negation ("not good"), intensifiers ("very good"), contrast
+    ("ok but slow" weighs the part after "but" more) and exclamation marks.
+    Runs offline in a single pass over the tokens.
+    """
+    tokens = _tokenize(text)
+    valences: List[float] = []
+    exclamations = 0
+    but_index = None
+
+    for i, token in enumerate(tokens):
+        if token == '!':
+            exclamations += 1
+            continue
+        if token == 'but' and but_index is None:
+            but_index = len(valences)
+
+        valence = LEXICON.get(token)
+        # A word like "super" is a booster, not a sentiment word, when it precedes one
+        if valence is None or (token in BOOSTERS and i + 1 < len(tokens) and tokens[i + 1] in LEXICON):
+            valences.append(0.0)
+            continue
+
+        for distance, previous in enumerate(reversed(tokens[max(0, i - MODIFIER_WINDOW):i]), 1):
+            scale = 1 if distance == 1 else 0.95 if distance == 2 else 0.9
+            boost = BOOSTERS.get(previous)
+            if boost is not None:
+                valence += math.copysign(1, valence) * boost * scale
+            if previous in NEGATIONS:
+                valence *= NEGATION_SCALAR
+                break
+
+        valences.append(valence)
+
+    if but_index is not None:
+        valences = [v * 0.5 for v in valences[:but_index]] + [v * 1.5 for v in valences[but_index:]]
+
+    total = sum(valences)
+    if total:
+        total += math.copysign(min(exclamations, 4) * 0.292, total)
+
+    score = total / math.sqrt(total * total + NORMALIZATION_ALPHA)
+    return round(max(-1.0, min(1.0, score)), 3)
+
+class SentimentService:
+    """Stores sentiment scores for testimonials"""
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+
+    def backfill(self, page_size: int = 500) -> int:
+        """
+        Score existing testimonials that have no sentiment yet
+
+        Each page is scored in memory and written with one
+        set_sentiment_scores call. Returns rows updated.
+        """
+        updated = 0
+        last_id = None
+        while True:
+            query = self.supabase.table('testimonials').select('id, text').is_('sentiment_score', 'null')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(page_size).execute().data or []
+            if not page:
+                break
+            last_id = page[-1]['id']
+
+            scores = [
+                {"id": testimonial['id'], "score": score_sentiment(testimonial.get('text') or '')}
+                for testimonial in page
+            ]
+            response = self.supabase.rpc('set_sentiment_scores', {'p_scores': scores}).execute()
+            updated += response.data or 0
+
+            if len(page) < page_size:
+                break
+        return updated
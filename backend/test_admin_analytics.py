@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+from admin_analytics import ResultCache
+
+class ResultCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waiter_computes_when_leader_is_cancelled(self):
+        cache = ResultCache(ttl_seconds=60)
+        started = asyncio.Event()
+        calls = []
+
+        async def slow():
+            calls.append('leader')
+            started.set()
+            await asyncio.sleep(10)
+            return 'leader'
+
+        async def fast():
+            calls.append('waiter')
+            return 'waiter'
+
+        leader = asyncio.create_task(cache.get_or_compute('key', slow))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute('key', fast))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        self.assertEqual(await asyncio.wait_for(waiter, 1), 'waiter')
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(calls, ['leader', 'waiter'])
+        self.assertEqual(await cache.get_or_compute('key', slow), 'waiter')
+
+    async def test_waiter_shares_leader_result(self):
+        cache = ResultCache(ttl_seconds=60)
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return 42
+
+        tasks = [asyncio.create_task(cache.get_or_compute('key', compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [42, 42, 42])
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
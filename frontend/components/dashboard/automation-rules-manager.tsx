@@ -73,7 +73,8 @@ const CONDITION_FIELDS = [
   { value: 'rating', label: 'Rating' },
   { value: 'category', label: 'Category' },
   { value: 'created_at', label: 'Submission Date' },
-  { value: 'text_length', label: 'Text Length' }
+  { value: 'text_length', label: 'Text Length' },
+  { value: 'sentiment', label: 'Sentiment (-1 to 1)' }
 ];
 
 const CONDITION_OPERATORS = [
@@ -60,6 +60,84 @@ const ALLOWED_PHOTO_TYPES = ['image/jpeg', 'image/png', 'image/webp']
 const ALLOWED_VIDEO_EXTENSIONS = ['.mp4', '.mov', '.webm', '.avi']
 const ALLOWED_PHOTO_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
 
+const RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024 // Videos above 8MB are uploaded in resumable chunks
+const RESUMABLE_CHUNK_SIZE = 4 * 1024 * 1024
+const RESUMABLE_MAX_RETRIES = 5
+
+// Uploads a file in chunks through the resumable upload API and returns its storage path,
+// or null if it could not be completed. After a failed chunk only the missing bytes are resent.
+async function uploadResumable(backendUrl: string, userId: string, file: File, mediaType: 'video' | 'photo'): Promise<string | null> {
+  try {
+    const createForm = new FormData()
+    createForm.append('user_id', userId)
+    createForm.append('media_type', mediaType)
+    createForm.append('filename', file.name)
+    createForm.append('length', file.size.toString())
+    if (file.type) createForm.append('content_type', file.type)
+    const createResponse = await fetch(`${backendUrl}/uploads/resumable`, { method: 'POST', body: createForm })
+    if (!createResponse.ok) return null
+    const { upload_url: uploadUrl } = await createResponse.json()
+
+    let offset = 0
+    let retries = 0
+    while (offset < file.size) {
+      try {
+        const chunkResponse = await fetch(`${backendUrl}${uploadUrl}`, {
+          method: 'PATCH',
+          headers: { 'Upload-Offset': offset.toString(), 'Content-Type': 'application/offset+octet-stream' },
+          body: file.slice(offset, offset + RESUMABLE_CHUNK_SIZE),
+        })
+        if (!chunkResponse.ok && chunkResponse.status !== 409) return null
+        if (chunkResponse.ok) {
+          offset = parseInt(chunkResponse.headers.get('Upload-Offset') || '0', 10)
+          retries = 0
+          continue
+        }
+      } catch (error) {
+        if (++retries > RESUMABLE_MAX_RETRIES) return null
+        await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** retries))
+      }
+      // Ask the server how much arrived and resume from there
+      const headResponse = await fetch(`${backendUrl}${uploadUrl}`, { method: 'HEAD' })
+      if (!headResponse.ok) return null
+      offset = parseInt(headResponse.headers.get('Upload-Offset') || '0', 10)
+    }
+
+    const finalizeForm = new FormData()
+    finalizeForm.append('user_id', userId)
+    const finalizeResponse = await fetch(`${backendUrl}${uploadUrl}/finalize`, { method: 'POST', body: finalizeForm })
+    if (!finalizeResponse.ok) return null
+    const { path } = await finalizeResponse.json()
+    return path
+  } catch (error) {
+    console.warn(`Resumable ${mediaType} upload failed:`, error)
+    return null
+  }
+}
+
+// Uploads a file straight to storage through a signed URL and returns its storage path,
+// or null if direct upload is unavailable (the file is then sent with the form instead)
+async function uploadDirect(backendUrl: string, userId: string, file: File, mediaType: 'video' | 'photo'): Promise<string | null> {
+  try {
+    const signForm = new FormData()
+    signForm.append('user_id', userId)
+    signForm.append('media_type', mediaType)
+    signForm.append('filename', file.name)
+    const signResponse = await fetch(`${backendUrl}/uploads/signed-url`, { method: 'POST', body: signForm })
+    if (!signResponse.ok) return null
+    const { signed_url: signedUrl, path } = await signResponse.json()
+
+    const uploadForm = new FormData()
+    uploadForm.append('cacheControl', '3600')
+    uploadForm.append('', file)
+    const uploadResponse = await fetch(signedUrl, { method: 'PUT', body: uploadForm })
+    return uploadResponse.ok ? path : null
+  } catch (error) {
+    console.warn(`Direct ${mediaType} upload failed, sending it with the form instead:`, error)
+    return null
+  }
+}
+
 // Categories for testimonials
 const TESTIMONIAL_CATEGORIES = [
   { id: 'general', label: 'General Experience', icon: '💬' },
@@ -320,10 +398,24 @@ export function MultiStepCollectionForm({ userId }: MultiStepCollectionFormProps
       if (data.email) formData.append('email', data.email.trim())
       if (data.company) formData.append('company', data.company.trim())
       formData.append('allow_contact', data.allowContact.toString())
-      if (data.video) formData.append('video', data.video)
-      if (data.photo) formData.append('photo', data.photo)
 
       const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'
+
+      // Upload media straight to storage in parallel, so only the storage paths go through the API
+      const [videoPath, photoPath] = await Promise.all([
+        data.video
+          ? (data.video.size > RESUMABLE_UPLOAD_THRESHOLD
+              ? uploadResumable(backendUrl, userId, data.video, 'video')
+              : Promise.resolve(null)
+            ).then((path) => path || uploadDirect(backendUrl, userId, data.video!, 'video'))
+          : Promise.resolve(null),
+        data.photo ? uploadDirect(backendUrl, userId, data.photo, 'photo') : Promise.resolve(null),
+      ])
+      if (videoPath) formData.append('video_path', videoPath)
+      else if (data.video) formData.append('video', data.video)
+      if (photoPath) formData.append('photo_path', photoPath)
+      else if (data.photo) formData.append('photo', data.photo)
+
       const response = await fetch(`${backendUrl}/submit-testimonial`, {
         method: 'POST',
         body: formData,
@@ -28,9 +28,15 @@
     showSocialSharing: false,
     showCallToAction: false,
     callToActionText: 'Leave a Review',
-    callToActionUrl: '#'
+    callToActionUrl: '#',
+    // Play HLS (adaptive bitrate) versions of videos when available
+    adaptiveStreaming: true,
+    hlsScriptUrl: 'https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js'
   };
 
+  // hls.js is loaded once per page, and only when a browser without native HLS needs it
+  let hlsScriptPromise = null;
+
   // CSS Styles for the widget
   const WIDGET_STYLES = `
     .testimonial-widget {
@@ -368,6 +374,15 @@
       margin-top: 1rem;
     }
     
+    .testimonial-photo {
+      width: 2rem;
+      height: 2rem;
+      border-radius: 50%;
+      object-fit: cover;
+      vertical-align: middle;
+      margin-right: 0.5rem;
+    }
+    
     .testimonial-video-icon {
       display: inline-flex;
       align-items: center;
@@ -450,6 +465,7 @@
       this.currentSlide = 0;
       this.rotationTimer = null;
       this.isPaused = false;
+      this.hlsPlayers = [];
       
       this.init();
     }
@@ -541,7 +557,9 @@
         html = this.renderCarousel();
       }
 
+      this.destroyHlsPlayers();
       this.container.innerHTML = html;
+      this.initAdaptiveVideos();
       
       if (this.config.animation === 'fade') {
         this.container.classList.add('testimonial-widget-fade-in');
@@ -558,9 +576,10 @@
         <div class="testimonial-card">
           <div class="testimonial-content">
             <p class="testimonial-text">${this.escapeHtml(testimonial.text)}</p>
-            ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial.video_url) : ''}
+            ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial) : ''}
             <div class="testimonial-author">
               <h4 class="testimonial-name">
+                ${this.config.showPhotos && testimonial.photo_variants ? this.renderPhoto(testimonial) : ''}
                 ${this.escapeHtml(testimonial.name)}
                 ${testimonial.video_url ? '<span class="testimonial-video-icon"></span>' : ''}
               </h4>
@@ -578,9 +597,10 @@
         <div class="testimonial-list-item">
           <div class="testimonial-content">
             <p class="testimonial-text">${this.escapeHtml(testimonial.text)}</p>
-            ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial.video_url) : ''}
+            ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial) : ''}
             <div class="testimonial-author">
               <h4 class="testimonial-name">
+                ${this.config.showPhotos && testimonial.photo_variants ? this.renderPhoto(testimonial) : ''}
                 ${this.escapeHtml(testimonial.name)}
                 ${testimonial.video_url ? '<span class="testimonial-video-icon"></span>' : ''}
               </h4>
@@ -600,9 +620,10 @@
           <div class="testimonial-card">
             <div class="testimonial-content">
               <p class="testimonial-text">${this.escapeHtml(testimonial.text)}</p>
-              ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial.video_url) : ''}
+              ${this.config.showVideos && testimonial.video_url ? this.renderVideo(testimonial) : ''}
               <div class="testimonial-author">
                 <h4 class="testimonial-name">
+                  ${this.config.showPhotos && testimonial.photo_variants ? this.renderPhoto(testimonial) : ''}
                   ${this.escapeHtml(testimonial.name)}
                   ${testimonial.video_url ? '<span class="testimonial-video-icon"></span>' : ''}
                 </h4>
@@ -672,15 +693,77 @@
       `;
     }
 
-    renderVideo(videoUrl) {
+    renderPhoto(testimonial) {
+      // Only the generated WebP variants are shown; originals are too large for an avatar
+      const variants = testimonial.photo_variants;
+      const widths = Object.keys(variants).map(Number).sort((a, b) => a - b);
+      if (widths.length === 0) return '';
+      const srcset = widths.map(width => `${this.escapeHtml(variants[width])} ${width}w`).join(', ');
+      return `<img class="testimonial-photo" src="${this.escapeHtml(variants[widths[0]])}" srcset="${srcset}" sizes="2rem" alt="" loading="lazy">`;
+    }
+
+    renderVideo(testimonial) {
+      // With a poster frame, none of the video is downloaded until it is played
+      const poster = testimonial.video_poster_url;
+      const hlsSrc = this.config.adaptiveStreaming ? testimonial.video_hls_url : null;
       return `
-        <video class="testimonial-video" controls preload="metadata">
-          <source src="${this.escapeHtml(videoUrl)}" type="video/mp4">
+        <video class="testimonial-video" controls preload="${poster ? 'none' : 'metadata'}"${poster ? ` poster="${this.escapeHtml(poster)}"` : ''}${hlsSrc ? ` data-hls-src="${this.escapeHtml(hlsSrc)}"` : ''}>
+          <source src="${this.escapeHtml(testimonial.video_url)}" type="video/mp4">
           Your browser does not support the video tag.
         </video>
       `;
     }
 
+    // Switches videos with an HLS version to adaptive streaming; the MP4 source stays as fallback
+    initAdaptiveVideos() {
+      const videos = this.container.querySelectorAll('video[data-hls-src]');
+      if (videos.length === 0) return;
+
+      // Safari and iOS play HLS natively
+      if (videos[0].canPlayType('application/vnd.apple.mpegurl')) {
+        videos.forEach(video => { video.src = video.dataset.hlsSrc; });
+        return;
+      }
+
+      this.loadHlsScript().then(Hls => {
+        if (!Hls || !Hls.isSupported()) return;
+        videos.forEach(video => {
+          if (!video.isConnected) return;
+          // Only the playlist is fetched up front; segments load once the video is played
+          const hls = new Hls({ autoStartLoad: false });
+          hls.loadSource(video.dataset.hlsSrc);
+          hls.attachMedia(video);
+          video.addEventListener('play', () => hls.startLoad(), { once: true });
+          this.hlsPlayers.push(hls);
+        });
+      }).catch(() => {
+        // Keep playing the progressive MP4
+      });
+    }
+
+    loadHlsScript() {
+      if (window.Hls) return Promise.resolve(window.Hls);
+      if (!hlsScriptPromise) {
+        hlsScriptPromise = new Promise((resolve, reject) => {
+          const script = document.createElement('script');
+          script.src = this.config.hlsScriptUrl;
+          script.async = true;
+          script.onload = () => resolve(window.Hls);
+          script.onerror = () => {
+            hlsScriptPromise = null;
+            reject(new Error('Failed to load hls.js'));
+          };
+          document.head.appendChild(script);
+        });
+      }
+      return hlsScriptPromise;
+    }
+
+    destroyHlsPlayers() {
+      this.hlsPlayers.forEach(hls => hls.destroy());
+      this.hlsPlayers = [];
+    }
+
     formatDate(dateString) {
       try {
         const date = new Date(dateString);
@@ -721,6 +804,7 @@
     destroy() {
       this.stopAutoRefresh();
       this.stopAutoRotation();
+      this.destroyHlsPlayers();
       if (this.container) {
         this.container.innerHTML = '';
         this.container.className = '';
@@ -849,7 +933,8 @@
           showSocialSharing: element.dataset.showSocialSharing === 'true',
           showCallToAction: element.dataset.showCallToAction === 'true',
           callToActionText: element.dataset.callToActionText || 'Leave a Review',
-          callToActionUrl: element.dataset.callToActionUrl || '#'
+          callToActionUrl: element.dataset.callToActionUrl || '#',
+          adaptiveStreaming: element.dataset.adaptiveStreaming !== 'false'
         };
 
         new TestimonialWidget(config);